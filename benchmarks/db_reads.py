@@ -0,0 +1,218 @@
+"""
+Compares reading a user as a umongo document and as a projected raw record.
+
+Both paths are the production ones, db_worker.get_user and
+db_worker.get_user_fields(chat_id, "locale"). "decode" runs them against
+a collection kept in memory, which answers with BSON decoded the way the driver
+does and applies the projection the way MongoDB does, so everything but the network
+is measured and no database is needed. "mongo" also goes to MongoDB from
+the environment: users are inserted into a database of the benchmark, read back
+by both paths, and the database is dropped. It refuses to run if the database
+is not empty.
+
+Usage: python -m benchmarks.db_reads --calls 2000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from benchmarks.dispatcher import (
+    FIRST_CHAT_ID,
+    RESULTS_DIR,
+    check_databases_empty,
+    clean_databases,
+    git_revision,
+    percentile,
+    previous_result,
+    use_benchmark_env,
+)
+
+
+def _document(chat_id: int) -> dict:
+    return {
+        "chat_id": chat_id,
+        "first_name": f"User {chat_id}",
+        "username": f"user{chat_id}",
+        "last_name": None,
+        "locale": "en",
+        "rooms": ["101", "102"],
+        "hotel_login": f"login{chat_id}",
+        "hotel_password": "password",
+    }
+
+
+def _stats(timings: List[float]) -> dict:
+    timings.sort()
+    return {
+        "calls": len(timings),
+        "mean_us": round(statistics.mean(timings) * 1e6, 2),
+        "p50_us": round(percentile(timings, 50) * 1e6, 2),
+        "p95_us": round(percentile(timings, 95) * 1e6, 2),
+    }
+
+
+class _MemoryCollection:
+    """
+    Stands for a motor collection: find_one by chat_id with a projection
+    """
+
+    def __init__(self, documents: List[dict]):
+        self._documents = {document["chat_id"]: document for document in documents}
+        self._encoded: Dict[tuple, bytes] = {}
+
+    async def find_one(self, filter=None, projection=None, **kwargs):
+        import bson
+
+        chat_id = filter["chat_id"]
+        key = (chat_id, tuple(sorted((projection or {}).items())))
+        encoded = self._encoded.get(key)
+        if encoded is None:  # what the server sends, encoded once
+            document = self._documents.get(chat_id)
+            if document is None:
+                return None
+            if projection:  # only inclusions are used, _id unless excluded
+                included = {field for field, on in projection.items() if on}
+                if "_id" not in projection:
+                    included.add("_id")
+                document = {
+                    field: value
+                    for field, value in document.items()
+                    if field in included
+                }
+            encoded = self._encoded[key] = bson.BSON.encode(document)
+        return bson.BSON(encoded).decode()
+
+
+@contextmanager
+def _memory_database(documents: List[dict]):
+    from core.database.models.user_model import User, instance
+
+    collection = _MemoryCollection(documents)
+    database = {User.opts.collection_name: collection}
+    # instance.init accepts only a motor database, so it is swapped directly
+    previous, instance._db = getattr(instance, "_db", None), database
+    try:
+        yield
+    finally:
+        instance._db = previous
+
+
+def decode(calls: int, users: int) -> Dict[str, dict]:
+    from bson import ObjectId
+
+    from core.database import db_worker
+
+    chat_ids = [FIRST_CHAT_ID + n for n in range(users)]
+    documents = [dict(_document(chat_id), _id=ObjectId()) for chat_id in chat_ids]
+    paths: Dict[str, Callable] = {
+        "get_user": lambda chat_id: db_worker.get_user(chat_id),
+        "get_user_fields": lambda chat_id: db_worker.get_user_fields(chat_id, "locale"),
+    }
+
+    async def measure():
+        report = {}
+        for name, read in paths.items():
+            user = await read(chat_ids[0])
+            assert getattr(user, "locale", None) or user["locale"]
+            timings = []
+            for n in range(calls):
+                start = time.perf_counter()
+                await read(chat_ids[n % users])
+                timings.append(time.perf_counter() - start)
+            report[name] = _stats(timings)
+        return report
+
+    with _memory_database(documents):
+        return asyncio.get_event_loop().run_until_complete(measure())
+
+
+async def mongo(calls: int, users: int) -> Dict[str, dict]:
+    from core.database import db_worker
+    from core.database.models.user_model import User
+
+    await check_databases_empty(redis=False)
+    chat_ids = [FIRST_CHAT_ID + n for n in range(users)]
+    await User.collection.insert_many([_document(chat_id) for chat_id in chat_ids])
+    paths = {
+        "get_user": lambda chat_id: db_worker.get_user(chat_id),
+        "get_user_fields": lambda chat_id: db_worker.get_user_fields(chat_id, "locale"),
+    }
+    report = {}
+    try:
+        for name, read in paths.items():
+            await read(chat_ids[0])  # warm up the pool
+            timings = []
+            for n in range(calls):
+                start = time.perf_counter()
+                await read(chat_ids[n % users])
+                timings.append(time.perf_counter() - start)
+            report[name] = _stats(timings)
+    finally:
+        await clean_databases(redis=False)
+    return report
+
+
+def print_report(report: dict, previous: dict):
+    print(f"{'path':<18}{'calls':>8}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}")
+    for section, paths in report.items():
+        print(section)
+        for name, stats in paths.items():
+            line = (
+                f"  {name:<16}{stats['calls']:>8}{stats['mean_us']:>10}"
+                f"{stats['p50_us']:>10}{stats['p95_us']:>10}"
+            )
+            old = previous.get("report", {}).get(section, {}).get(name)
+            if old and old["mean_us"]:
+                change = (stats["mean_us"] - old["mean_us"]) / old["mean_us"] * 100
+                line += f"  mean {change:+.0f}%"
+            print(line)
+        baseline, lean = (stats["mean_us"] for stats in paths.values())
+        print(f"  saved per call: {baseline - lean:.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--decode-only", action="store_true", help="Skip the part which needs MongoDB"
+    )
+    parser.add_argument("--name", default="db_reads", help="Name of the result file")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    use_benchmark_env()
+
+    report = {"decode": decode(args.calls, args.users)}
+    if not args.decode_only:
+        report["mongo"] = asyncio.get_event_loop().run_until_complete(
+            mongo(args.calls, args.users)
+        )
+    previous = previous_result(args.name)
+    print_report(report, previous)
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        now = datetime.datetime.now()
+        path = RESULTS_DIR / f"{args.name}-{now:%Y%m%d-%H%M%S}.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "revision": git_revision(),
+                    "date": now.isoformat(timespec="seconds"),
+                    "params": vars(args),
+                    "report": report,
+                },
+                indent=2,
+            )
+        )
+        print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Replays synthetic user sessions through the dispatcher of the bot.
+
+Every virtual user goes through /start, /help, /schedule, /on with the time picker
+and /off. Updates pass the same middleware chain as in production, Bot API calls
+go to FakeTelegramServer. Mongo and Redis are the servers from the environment,
+but the run always uses databases of its own (see BENCHMARK_ENV): it refuses
+to start if they are not empty and empties them when it is over.
+
+Usage: python -m benchmarks.dispatcher --users 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+RESULTS_DIR = Path(__file__).parent / "results"
+FIRST_CHAT_ID = 10 ** 12  # far from real telegram ids
+# always set, whatever the environment says: a run uses databases of its own
+# and empties them afterwards, so it never touches real users
+BENCHMARK_ENV = {
+    "DB_NAME": "hoteluni_bot_benchmark",
+    "REDIS_JOBSTORE_DB": "11",
+    "REDIS_REMINDERS_DB": "12",
+    "REDIS_FSM_DB": "13",
+    "BOT_TOKEN": "123456:benchmark",
+    "METRICS_ENABLED": "0",
+    "LOG_STDOUT_LEVEL": "ERROR",
+    "PORTAL_URL": "",
+}
+
+_message_ids = itertools.count(1)
+_update_ids = itertools.count(1)
+
+
+def _user(chat_id: int) -> dict:
+    return {
+        "id": chat_id,
+        "is_bot": False,
+        "first_name": f"User {chat_id}",
+        "username": f"user{chat_id}",
+        "language_code": "en",
+    }
+
+
+def _chat(chat_id: int) -> dict:
+    return {"id": chat_id, "type": "private"}
+
+
+def message(chat_id: int, text: str) -> dict:
+    entities = []
+    if text.startswith("/"):
+        entities.append({"type": "bot_command", "offset": 0, "length": len(text)})
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": _user(chat_id),
+            "text": text,
+            "entities": entities,
+        },
+    }
+
+
+def callback_query(chat_id: int, data: str) -> dict:
+    from core.utils.fake_telegram import BOT_USER
+
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_message_ids)),
+            "chat_instance": str(chat_id),
+            "from": _user(chat_id),
+            "data": data,
+            "message": {
+                "message_id": next(_message_ids),
+                "date": int(time.time()),
+                "chat": _chat(chat_id),
+                "from": BOT_USER,
+                "text": "",
+            },
+        },
+    }
+
+
+def flows(chat_id: int) -> Dict[str, List[dict]]:
+    """
+    Updates of every flow of one user, flows go in this order
+    """
+    from core.reply_markups import callbacks
+    from core.reply_markups.timepicker import get_timepicker_kb, handle_timepicker
+
+    inc_hour = get_timepicker_kb().inline_keyboard[0][0].callback_data
+    _, picker = handle_timepicker(callbacks.timepicker.parse(inc_hour))
+    confirm = picker.inline_keyboard[-1][0].callback_data
+    return {
+        "start": [message(chat_id, "/start")],
+        "help": [message(chat_id, "/help")],
+        "schedule": [message(chat_id, "/schedule")],
+        "on": [
+            message(chat_id, "/on"),
+            callback_query(chat_id, callbacks.set_is_day_before.new(value="0")),
+            callback_query(chat_id, callbacks.choose_campus_number.new(number=1)),
+            callback_query(chat_id, inc_hour),
+            callback_query(chat_id, confirm),
+        ],
+        "off": [
+            message(chat_id, "/off"),
+            callback_query(chat_id, callbacks.choose_campus_number.new(number=1)),
+        ],
+    }
+
+
+def use_benchmark_env():
+    """
+    Must be called before anything from core is imported, configs read the env once
+    """
+    if "core.configs" in sys.modules:
+        raise RuntimeError("Configs are read already, the benchmark env is not applied")
+    os.environ.update(BENCHMARK_ENV)
+
+
+async def _redis_databases():
+    import aioredis
+
+    from core.configs import database
+
+    pools = []
+    for db in (
+        database.REDIS_JOBSTORE_DB,
+        database.REDIS_REMINDERS_DB,
+        database.REDIS_FSM_DB,
+    ):
+        pools.append(
+            await aioredis.create_redis_pool(
+                (database.REDIS_HOST, database.REDIS_PORT),
+                db=db,
+                password=database.REDIS_PASSWORD,
+            )
+        )
+    return pools
+
+
+async def check_databases_empty(redis: bool = True):
+    """
+    Refuses to run on databases which have anything in them,
+    because everything is deleted from them after the run
+    """
+    from core.configs import database
+    from core.database import db_worker
+    from core.database.models.user_model import User
+
+    await db_worker.init()
+    if await User.collection.estimated_document_count():
+        raise SystemExit(f"Mongo database {database.DB_NAME} is not empty")
+    for pool in await _redis_databases() if redis else ():
+        try:
+            if await pool.dbsize():
+                raise SystemExit(f"Redis database {pool.db} is not empty")
+        finally:
+            pool.close()
+            await pool.wait_closed()
+
+
+async def clean_databases(redis: bool = True):
+    """
+    Deletes everything the run has written to mongo and redis
+    """
+    from core.database import db_worker
+
+    await db_worker.init()
+    try:
+        await db_worker.drop_db()
+    finally:
+        await db_worker.close()
+    for pool in await _redis_databases() if redis else ():
+        try:
+            await pool.flushdb()
+        finally:
+            pool.close()
+            await pool.wait_closed()
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of sorted values
+    """
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+async def _process(dp, raw_update: dict):
+    from aiogram import types
+    from aiogram.dispatcher.webhook import BaseResponse
+
+    for responses in await dp.updates_handler.notify(types.Update(**raw_update)):
+        for response in responses or []:
+            if isinstance(response, BaseResponse):
+                await response.execute_response(dp.bot)
+
+
+async def process(dp, raw_update: dict) -> float:
+    """
+    Processes update the way polling does, including replies returned by handlers.
+    Returns processing time in seconds
+    """
+    start = time.perf_counter()
+    # aiogram keeps per-update state in context variables,
+    # so every update needs its own task like in polling and webhook mode
+    await asyncio.ensure_future(_process(dp, raw_update))
+    return time.perf_counter() - start
+
+
+async def run(
+    users: int,
+    concurrency: int,
+    api_port: int,
+    latency: float,
+    chat_rate: float,
+    global_rate: float,
+) -> dict:
+    from aiogram import Bot, Dispatcher
+
+    from core.utils.fake_telegram import FakeTelegramServer
+
+    await check_databases_empty()
+    server = FakeTelegramServer(port=api_port, latency=latency)
+    await server.start()
+
+    from core import handlers
+    from core.app import create_app
+    from core.utils import log_pipeline
+
+    log_folder = tempfile.TemporaryDirectory(prefix="benchmark-logs-")
+    log_pipeline.setup(Path(log_folder.name))  # not into logs/ of the repo
+    app = create_app(api_server=server.url)
+    Bot.set_current(handlers.bot)
+    Dispatcher.set_current(handlers.dp)
+    await app.startup()
+    # synthetic users tap much faster than people and the fake API has no limits,
+    # so by default the outbound queue does not hold messages back
+    from core.utils.rate_limit import TokenBucket
+
+    handlers.bot.outbound.chat_rate = handlers.bot.outbound.chat_burst = chat_rate
+    handlers.bot.outbound.global_bucket = TokenBucket(global_rate)
+
+    update_latencies: Dict[str, List[float]] = {}
+    flow_latencies: Dict[str, List[float]] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def session(chat_id: int):
+        async with semaphore:
+            for flow, updates in flows(chat_id).items():
+                flow_start = time.perf_counter()
+                for raw_update in updates:
+                    update_latencies.setdefault(flow, []).append(
+                        await process(handlers.dp, raw_update)
+                    )
+                flow_latencies.setdefault(flow, []).append(
+                    time.perf_counter() - flow_start
+                )
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*[session(FIRST_CHAT_ID + n) for n in range(users)])
+        elapsed = time.perf_counter() - started
+    finally:
+        await app.shutdown()  # the job store writes out its jobs here
+        await clean_databases()
+        await handlers.bot.close()
+        await server.close()
+        log_pipeline.close()
+        log_folder.cleanup()
+
+    total_updates = sum(len(values) for values in update_latencies.values())
+    report = {
+        "updates": total_updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(total_updates / elapsed, 1),
+        "api_requests": len(server.requests),
+        "flows": {},
+    }
+    for flow, values in update_latencies.items():
+        values.sort()
+        flow_values = sorted(flow_latencies[flow])
+        report["flows"][flow] = {
+            "updates": len(values),
+            **{
+                f"p{p}_ms": round(percentile(values, p) * 1000, 2) for p in (50, 95, 99)
+            },
+            "flow_p95_ms": round(percentile(flow_values, 95) * 1000, 2),
+        }
+    return report
+
+
+def git_revision() -> str:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def previous_result(name: str) -> dict:
+    results = sorted(RESULTS_DIR.glob(f"{name}-*.json"))
+    if not results:
+        return {}
+    return json.loads(results[-1].read_text())
+
+
+def print_report(report: dict, previous: dict):
+    print(
+        f"{report['updates']} updates in {report['seconds']}s, "
+        f"{report['updates_per_second']} updates/s"
+    )
+    if previous:
+        print(
+            f"previous run ({previous['revision']}): "
+            f"{previous['report']['updates_per_second']} updates/s"
+        )
+
+    print(f"{'flow':<10}{'updates':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for flow, stats in report["flows"].items():
+        line = (
+            f"{flow:<10}{stats['updates']:>9}{stats['p50_ms']:>10}"
+            f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+        old = previous.get("report", {}).get("flows", {}).get(flow)
+        if old and old["p95_ms"]:
+            change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+            line += f"  p95 {change:+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument(
+        "--chat-rate", type=float, default=1000, help="Messages per second to a chat"
+    )
+    parser.add_argument(
+        "--global-rate", type=float, default=10000, help="Messages per second in total"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Bot API latency in seconds"
+    )
+    parser.add_argument("--name", default="dispatcher", help="Name of the result file")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    use_benchmark_env()
+
+    report = asyncio.get_event_loop().run_until_complete(
+        run(
+            args.users,
+            args.concurrency,
+            args.api_port,
+            args.latency,
+            args.chat_rate,
+            args.global_rate,
+        )
+    )
+    previous = previous_result(args.name)
+    print_report(report, previous)
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        now = datetime.datetime.now()
+        path = RESULTS_DIR / f"{args.name}-{now:%Y%m%d-%H%M%S}.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "revision": git_revision(),
+                    "date": now.isoformat(timespec="seconds"),
+                    "params": vars(args),
+                    "report": report,
+                },
+                indent=2,
+            )
+        )
+        print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Compares choosing a handler by scanning filters and by the routing index.
+
+Only handler selection is measured: filters of handlers are checked in order
+until one passes, the handler itself is not called. The scan is what aiogram does
+by itself, "indexed" checks only the candidates of core.utils.routing.
+User states are kept in memory, so neither Mongo nor Redis is needed.
+
+Usage: python -m benchmarks.routing --calls 20000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.dispatcher import (
+    FIRST_CHAT_ID,
+    RESULTS_DIR,
+    callback_query,
+    git_revision,
+    message,
+    percentile,
+    previous_result,
+    use_benchmark_env,
+)
+
+
+def samples() -> Dict[str, Tuple[dict, str]]:
+    """
+    Update and the state of its user for every case
+    """
+    from core.reply_markups import callbacks
+    from core.reply_markups.timepicker import get_timepicker_kb
+    from core.utils.states import SetCleaningReminderStates
+
+    chat_id = FIRST_CHAT_ID
+    return {
+        "start": (message(chat_id, "/start"), None),
+        "schedule": (message(chat_id, "/schedule"), None),
+        "off": (message(chat_id, "/off"), None),
+        "cancel_text": (
+            message(chat_id, "Cancel"),
+            SetCleaningReminderStates.enter_time.state,
+        ),
+        "plain_text": (message(chat_id, "hello"), None),
+        "campus_callback": (
+            callback_query(chat_id, callbacks.choose_campus_number.new(number=1)),
+            SetCleaningReminderStates.enter_campus_number.state,
+        ),
+        "time_callback": (
+            callback_query(
+                chat_id, get_timepicker_kb().inline_keyboard[0][0].callback_data
+            ),
+            SetCleaningReminderStates.enter_time.state,
+        ),
+    }
+
+
+async def _first_match(handler_objs, args) -> float:
+    """
+    Runs in a task of its own, so the state cached by StateFilter is not reused
+    """
+    from aiogram.dispatcher.filters import FilterNotPassed, check_filters
+
+    start = time.perf_counter()
+    async for handler_obj in handler_objs():
+        try:
+            await check_filters(handler_obj.filters, args)
+        except FilterNotPassed:
+            continue
+        break
+    return time.perf_counter() - start
+
+
+async def measure(calls: int) -> Dict[str, Dict[str, dict]]:
+    from aiogram import Bot, Dispatcher, types
+    from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+    from core import handlers
+    from core.utils.routing import IndexedHandler
+
+    Bot.set_current(handlers.bot)
+    Dispatcher.set_current(handlers.dp)
+    handlers.dp.storage = MemoryStorage()
+
+    report = {}
+    for case, (raw_update, state) in samples().items():
+        update = types.Update(**raw_update)
+        obj = update.message or update.callback_query
+        handler = (
+            handlers.dp.message_handlers
+            if update.message
+            else handlers.dp.callback_query_handlers
+        )
+        indexed = IndexedHandler.from_handler(handler)
+        types.User.set_current(obj.from_user)  # as Dispatcher.process_update does
+        types.Chat.set_current((update.message or update.callback_query.message).chat)
+        await handlers.dp.storage.set_state(
+            chat=FIRST_CHAT_ID, user=FIRST_CHAT_ID, state=state
+        )
+
+        async def scan():
+            for handler_obj in handler.handlers:
+                yield handler_obj
+
+        paths = {"scan": scan, "indexed": lambda: indexed.candidates(obj)}
+        report[case] = {}
+        for name, handler_objs in paths.items():
+            await asyncio.ensure_future(_first_match(handler_objs, (obj,)))  # warm up
+            timings = []
+            for _ in range(calls):
+                timings.append(
+                    await asyncio.ensure_future(_first_match(handler_objs, (obj,)))
+                )
+            report[case][name] = _stats(timings)
+    await handlers.dp.storage.close()
+    return report
+
+
+def _stats(timings: List[float]) -> dict:
+    timings.sort()
+    return {
+        "calls": len(timings),
+        "mean_us": round(statistics.mean(timings) * 1e6, 2),
+        "p50_us": round(percentile(timings, 50) * 1e6, 2),
+        "p95_us": round(percentile(timings, 95) * 1e6, 2),
+    }
+
+
+def print_report(report: dict, previous: dict):
+    print(f"{'case':<18}{'path':<10}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}")
+    for case, paths in report.items():
+        for name, stats in paths.items():
+            line = (
+                f"{case:<18}{name:<10}{stats['mean_us']:>10}"
+                f"{stats['p50_us']:>10}{stats['p95_us']:>10}"
+            )
+            old = previous.get("report", {}).get(case, {}).get(name)
+            if old and old["mean_us"]:
+                change = (stats["mean_us"] - old["mean_us"]) / old["mean_us"] * 100
+                line += f"  mean {change:+.0f}%"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--name", default="routing", help="Name of the result file")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    use_benchmark_env()
+
+    report = asyncio.get_event_loop().run_until_complete(measure(args.calls))
+    previous = previous_result(args.name)
+    print_report(report, previous)
+
+    if not args.no_save:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        now = datetime.datetime.now()
+        path = RESULTS_DIR / f"{args.name}-{now:%Y%m%d-%H%M%S}.json"
+        path.write_text(
+            json.dumps(
+                {
+                    "revision": git_revision(),
+                    "date": now.isoformat(timespec="seconds"),
+                    "params": vars(args),
+                    "report": report,
+                },
+                indent=2,
+            )
+        )
+        print(f"Saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import core.handlers
+from core.app import main
 
 if __name__ == "__main__":
-    core.handlers.main()
+    main()
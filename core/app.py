@@ -0,0 +1,278 @@
+"""
+Application factory.
+
+Importing core.handlers only registers handlers, nothing connects to mongo,
+redis or telegram. `create_app` collects the components of the bot and
+`Application.startup` starts them concurrently, every component waits only
+for the ones it depends on. Warm-up time of every component is logged and
+exported, readiness is served next to the metrics
+"""
+import asyncio
+import ssl
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Dispatcher, executor, types
+from aiogram.bot import api
+from loguru import logger
+
+from core.configs import metrics as metrics_config
+from core.configs import telegram, webhook
+from core.utils import log_pipeline, metrics, routing
+
+Hook = Callable[[], Awaitable]
+
+
+class Component:
+    def __init__(
+        self,
+        name: str,
+        start: Optional[Hook] = None,
+        stop: Optional[Hook] = None,
+        depends: Iterable[str] = (),
+    ):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.depends = tuple(depends)
+
+
+class Application:
+    def __init__(self, dp: Dispatcher, components: List[Component]):
+        self.dp = dp
+        self.components = components
+        self.state = "created"
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def readiness(self) -> Tuple[bool, dict]:
+        return (
+            self.is_ready,
+            {
+                "state": self.state,
+                "components": {
+                    component.name: {
+                        "ready": component.name in self.timings
+                        and component.name not in self.errors,
+                        "seconds": self.timings.get(component.name),
+                        "error": self.errors.get(component.name),
+                    }
+                    for component in self.components
+                },
+            },
+        )
+
+    async def _start(self, component: Component):
+        for name in component.depends:
+            await self._tasks[name]  # raises if the dependency has failed
+
+        started_at = time.perf_counter()
+        try:
+            if component.start is not None:
+                await component.start()
+        except Exception as e:
+            self.errors[component.name] = repr(e)
+            raise
+        finally:
+            self.timings[component.name] = time.perf_counter() - started_at
+        metrics.component_warmup.set(self.timings[component.name], component.name)
+        logger.info(
+            f"{component.name} is started in {self.timings[component.name] * 1000:.0f} ms"
+        )
+
+    async def startup(self):
+        self.state = "starting"
+        started_at = time.perf_counter()
+        self._tasks = {
+            component.name: asyncio.ensure_future(self._start(component))
+            for component in self.components
+        }
+        results = await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+        failed = [
+            (name, result)
+            for name, result in zip(self._tasks, results)
+            if isinstance(result, BaseException)
+        ]
+        if failed:
+            self.state = "failed"
+            for name, error in failed:
+                logger.opt(exception=error).error(f"{name} has failed to start")
+            raise failed[0][1]
+
+        self.state = "ready"
+        metrics.ready.set(1)
+        logger.info(
+            f"Bot is ready in {(time.perf_counter() - started_at) * 1000:.0f} ms"
+        )
+
+    def _stop_order(self) -> List[Component]:
+        """
+        Every component goes before the ones it depends on,
+        otherwise the reverse of the order they are listed in
+        """
+        by_name = {component.name: component for component in self.components}
+        ordered, seen = [], set()
+
+        def visit(component: Component):
+            if component.name in seen:
+                return
+            seen.add(component.name)
+            for name in component.depends:
+                if name in by_name:
+                    visit(by_name[name])
+            ordered.append(component)
+
+        for component in self.components:
+            visit(component)
+        return ordered[::-1]
+
+    async def shutdown(self):
+        self.state = "stopping"
+        metrics.ready.set(0)
+        for component in self._stop_order():
+            task = self._tasks.get(component.name)
+            if component.stop is None or task is None or not task.done():
+                continue
+            if task.cancelled() or task.exception() is not None:
+                continue
+            try:
+                await component.stop()
+            except Exception:
+                logger.exception(f"{component.name} has failed to stop")
+        self.state = "stopped"
+
+    async def on_startup(self, dp: Dispatcher):
+        await self.startup()
+
+    async def on_shutdown(self, dp: Dispatcher):
+        await self.shutdown()
+
+
+def create_app(api_server: str = telegram.API_SERVER) -> Application:
+    if api_server:  # local imitation of Bot API
+        api.API_URL = api_server.rstrip("/") + "/bot{token}/{method}"
+
+    from core import handlers
+    from core.database import db_worker
+    from core.database import redis_worker as reminders
+    from core.database.profile_sync import profile_sync
+    from core.strings.scripts import i18n, responses
+
+    bot, scheduler, jobstore = handlers.bot, handlers.scheduler, handlers.jobstore
+
+    async def start_i18n():
+        responses.build()
+
+    async def stop_i18n():
+        logger.info(f"Locale cache stats: {i18n.cache.stats()}")
+
+    async def start_redis():
+        await reminders.get_redis()
+        await reminders.rebuild_subscriptions_index()
+
+    async def start_stats():
+        await reminders.rebuild_stats(await db_worker.count_users())
+
+    async def start_scheduler():
+        scheduler.start()
+        await jobstore.load()
+        handlers.stagger_overdue_jobs()  # before the scheduler runs them
+
+    async def stop_scheduler():
+        scheduler.shutdown(wait=False)
+        await jobstore.close()
+
+    async def start_telegram():
+        api.check_token(telegram.BOT_TOKEN)
+        await bot.get_me()
+        bot.outbound.start()
+
+    async def set_webhook():
+        certificate = None
+        if webhook.WEBHOOK_SSL_CERT_PATH:  # self-signed certificate has to be uploaded
+            certificate = types.InputFile(webhook.WEBHOOK_SSL_CERT_PATH)
+        await bot.set_webhook(webhook.WEBHOOK_URL, certificate=certificate)
+
+    components = [
+        Component("i18n", start_i18n, stop_i18n),
+        Component("mongo", db_worker.init, db_worker.close),
+        Component("redis", start_redis, reminders.close),
+        # its last flush counts new users in redis
+        Component("profile_sync", stop=profile_sync.close, depends=["mongo", "redis"]),
+        Component("scheduler", start_scheduler, stop_scheduler),
+        Component("telegram", start_telegram, bot.outbound.close),
+        Component(
+            "reminders_migration",
+            handlers.migrate_personal_reminders,
+            depends=["scheduler", "redis"],
+        ),
+        Component(
+            "cohort_jobs", handlers.sync_cohort_jobs, depends=["reminders_migration"],
+        ),
+        # the rebuild replaces the counters, so nothing may subscribe meanwhile
+        Component(
+            "stats", start_stats, depends=["mongo", "redis", "reminders_migration"]
+        ),
+        Component(
+            "broadcast",
+            handlers.broadcast.resume,
+            depends=["mongo", "redis", "telegram", "i18n"],
+        ),
+    ]
+    if metrics_config.METRICS_ENABLED:
+        components.insert(0, Component("metrics", metrics.serve, metrics.close))
+    if handlers.portal.enabled:
+        components.append(
+            Component("portal", handlers.portal.start, handlers.portal.close)
+        )
+    if webhook.WEBHOOK_ENABLED:
+        components.append(
+            Component("webhook", set_webhook, bot.delete_webhook, depends=["telegram"])
+        )
+
+    handlers.setup_middlewares()
+    routing.install(handlers.dp)  # every handler is registered by now
+    app = Application(handlers.dp, components)
+    metrics.readiness_probe = app.readiness
+    return app
+
+
+def start_webhook(app: Application):
+    ssl_context = None
+    if webhook.WEBHOOK_SSL_CERT_PATH and webhook.WEBHOOK_SSL_PRIV_PATH:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(
+            webhook.WEBHOOK_SSL_CERT_PATH, webhook.WEBHOOK_SSL_PRIV_PATH
+        )
+
+    executor.start_webhook(
+        app.dp,
+        webhook_path=webhook.WEBHOOK_PATH,
+        on_startup=app.on_startup,
+        on_shutdown=app.on_shutdown,
+        host=webhook.WEBHOOK_LISTEN,
+        port=int(webhook.WEBHOOK_PORT),
+        ssl_context=ssl_context,
+    )
+
+
+def main():
+    log_pipeline.setup()
+    logger.info(
+        "Compile .po and .mo before running! Hint: pybabel compile -d locales -D bot"
+    )
+
+    app = create_app()
+    if webhook.WEBHOOK_ENABLED:
+        start_webhook(app)
+    else:
+        executor.start_polling(
+            app.dp, on_startup=app.on_startup, on_shutdown=app.on_shutdown
+        )
+    log_pipeline.close()
@@ -2,7 +2,7 @@
 This file is created for config which is not depends on a particular project
 and you won't need to specify them, but vars from here are used in other configs
 """
-from datetime import date, timedelta
+from datetime import date, time
 from pathlib import Path
 
 import pytz
@@ -17,5 +17,83 @@ base_dates_campus_cleaning = {
     4: [None, date(2019, 4, 22), date(2019, 5, 1), date(2019, 5, 10)],
 }  # campus_number -> some day with cleaning
 cleaning_interval = 28
+cleaning_calendar_horizon = 365  # days of cleanings which are precomputed
 default_timezone = pytz.timezone("Europe/Moscow")
 job_id_format = "cleaning_reminder:{chat_id}:{campus_number}:{index}"
+cohort_job_id_format = "cleaning_cohort:{campus_number}:{time_slot}"
+cohort_subscribers_key_format = "cleaning_cohort:{campus_number}:{time_slot}"
+cohort_slots_key_format = "cleaning_cohort_slots:{campus_number}"
+user_reminders_key_format = "cleaning_reminders:{chat_id}"
+user_reminders_index_built_key = "cleaning_reminders_index_built"
+day_before_suffix = ":day_before"
+time_slot_format = "%H:%M"
+stats_key = "stats:subscriptions"  # counters of subscriptions per campus, hour, day
+stats_time_slots_key = "stats:time_slots"  # sorted set, time slot -> subscriptions
+stats_active_users_key = "stats:active_users"  # users with at least one reminder
+stats_users_key = "stats:users"
+stats_built_key = "stats_built"
+stats_top_time_slots = 5
+
+broadcast_key = "broadcast:campaign"
+broadcast_batch_size = 100
+broadcast_progress_interval = 5  # seconds between progress reports to the admin
+
+backup_batch_size = 1000  # users per cursor batch, bulk_write and redis pipeline
+
+locale_cache_size = 10000
+locale_cache_ttl = 10 * 60  # seconds
+
+profile_sync_flush_interval = 5  # seconds
+profile_sync_max_pending = 500
+profile_sync_cache_size = 50000
+profile_sync_cache_ttl = 60 * 60  # seconds
+
+fsm_ttl = 24 * 60 * 60  # seconds, unfinished dialogs are forgotten after that
+
+# (updates per second, burst) of every user and of single commands or callback prefixes
+throttle_user_limit = (5, 20)
+throttle_limits = {
+    "start": (0.5, 3),
+    "help": (0.5, 3),
+    "schedule": (0.5, 3),
+    "language": (0.5, 3),
+    "on": (0.5, 3),
+    "off": (0.5, 3),
+    "rooms": (0.5, 3),
+    "timepicker": (5, 10),
+}
+throttle_buckets = 10000  # users whose buckets are kept by every process
+throttle_bucket_ttl = 60  # seconds, every bucket is full again by then
+throttle_key_format = "throttle:{key}"
+
+dedup_window_size = 100000  # last update ids remembered by every process
+dedup_key_format = "dedup:update:{update_id}"
+dedup_ttl = 10 * 60  # seconds, an update id is claimed in redis for that long
+
+reminder_default_time = time(12, 0)
+# reminders of a cohort are spread over this many seconds after its time,
+# every user always gets the same offset inside the window
+reminder_spread_window = 5 * 60
+# seconds, users whose offsets fall into one step are sent together
+reminder_wave_step = 10
+reminder_catch_up_step = 30  # seconds between overdue cohorts fired after a restart
+reminder_min_time = time(0, 15)
+reminder_max_time = time(23, 45)
+timepicker_minute_step = 15
+
+outbound_global_rate = 30  # messages per second, global limit of telegram
+outbound_chat_rate = 1  # messages per second to one chat
+outbound_chat_burst = 3
+outbound_chat_buckets = 10000  # chats whose rate is remembered
+outbound_max_in_flight = 30
+outbound_max_retries = 3
+outbound_drain_timeout = 5  # seconds to send what is queued on shutdown
+
+portal_cache_size = 10000  # portal accounts whose rooms are kept
+portal_cache_ttl = 6 * 60 * 60  # seconds, rooms older than that are not shown
+portal_refresh_after = 10 * 60  # seconds, older rooms are shown and refreshed meanwhile
+portal_shown_cleanings = 3  # upcoming cleanings of every room in /rooms
+portal_sessions = 10000  # portal accounts whose cookies are kept
+portal_session_ttl = 30 * 60  # seconds, the bot logs in again after that
+
+responses_check_interval = 5  # seconds between checks of compiled locales for changes
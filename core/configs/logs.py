@@ -0,0 +1,14 @@
+# Here is your logging config: level, rotation and sampling of log files
+import os
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+LOG_STDOUT_LEVEL = os.getenv("LOG_STDOUT_LEVEL", "WARNING")
+LOG_ROTATION_SIZE = int(os.getenv("LOG_ROTATION_SIZE", 50 * 1024 * 1024))  # bytes
+LOG_ROTATION_AGE = int(os.getenv("LOG_ROTATION_AGE", 24 * 60 * 60))  # seconds
+LOG_RETENTION = os.getenv("LOG_RETENTION", "30 days")
+
+# share of high-volume records (e.g. every received message) which is written
+LOG_SAMPLING = {
+    "DEBUG": float(os.getenv("LOG_SAMPLING_DEBUG", 0.1)),
+    "INFO": float(os.getenv("LOG_SAMPLING_INFO", 1.0)),
+}
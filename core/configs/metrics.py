@@ -0,0 +1,8 @@
+# Here is your metrics config: where prometheus scrapes the bot
+import os
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_HOST = os.getenv("METRICS_HOST", "localhost")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9100))
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_READY_PATH = os.getenv("METRICS_READY_PATH", "/ready")
@@ -0,0 +1,8 @@
+# Here is your dormitory portal config: where it is and how hard the bot may use it
+import os
+
+# the portal client is off if it is empty, see core/utils/fake_portal.py for a local one
+PORTAL_URL = os.getenv("PORTAL_URL", "")
+PORTAL_MAX_CONNECTIONS = int(os.getenv("PORTAL_MAX_CONNECTIONS", 10))
+PORTAL_MAX_CONCURRENCY = int(os.getenv("PORTAL_MAX_CONCURRENCY", 5))  # users at once
+PORTAL_TIMEOUT = float(os.getenv("PORTAL_TIMEOUT", 10))  # seconds per request
@@ -3,3 +3,9 @@ import os
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_IDS = [os.getenv("CREATOR_ID", None)]
+# url of a local Bot API imitation, see core/utils/fake_telegram.py
+API_SERVER = os.getenv("TELEGRAM_API_SERVER")
+# drop updates already taken by another worker, not only by this process
+UPDATES_DEDUP_SHARED = os.getenv("UPDATES_DEDUP_SHARED", "0") == "1"
+# keep anti-flood limits of users in redis, shared by all workers
+THROTTLE_SHARED = os.getenv("THROTTLE_SHARED", "0") == "1"
@@ -1,12 +1,17 @@
-import asyncio
+from typing import Dict, Iterable, List, Optional
 
 from motor import motor_asyncio
 
 from core.configs import database
+from core.utils import metrics
 
+from . import redis_worker
 from .models.user_model import User, instance
 
+client: motor_asyncio.AsyncIOMotorClient = None
 
+
+@metrics.timed(metrics.mongo_latency)
 async def update_user(chat_id, **kwargs):
     """
         Обновление информации о пользователе
@@ -16,12 +21,14 @@ async def update_user(chat_id, **kwargs):
     if user is None:
         new_user = User(chat_id=chat_id, **kwargs)
         await new_user.commit()
+        await redis_worker.add_users(1)
     else:
         for k, v in kwargs.items():
             setattr(user, k, v)
         await user.commit()
 
 
+@metrics.timed(metrics.mongo_latency)
 async def get_user(chat_id):
     """
         Получение информации о пользователе
@@ -29,6 +36,52 @@ async def get_user(chat_id):
     return await User.find_one({"chat_id": chat_id})
 
 
+def _projection(fields: Iterable[str]) -> dict:
+    projection = {field: True for field in fields}
+    projection["_id"] = False
+    return projection
+
+
+@metrics.timed(metrics.mongo_latency)
+async def get_user_fields(chat_id: int, *fields: str) -> Optional[dict]:
+    """
+        Только нужные поля пользователя в виде словаря, без документа umongo.
+        Для частых чтений, где не нужен весь пользователь. None если его нет
+    """
+    return await User.collection.find_one(
+        {"chat_id": chat_id}, projection=_projection(fields)
+    )
+
+
+@metrics.timed(metrics.mongo_latency)
+async def get_users_fields(chat_ids: Iterable[int], *fields: str) -> List[dict]:
+    """
+        То же для многих пользователей одним запросом, chat_id есть всегда
+    """
+    cursor = User.collection.find(
+        {"chat_id": {"$in": list(chat_ids)}},
+        projection=_projection(("chat_id",) + fields),
+    )
+    return await cursor.to_list(length=None)
+
+
+async def get_users_locales(chat_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+    """
+        Языки пользователей одним запросом, None если язык не выбран
+    """
+    users = await get_users_fields(chat_ids, "locale")
+    return {user["chat_id"]: user.get("locale") for user in users}
+
+
+@metrics.timed(metrics.mongo_latency)
+async def count_users() -> int:
+    """
+        Примерное число пользователей, по метаданным коллекции
+    """
+    return await User.collection.estimated_document_count()
+
+
+@metrics.timed(metrics.mongo_latency)
 async def drop_db():
     """
         Дроп базы данных
@@ -36,7 +89,32 @@ async def drop_db():
     await User.collection.drop()
 
 
-client = motor_asyncio.AsyncIOMotorClient(host=database.HOST_URL)
-instance.init(client[database.DB_NAME])
+async def init():
+    """
+        Подключение к базе данных и создание индексов, вызывается при запуске
+    """
+    global client
+    if client is None:
+        client = motor_asyncio.AsyncIOMotorClient(
+            host=database.HOST_URL,
+            maxPoolSize=database.MONGO_MAX_POOL_SIZE,
+            minPoolSize=database.MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=database.MONGO_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=database.MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=database.MONGO_SOCKET_TIMEOUT_MS,
+            serverSelectionTimeoutMS=database.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            waitQueueTimeoutMS=database.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            readPreference=database.MONGO_READ_PREFERENCE,
+        )
+        instance.init(client[database.DB_NAME])
+    await User.ensure_indexes()
+
 
-asyncio.get_event_loop().create_task(User.ensure_indexes())
+async def close():
+    """
+        Закрытие соединения с базой данных
+    """
+    global client
+    if client is not None:
+        client.close()
+        client = None
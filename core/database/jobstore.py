@@ -0,0 +1,179 @@
+import asyncio
+import pickle
+from typing import Dict, Optional
+
+import aioredis
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import datetime_to_utc_timestamp
+from loguru import logger
+
+from core.utils import metrics
+
+
+class AioRedisJobStore(MemoryJobStore):
+    """
+        Хранилище задач APScheduler, которое не блокирует event loop.
+
+        Задачи живут в памяти, а изменения записываются в redis в фоне:
+        все изменения, накопившиеся с прошлой записи, уходят одной транзакцией.
+        Ключи те же, что у RedisJobStore, поэтому сохраненные им задачи подхватываются.
+    """
+
+    def __init__(
+        self,
+        db: int = 0,
+        host: str = "localhost",
+        port: int = 6379,
+        password: str = None,
+        jobs_key: str = "apscheduler.jobs",
+        run_times_key: str = "apscheduler.run_times",
+        pickle_protocol: int = pickle.HIGHEST_PROTOCOL,
+        retry_delay: float = 5,
+    ):
+        super(AioRedisJobStore, self).__init__()
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.jobs_key = jobs_key
+        self.run_times_key = run_times_key
+        self.pickle_protocol = pickle_protocol
+        self.retry_delay = retry_delay
+
+        self._redis: aioredis.Redis = None
+        self._dirty: Dict[str, Optional[Job]] = {}  # job id -> job, None if removed
+        self._cleared = False
+        self._flush_needed: asyncio.Event = None
+        self._flush_task: asyncio.Task = None
+
+    async def load(self):
+        """
+            Загружает задачи из redis и начинает фоновую запись изменений.
+            Вызывается после scheduler.start()
+        """
+        self._redis = await aioredis.create_redis_pool(
+            self.address, db=self.db, password=self.password
+        )
+        self._flush_needed = asyncio.Event()
+        self._flush_task = asyncio.ensure_future(self._flush_forever())
+
+        broken_job_ids = []
+        with metrics.jobstore_latency.time("load"):
+            jobs = await self._redis.hgetall(self.jobs_key)
+        for job_id, job_state in jobs.items():
+            job_id = job_id.decode()
+            if job_id in self._jobs_index or job_id in self._dirty:
+                continue  # changed after the scheduler had started
+            try:
+                super(AioRedisJobStore, self).add_job(self._reconstitute_job(job_state))
+            except BaseException:
+                self._logger.exception(
+                    f'Unable to restore job "{job_id}" -- removing it'
+                )
+                broken_job_ids.append(job_id)
+
+        for job_id in broken_job_ids:
+            self._mark(job_id, None)
+        self._wake()  # jobs added before loading are not saved yet
+        if self._scheduler is not None:
+            self._scheduler.wakeup()
+        logger.info(f"Loaded {len(self._jobs)} jobs from redis")
+
+    def add_job(self, job: Job):
+        super(AioRedisJobStore, self).add_job(job)
+        metrics.jobstore_changes.inc("add")
+        self._mark(job.id, job)
+
+    def update_job(self, job: Job):
+        super(AioRedisJobStore, self).update_job(job)
+        metrics.jobstore_changes.inc("update")
+        self._mark(job.id, job)
+
+    def remove_job(self, job_id: str):
+        super(AioRedisJobStore, self).remove_job(job_id)
+        metrics.jobstore_changes.inc("remove")
+        self._mark(job_id, None)
+
+    def remove_all_jobs(self):
+        super(AioRedisJobStore, self).remove_all_jobs()
+        self._dirty.clear()
+        self._cleared = True
+        self._wake()
+
+    def _mark(self, job_id: str, job: Optional[Job]):
+        self._dirty[job_id] = job
+        self._wake()
+
+    def _wake(self):
+        if self._flush_needed is not None:
+            self._flush_needed.set()
+
+    def _reconstitute_job(self, job_state: bytes) -> Job:
+        job = Job.__new__(Job)
+        job.__setstate__(pickle.loads(job_state))
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    async def flush(self):
+        if self._redis is None or not (self._dirty or self._cleared):
+            return
+
+        dirty, self._dirty = self._dirty, {}
+        cleared, self._cleared = self._cleared, False
+
+        transaction = self._redis.multi_exec()
+        if cleared:
+            transaction.delete(self.jobs_key, self.run_times_key)
+        for job_id, job in dirty.items():
+            if job is None:
+                transaction.hdel(self.jobs_key, job_id)
+                transaction.zrem(self.run_times_key, job_id)
+                continue
+
+            transaction.hset(
+                self.jobs_key,
+                job_id,
+                pickle.dumps(job.__getstate__(), self.pickle_protocol),
+            )
+            if job.next_run_time:
+                transaction.zadd(
+                    self.run_times_key,
+                    datetime_to_utc_timestamp(job.next_run_time),
+                    job_id,
+                )
+            else:
+                transaction.zrem(self.run_times_key, job_id)
+
+        try:
+            with metrics.jobstore_latency.time("flush"):
+                await transaction.execute()
+        except Exception:
+            logger.exception(f"Failed to save {len(dirty)} jobs to redis")
+            for job_id, job in dirty.items():  # newer changes win
+                self._dirty.setdefault(job_id, job)
+            self._cleared = self._cleared or cleared
+            raise
+
+    async def _flush_forever(self):
+        while True:
+            await self._flush_needed.wait()
+            self._flush_needed.clear()
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.retry_delay)
+                self._wake()
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if self._redis is not None:
+            self._redis.close()
+            await self._redis.wait_closed()
+            self._redis = None
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
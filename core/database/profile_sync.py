@@ -0,0 +1,105 @@
+import asyncio
+from typing import Dict
+
+from loguru import logger
+from pymongo import UpdateOne
+
+from core.configs import consts
+from core.utils import metrics
+from core.utils.cache import MISSING, TTLCache
+
+from . import redis_worker
+from .models.user_model import User
+
+
+class ProfileSync:
+    """
+        Синхронизация имени и username пользователя с телеграмом.
+        Запоминает отпечаток последнего известного профиля и пишет в базу
+        только изменения, накапливая их в один bulk_write
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = consts.profile_sync_flush_interval,
+        max_pending: int = consts.profile_sync_max_pending,
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._fingerprints = TTLCache(
+            maxsize=consts.profile_sync_cache_size, ttl=consts.profile_sync_cache_ttl
+        )
+        self._pending: Dict[int, dict] = {}
+        self._task: asyncio.Task = None
+
+    async def sync(self, chat_id: int, **profile):
+        fingerprint = hash(tuple(sorted(profile.items())))
+        known = self._fingerprints.get(chat_id)
+        if known == fingerprint:
+            return
+
+        self._fingerprints.set(chat_id, fingerprint)
+        if known is MISSING:
+            # the process sees the user for the first time, the document may not exist yet
+            with metrics.mongo_latency.time("upsert_profile"):
+                result = await User.collection.update_one(
+                    {"chat_id": chat_id}, {"$set": profile}, upsert=True
+                )
+            if result.upserted_id is not None:
+                await redis_worker.add_users(1)
+            return
+
+        self._pending[chat_id] = profile
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._flush_periodically())
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        try:
+            with metrics.mongo_latency.time("bulk_write_profiles"):
+                result = await User.collection.bulk_write(
+                    [
+                        UpdateOne({"chat_id": chat_id}, {"$set": profile}, upsert=True)
+                        for chat_id, profile in pending.items()
+                    ],
+                    ordered=False,
+                )
+        except asyncio.CancelledError:
+            # stopped on shutdown, the final flush writes them
+            pending.update(self._pending)
+            self._pending = pending
+            raise
+        except Exception:
+            logger.exception(f"Failed to write {len(pending)} user profiles")
+            for chat_id in pending:  # will be written again on the next update
+                self._fingerprints.invalidate(chat_id)
+            return
+        await redis_worker.add_users(result.upserted_count)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # e.g. redis is down, the next flush must still run
+                logger.exception("Failed to flush user profiles")
+
+    async def close(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+
+profile_sync = ProfileSync()
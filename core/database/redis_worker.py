@@ -0,0 +1,458 @@
+import asyncio
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+import aioredis
+
+from core.configs import consts, database
+from core.utils import metrics
+
+_redis: aioredis.Redis = None
+_lock = asyncio.Lock()
+
+
+async def get_redis() -> aioredis.Redis:
+    """
+        Пул соединений с redis, создается при первом обращении
+    """
+    global _redis
+    async with _lock:
+        if _redis is None:
+            _redis = await aioredis.create_redis_pool(
+                (database.REDIS_HOST, database.REDIS_PORT),
+                db=database.REDIS_REMINDERS_DB,
+                password=database.REDIS_PASSWORD,
+            )
+    return _redis
+
+
+async def close():
+    global _redis
+    async with _lock:
+        if _redis is not None:
+            _redis.close()
+            await _redis.wait_closed()
+            _redis = None
+
+
+def _suffix(is_day_before: bool) -> str:
+    return consts.day_before_suffix if is_day_before else ""
+
+
+def _subscribers_key(campus_number, time_slot: str, is_day_before: bool) -> str:
+    return consts.cohort_subscribers_key_format.format(
+        campus_number=campus_number, time_slot=time_slot
+    ) + _suffix(is_day_before)
+
+
+def _slots_key(campus_number, is_day_before: bool) -> str:
+    return consts.cohort_slots_key_format.format(campus_number=campus_number) + _suffix(
+        is_day_before
+    )
+
+
+def _index_key(chat_id: int) -> str:
+    return consts.user_reminders_key_format.format(chat_id=chat_id)
+
+
+def _index_field(campus_number, is_day_before: bool) -> str:
+    return str(campus_number) + _suffix(is_day_before)
+
+
+def _count(pipe, cohorts: Counter):
+    """
+        Обновляет счетчики статистики: когорта (кампус, время, накануне ли) -> изменение
+    """
+    fields, slots = Counter(), Counter()
+    for (campus_number, time_slot, is_day_before), delta in cohorts.items():
+        fields["subscriptions"] += delta
+        fields[f"campus:{campus_number}"] += delta
+        fields["day_before" if is_day_before else "day_of"] += delta
+        fields[f"hour:{time_slot[:2]}"] += delta
+        slots[time_slot] += delta
+    for field, delta in fields.items():
+        if delta:
+            pipe.hincrby(consts.stats_key, field, delta)
+    for time_slot, delta in slots.items():
+        if delta:
+            pipe.zincrby(consts.stats_time_slots_key, delta, time_slot)
+
+
+# KEYS: подписчики когорты, напоминания пользователя, слоты кампуса
+# ARGV: chat_id, поле кампуса в напоминаниях, слот
+_LEAVE_COHORT = """
+local removed = redis.call('SREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[2])
+local reminders_left = redis.call('HLEN', KEYS[2])
+local size = redis.call('SCARD', KEYS[1])
+if size == 0 then
+    redis.call('SREM', KEYS[3], ARGV[3])
+end
+return {removed, size, reminders_left}
+"""
+
+# KEYS: подписчики когорты, слоты кампуса; ARGV: слот
+_DROP_EMPTY_SLOT = """
+if redis.call('SCARD', KEYS[1]) == 0 then
+    redis.call('SREM', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+async def _leave_cohort(
+    redis: aioredis.Redis,
+    chat_id: int,
+    campus_number: int,
+    is_day_before: bool,
+    keep_slot: str = None,
+) -> List[str]:
+    """
+        Убирает пользователя из когорты кампуса, если он не в keep_slot.
+        Возвращает слоты, в которых не осталось подписчиков.
+        Слот убирается скриптом, чтобы никто не подписался между SCARD и SREM
+    """
+    slot = await redis.hget(
+        _index_key(chat_id), _index_field(campus_number, is_day_before), encoding="utf8"
+    )
+    if slot is None or slot == keep_slot:
+        return []
+
+    removed, size, reminders_left = await redis.eval(
+        _LEAVE_COHORT,
+        keys=[
+            _subscribers_key(campus_number, slot, is_day_before),
+            _index_key(chat_id),
+            _slots_key(campus_number, is_day_before),
+        ],
+        args=[chat_id, _index_field(campus_number, is_day_before), slot],
+    )
+
+    pipe = redis.pipeline()
+    if removed:
+        _count(pipe, Counter({(campus_number, slot, is_day_before): -1}))
+    if not reminders_left:
+        pipe.srem(consts.stats_active_users_key, chat_id)
+    await pipe.execute()
+    return [] if size else [slot]
+
+
+@metrics.timed(metrics.redis_latency)
+async def subscribe(
+    chat_id: int, campus_number: int, time_slot: str, is_day_before: bool
+) -> List[str]:
+    """
+        Подписка пользователя на когорту (кампус, время, накануне ли).
+        Пользователь может быть только в одной когорте кампуса,
+        поэтому из прежней он удаляется.
+        Возвращает слоты, которые остались без подписчиков
+    """
+    redis = await get_redis()
+    emptied = await _leave_cohort(
+        redis, chat_id, campus_number, is_day_before, keep_slot=time_slot
+    )
+
+    pipe = redis.pipeline()
+    pipe.sadd(_subscribers_key(campus_number, time_slot, is_day_before), chat_id)
+    pipe.sadd(_slots_key(campus_number, is_day_before), time_slot)
+    pipe.hset(
+        _index_key(chat_id), _index_field(campus_number, is_day_before), time_slot
+    )
+    pipe.sadd(consts.stats_active_users_key, chat_id)
+    added, *_ = await pipe.execute()
+
+    if added:
+        pipe = redis.pipeline()
+        _count(pipe, Counter({(campus_number, time_slot, is_day_before): 1}))
+        await pipe.execute()
+    return emptied
+
+
+@metrics.timed(metrics.redis_latency)
+async def unsubscribe(
+    chat_id: int, campus_number: int, is_day_before: bool
+) -> List[str]:
+    """
+        Отписка пользователя от напоминаний кампуса.
+        Возвращает слоты, которые остались без подписчиков
+    """
+    redis = await get_redis()
+    return await _leave_cohort(redis, chat_id, campus_number, is_day_before)
+
+
+@metrics.timed(metrics.redis_latency)
+async def get_subscribers(
+    campus_number: int, time_slot: str, is_day_before: bool
+) -> List[int]:
+    redis = await get_redis()
+    members = await redis.smembers(
+        _subscribers_key(campus_number, time_slot, is_day_before)
+    )
+    return [int(chat_id) for chat_id in members]
+
+
+def _parse_index(index: Dict[str, str]) -> Dict[Tuple[int, bool], str]:
+    result = {}
+    for field, time_slot in index.items():
+        campus, _, day_before = field.partition(":")
+        result[(int(campus), bool(day_before))] = time_slot
+    return result
+
+
+@metrics.timed(metrics.redis_latency)
+async def get_user_reminders(chat_id: int) -> Dict[Tuple[int, bool], str]:
+    """
+        Напоминания пользователя: (кампус, накануне ли) -> время
+    """
+    redis = await get_redis()
+    index = await redis.hgetall(_index_key(chat_id), encoding="utf8")
+    return _parse_index(index)
+
+
+@metrics.timed(metrics.redis_latency)
+async def get_users_reminders(
+    chat_ids: List[int],
+) -> Dict[int, Dict[Tuple[int, bool], str]]:
+    """
+        Напоминания нескольких пользователей за один запрос
+    """
+    redis = await get_redis()
+    pipe = redis.pipeline()
+    for chat_id in chat_ids:
+        pipe.hgetall(_index_key(chat_id), encoding="utf8")
+    indexes = await pipe.execute()
+    return {chat_id: _parse_index(index) for chat_id, index in zip(chat_ids, indexes)}
+
+
+@metrics.timed(metrics.redis_latency)
+async def subscribe_many(
+    subscriptions: List[Tuple[int, int, str, bool]]
+) -> Tuple[Set[Tuple[int, str, bool]], Set[Tuple[int, str, bool]]]:
+    """
+        Подписка многих пользователей сразу: (chat_id, кампус, время, накануне ли).
+        Как и subscribe, переносит пользователя из прежней когорты кампуса.
+        Возвращает когорты, в которые добавлены пользователи,
+        и когорты, которые остались без подписчиков
+    """
+    redis = await get_redis()
+    pipe = redis.pipeline()
+    for chat_id, campus_number, time_slot, is_day_before in subscriptions:
+        pipe.hget(
+            _index_key(chat_id),
+            _index_field(campus_number, is_day_before),
+            encoding="utf8",
+        )
+    previous_slots = await pipe.execute()
+
+    joined, left = set(), set()
+    changes = []  # (cohort, +1 or -1, future with the number of added or removed)
+    pipe = redis.pipeline()
+    for (chat_id, campus_number, time_slot, is_day_before), previous in zip(
+        subscriptions, previous_slots
+    ):
+        if previous is not None and previous != time_slot:
+            cohort = (campus_number, previous, is_day_before)
+            left.add(cohort)
+            changes.append(
+                (
+                    cohort,
+                    -1,
+                    pipe.srem(
+                        _subscribers_key(campus_number, previous, is_day_before),
+                        chat_id,
+                    ),
+                )
+            )
+        cohort = (campus_number, time_slot, is_day_before)
+        joined.add(cohort)
+        changes.append(
+            (
+                cohort,
+                1,
+                pipe.sadd(
+                    _subscribers_key(campus_number, time_slot, is_day_before), chat_id
+                ),
+            )
+        )
+        pipe.hset(
+            _index_key(chat_id), _index_field(campus_number, is_day_before), time_slot
+        )
+        pipe.sadd(consts.stats_active_users_key, chat_id)
+    for campus_number, time_slot, is_day_before in joined:
+        pipe.sadd(_slots_key(campus_number, is_day_before), time_slot)
+    await pipe.execute()
+
+    counts = Counter()
+    for cohort, delta, changed in changes:
+        if changed.result():
+            counts[cohort] += delta
+    left -= joined
+    pipe = redis.pipeline()
+    _count(pipe, counts)
+    dropped = [
+        pipe.eval(
+            _DROP_EMPTY_SLOT,
+            keys=[
+                _subscribers_key(campus_number, time_slot, is_day_before),
+                _slots_key(campus_number, is_day_before),
+            ],
+            args=[time_slot],
+        )
+        for campus_number, time_slot, is_day_before in left
+    ]
+    await pipe.execute()
+    emptied = {cohort for cohort, drop in zip(left, dropped) if drop.result()}
+    return joined, emptied
+
+
+@metrics.timed(metrics.redis_latency)
+async def get_empty_slots(
+    campus_number: int, time_slots: List[str], is_day_before: bool
+) -> List[str]:
+    """
+        Слоты, в которых сейчас нет подписчиков.
+        Слот, опустевший при отписке, мог с тех пор получить нового подписчика
+    """
+    redis = await get_redis()
+    pipe = redis.pipeline()
+    sizes = [
+        pipe.scard(_subscribers_key(campus_number, time_slot, is_day_before))
+        for time_slot in time_slots
+    ]
+    await pipe.execute()
+    return [slot for slot, size in zip(time_slots, sizes) if not size.result()]
+
+
+@metrics.timed(metrics.redis_latency)
+async def get_cohorts() -> Set[Tuple[int, str, bool]]:
+    """
+        Все когорты, у которых есть подписчики: (кампус, время, накануне ли)
+    """
+    redis = await get_redis()
+    cohorts = set()
+    for campus_number in consts.base_dates_campus_cleaning:
+        for is_day_before in (False, True):
+            slots = await redis.smembers(
+                _slots_key(campus_number, is_day_before), encoding="utf8"
+            )
+            cohorts.update((campus_number, slot, is_day_before) for slot in slots)
+    return cohorts
+
+
+async def get_subscribed_campuses(chat_id: int, is_day_before: bool) -> Set[str]:
+    """
+        Кампусы, на напоминания которых подписан пользователь
+    """
+    return {
+        str(campus)
+        for campus, day_before in await get_user_reminders(chat_id)
+        if day_before == is_day_before
+    }
+
+
+async def rebuild_subscriptions_index():
+    """
+        Строит индекс подписок пользователей по подписчикам когорт.
+        Нужен один раз для подписок, сделанных до появления индекса
+    """
+    redis = await get_redis()
+    if await redis.exists(consts.user_reminders_index_built_key):
+        return
+
+    for campus_number in consts.base_dates_campus_cleaning:
+        for is_day_before in (False, True):
+            slots = await redis.smembers(
+                _slots_key(campus_number, is_day_before), encoding="utf8"
+            )
+            for slot in slots:
+                subscribers_key = _subscribers_key(campus_number, slot, is_day_before)
+                pipe = redis.pipeline()
+                for chat_id in await redis.smembers(subscribers_key):
+                    pipe.hset(
+                        _index_key(int(chat_id)),
+                        _index_field(campus_number, is_day_before),
+                        slot,
+                    )
+                await pipe.execute()
+    await redis.set(consts.user_reminders_index_built_key, 1)
+
+
+async def add_users(count: int = 1):
+    """
+        Учитывает новых пользователей в статистике
+    """
+    if count:
+        redis = await get_redis()
+        await redis.incrby(consts.stats_users_key, count)
+
+
+async def rebuild_stats(users_total: int):
+    """
+        Считает статистику по уже существующим подпискам.
+        Нужно один раз, дальше счетчики обновляются при каждом изменении
+    """
+    redis = await get_redis()
+    if await redis.exists(consts.stats_built_key):
+        return
+
+    cohorts = sorted(await get_cohorts())
+    subscribers_keys = [_subscribers_key(*cohort) for cohort in cohorts]
+    pipe = redis.pipeline()
+    sizes = [pipe.scard(key) for key in subscribers_keys]
+    await pipe.execute()
+
+    transaction = redis.multi_exec()
+    transaction.delete(
+        consts.stats_key, consts.stats_time_slots_key, consts.stats_active_users_key
+    )
+    _count(
+        transaction,
+        Counter({cohort: size.result() for cohort, size in zip(cohorts, sizes)}),
+    )
+    if subscribers_keys:
+        transaction.sunionstore(consts.stats_active_users_key, *subscribers_keys)
+    transaction.set(consts.stats_users_key, users_total)
+    transaction.set(consts.stats_built_key, 1)
+    await transaction.execute()
+
+
+@metrics.timed(metrics.redis_latency)
+async def get_stats(top: int = consts.stats_top_time_slots) -> dict:
+    """
+        Статистика подписок из счетчиков, без обхода подписчиков
+    """
+    redis = await get_redis()
+    pipe = redis.pipeline()
+    pipe.hgetall(consts.stats_key, encoding="utf8")
+    pipe.get(consts.stats_users_key)
+    pipe.scard(consts.stats_active_users_key)
+    pipe.zrevrangebyscore(
+        consts.stats_time_slots_key,
+        min=1,
+        offset=0,
+        count=top,
+        withscores=True,
+        encoding="utf8",
+    )
+    counters, users, active, top_slots = await pipe.execute()
+
+    counters = {field: int(value) for field, value in counters.items()}
+    return {
+        "users": int(users or 0),
+        "active": active,
+        "subscriptions": counters.get("subscriptions", 0),
+        "day_of": counters.get("day_of", 0),
+        "day_before": counters.get("day_before", 0),
+        "campuses": {
+            int(field.partition(":")[2]): value
+            for field, value in sorted(counters.items())
+            if field.startswith("campus:") and value
+        },
+        "hours": {
+            int(field.partition(":")[2]): value
+            for field, value in sorted(counters.items())
+            if field.startswith("hour:") and value
+        },
+        "top_time_slots": [(slot, int(count)) for slot, count in top_slots],
+    }
@@ -1,109 +1,120 @@
 import asyncio
 import datetime
-import logging
-import sys
-from typing import Dict, Set
+import os
+import tempfile
+import zlib
+from collections import defaultdict
+from typing import Dict, List
 
-from aiogram import Bot, Dispatcher, executor, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram import types
 from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters import Text
+from aiogram.dispatcher.webhook import SendMessage
 from aiogram.utils.exceptions import TelegramAPIError
-from apscheduler.jobstores.redis import RedisJobStore
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from inline_timepicker.inline_timepicker import InlineTimepicker
+from apscheduler.triggers.combining import OrTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from loguru import logger
 
 import core.reply_markups as markups
 from core import strings
 from core.configs import consts, database, telegram
 from core.database import db_worker as db
-from core.database.models import user_model
+from core.database import redis_worker as reminders
+from core.database.jobstore import AioRedisJobStore
 from core.reply_markups.callbacks.language_choice import language_callback
-from core.reply_markups.inline import available_languages as available_languages_markup
-from core.strings.scripts import _
-from core.utils import decorators
-from core.utils.middlewares import logger_middleware, update_middleware
+from core.reply_markups.timepicker import handle_timepicker
+from core.strings.scripts import responses
+from core.utils import backup, decorators
+from core.utils.broadcast import BroadcastEngine
+from core.utils.cleaning_calendar import cleaning_calendar
+from core.utils.fsm_storage import PipelinedRedisStorage
+from core.utils.middlewares import (
+    dedup_middleware,
+    logger_middleware,
+    metrics_middleware,
+    throttling_middleware,
+    update_middleware,
+)
+from core.utils.outbound import OutboundBot, Priority, lane
+from core.utils.portal import PortalAuthError, PortalClient, PortalError
+from core.utils.replying_dispatcher import ReplyingDispatcher
 from core.utils.states import (
     ChooseLanguageDialog,
+    ImportBackupDialog,
     MailingEveryoneDialog,
     OffCleaningReminderStates,
     SetCleaningReminderStates,
 )
 
-logging.basicConfig(
-    format="[%(asctime)s] %(levelname)s : %(name)s : %(message)s",
-    level=logging.DEBUG,
-    datefmt="%Y-%m-%d at %H:%M:%S",
+# nothing here connects anywhere, see core.app for startup
+loop = asyncio.get_event_loop()
+bot = OutboundBot(
+    telegram.BOT_TOKEN,
+    loop=loop,
+    parse_mode=types.ParseMode.HTML,
+    validate_token=False,  # validated at startup, so tools can import handlers
 )
 
-logger.remove()
-logger.add(
-    consts.LOGS_FOLDER / "debug_logs.log",
-    format="[{time:YYYY-MM-DD at HH:mm:ss}] {level}: {name} : {message}",
-    level=logging.DEBUG,
-    colorize=False,
-)
-logger.add(
-    consts.LOGS_FOLDER / "info_logs.log",
-    format="[{time:YYYY-MM-DD at HH:mm:ss}] {level}: {name} : {message}",
-    level=logging.INFO,
-    colorize=False,
-)
-logger.add(
-    consts.LOGS_FOLDER / "warn_logs.log",
-    format="[{time:YYYY-MM-DD at HH:mm:ss}] {level}: {name} : {message}",
-    level=logging.WARNING,
-    colorize=False,
-)
-logger.add(
-    consts.LOGS_FOLDER / "error_logs.log",
-    format="[{time:YYYY-MM-DD at HH:mm:ss}] {level}: {name} : {message}",
-    level=logging.ERROR,
-    colorize=False,
-)
-logger.add(
-    sys.stdout,
-    format="[{time:YYYY-MM-DD at HH:mm:ss}] {level}: {name} : {message}",
-    level=logging.WARNING,
-    colorize=False,
+dp = ReplyingDispatcher(
+    bot,
+    storage=PipelinedRedisStorage(
+        host=database.REDIS_HOST,
+        port=database.REDIS_PORT,
+        db=database.REDIS_FSM_DB,
+        password=database.REDIS_PASSWORD,
+        ttl=consts.fsm_ttl,
+    ),
 )
 
-logging.getLogger("aiogram").setLevel(logging.INFO)
 
-loop = asyncio.get_event_loop()
-bot = Bot(telegram.BOT_TOKEN, loop=loop, parse_mode=types.ParseMode.HTML)
+def _reply(chat_id: int, text: str) -> SendMessage:
+    """
+    Reply returned from a handler. In webhook mode it goes into the response
+    and not through the bot, so the bot's defaults are set on it here
+    """
+    return SendMessage(chat_id, text, parse_mode=bot.parse_mode)
 
-dp = Dispatcher(bot, storage=MemoryStorage())
 
 # additional helpers
 scheduler = AsyncIOScheduler(
     timezone=consts.default_timezone, coalesce=True, misfire_grace_time=10000
 )
-scheduler.add_jobstore(
-    RedisJobStore(db=1, host=database.REDIS_HOST, port=database.REDIS_PORT)
+jobstore = AioRedisJobStore(
+    db=database.REDIS_JOBSTORE_DB,
+    host=database.REDIS_HOST,
+    port=database.REDIS_PORT,
+    password=database.REDIS_PASSWORD,
 )
-scheduler.start()
+scheduler.add_jobstore(jobstore)
 
-inline_timepicker = InlineTimepicker()
+broadcast = BroadcastEngine(bot)
+portal = PortalClient()
+# cohort job id -> seconds to wait before its overdue run, see stagger_overdue_jobs
+_catch_up_delays: Dict[str, float] = {}
 
 
 @dp.message_handler(state="*", commands=["cancel"])
-@dp.message_handler(lambda msg: msg.text.lower() == "cancel", state="*")
+@dp.message_handler(Text(equals="cancel", ignore_case=True), state="*")
 async def cancel_handler(msg: types.Message, state: FSMContext):
     await state.finish()
-    await bot.send_message(msg.from_user.id, _("cancel"))
+    return _reply(msg.from_user.id, responses.text("cancel"))
 
 
 @dp.message_handler(commands=["start"], state="*")
 async def start_command_handler(msg: types.Message):
-    await bot.send_message(msg.chat.id, _("start_cmd_text"))
+    return _reply(msg.chat.id, responses.text("start_cmd_text"))
 
 
 @dp.message_handler(commands=["help"], state="*")
 async def help_command_handler(msg: types.Message):
-    user = await db.get_user(chat_id=msg.from_user.id)
-    await bot.send_message(
-        msg.chat.id, _("help_cmd_text, formats: {name}").format(name=user.first_name)
+    user = await db.get_user_fields(msg.from_user.id, "first_name")
+    return _reply(
+        msg.chat.id,
+        responses.text("help_cmd_text, formats: {name}").format(
+            name=user.get("first_name") if user else msg.from_user.first_name
+        ),
     )
 
 
@@ -111,45 +122,44 @@ async def help_command_handler(msg: types.Message):
 async def schedule_command_handler(msg: types.Message):
     from core.strings.scripts import i18n
 
-    next_cleaning_dates = []
-    now = datetime.datetime.now(consts.default_timezone).replace(tzinfo=None)
-    text = [
-        _("schedule_command_text"),
-    ]
+    locale = i18n.ctx_locale.get() or i18n.default
+    return _reply(msg.chat.id, cleaning_calendar.render_schedule(locale))
 
-    for base_dates in consts.base_dates_campus_cleaning.values():
-        days_left = consts.cleaning_interval
-        for base_date in base_dates:
-            if base_date:
-                base_date = datetime.datetime(
-                    year=base_date.year, month=base_date.month, day=base_date.day,
-                )
-                days_left = min(
-                    consts.cleaning_interval
-                    - (now - base_date).days % consts.cleaning_interval,
-                    days_left,
-                )
 
-        next_cleaning = now + datetime.timedelta(days=days_left)
-        next_cleaning_dates.append((next_cleaning.strftime("%d.%m.%Y (%A)"), days_left))
+@dp.message_handler(commands=["rooms"], state="*")
+async def rooms_command_handler(msg: types.Message):
+    if not portal.enabled:
+        return _reply(msg.chat.id, responses.text("portal_disabled"))
+    user = await db.get_user_fields(msg.from_user.id, "hotel_login", "hotel_password")
+    if not user or not user.get("hotel_login") or not user.get("hotel_password"):
+        return _reply(msg.chat.id, responses.text("portal_no_credentials"))
 
-    text.extend(
-        [
-            _("scheduled_cleaning").format(
-                campus_number=index + 1, date=date, days_left=days_left
-            )
-            for (index, (date, days_left)) in enumerate(next_cleaning_dates)
-        ]
+    try:
+        rooms = await portal.get_rooms(user["hotel_login"], user["hotel_password"])
+    except PortalAuthError:
+        return _reply(msg.chat.id, responses.text("portal_wrong_credentials"))
+    except PortalError:
+        return _reply(msg.chat.id, responses.text("portal_unavailable"))
+    if not rooms:
+        return _reply(msg.chat.id, responses.text("portal_no_rooms"))
+
+    today = datetime.datetime.now(consts.default_timezone).date().isoformat()
+    lines = []
+    for room in rooms:
+        upcoming = [day for day in room["cleanings"] if day >= today]
+        shown = ", ".join(upcoming[: consts.portal_shown_cleanings])
+        lines.append(f"  {room['number']}: {shown or '—'}")
+    return _reply(
+        msg.chat.id, responses.text("portal_rooms").format(rooms="\n".join(lines))
     )
-    await bot.send_message(msg.chat.id, "\n".join(map(str, text)))
 
 
 @dp.message_handler(commands="language", state="*")
 async def language_cmd_handler(msg: types.Message):
     await bot.send_message(
         msg.from_user.id,
-        text=_("choose language"),
-        reply_markup=available_languages_markup,
+        text=responses.text("choose language"),
+        reply_markup=responses.keyboard("available_languages"),
     )
     await ChooseLanguageDialog.enter_language_callback.set()
 
@@ -164,16 +174,18 @@ async def language_choice_handler(
     await db.update_user(query.from_user.id, locale=callback_data["user_locale"])
     from core.strings.scripts import i18n
 
+    i18n.invalidate_user_locale(query.from_user.id)
     i18n.ctx_locale.set(callback_data["user_locale"])
 
-    await bot.send_message(query.from_user.id, _("language is set"))
+    await bot.send_message(query.from_user.id, responses.text("language is set"))
     await state.finish()
 
 
 @dp.message_handler(commands="on", state="*")
 async def on_cleaning_reminder(msg: types.Message):
     await msg.answer(
-        _("set_is_day_before"), reply_markup=markups.inline.get_set_is_day_before_kb()
+        responses.text("set_is_day_before"),
+        reply_markup=responses.keyboard("set_is_day_before"),
     )
     await SetCleaningReminderStates.set_is_day_before.set()
 
@@ -193,8 +205,8 @@ async def set_is_day_before_cb_handler(
 
     await bot.send_message(
         query.from_user.id,
-        _("choose_campus"),
-        reply_markup=markups.inline.campus_numbers,
+        responses.text("choose_campus"),
+        reply_markup=responses.keyboard("campus_numbers"),
     )
 
     await SetCleaningReminderStates.enter_campus_number.set()
@@ -212,167 +224,278 @@ async def set_campus_number_cb_handler(
     async with state.proxy() as proxy:
         proxy["campus_number_set_reminder"] = callback_data["number"]
 
-    inline_timepicker.init(
-        base_time=datetime.time(12, 0),
-        min_time=datetime.time(0, 15),
-        max_time=datetime.time(23, 45),
-    )
-
     await bot.send_message(
         query.from_user.id,
-        _("choose_cleaning_reminder_time"),
-        reply_markup=inline_timepicker.get_keyboard(),
+        responses.text("choose_cleaning_reminder_time"),
+        reply_markup=responses.keyboard("timepicker"),
     )
     await SetCleaningReminderStates.enter_time.set()
 
 
+def render_reminder(locale: str, campus_number, is_day_before: bool) -> str:
+    if is_day_before:
+        text = responses.text("personal_reminder_cleaning_day_before", locale)
+    else:
+        text = responses.text("personal_reminder_cleaning, formats: number", locale)
+    return text.format(number=campus_number)
+
+
+async def send_reminders(chat_ids: List[int], campus_number, is_day_before: bool):
+    """
+    Reminds all users at once: locales are read in one query,
+    the text is rendered once per locale and all messages are queued together
+    """
+    from core.strings.scripts import i18n
+
+    locales = await i18n.get_stored_locales(chat_ids)
+    texts = {}
+    messages = []
+    for chat_id in chat_ids:
+        locale = locales.get(chat_id) or i18n.default
+        if locale not in texts:
+            texts[locale] = render_reminder(locale, campus_number, is_day_before)
+        messages.append((chat_id, texts[locale]))
+
+    results = await bot.send_messages(messages)
+    # flood limits are retried by the outbound queue, what is left is permanent
+    failed = [
+        (chat_id, result)
+        for (chat_id, text), result in zip(messages, results)
+        if isinstance(result, TelegramAPIError)
+    ]
+    for chat_id, error in failed:
+        logger.debug(
+            f"Reminder to {chat_id} about campus {campus_number} failed: {error}"
+        )
+    logger.info(
+        f"Reminded {len(messages) - len(failed)} of {len(messages)} users "
+        f"about campus {campus_number}"
+    )
+
+
+def reminder_delay(chat_id: int) -> float:
+    """
+    Seconds after the cohort time when the user is reminded.
+    Derived from chat_id only, so the user is reminded at the same moment every time
+    """
+    window = int(consts.reminder_spread_window)
+    if window <= 0:
+        return 0.0
+    offset = zlib.crc32(str(chat_id).encode()) % window
+    return float(offset - offset % consts.reminder_wave_step)
+
+
 async def personal_reminder_about_cleaning(
     chat_id, campus_number, is_day_before: bool = False
 ):
-    from core.strings.scripts import i18n
+    # jobs of the old per-user reminders refer to it until they are migrated
+    await send_reminders([chat_id], campus_number, is_day_before)
 
-    if is_day_before:
-        text = _(
-            "personal_reminder_cleaning_day_before",
-            locale=await i18n.get_user_locale(None, None, user_id=chat_id),
-        )
-    else:
-        text = _(
-            "personal_reminder_cleaning, formats: number",
-            locale=await i18n.get_user_locale(None, None, user_id=chat_id),
-        )
 
-    try:
-        await bot.send_message(chat_id, text.format(number=campus_number))
-    except TelegramAPIError as e:
-        logger.exception(
-            f"TelegramAPIError while sending reminder({chat_id}, {campus_number})"
-            f"message={text}, locale={await i18n.get_user_locale(None, None, user_id=chat_id)}"
-            f": {e}"
-        )
+async def cohort_reminder_about_cleaning(
+    campus_number: int, time_slot: str, is_day_before: bool = False
+):
+    """
+    One job per (campus, time slot, is_day_before) fans out to all its subscribers.
+    They are reminded in waves over reminder_spread_window, so a popular time slot
+    does not hit telegram and redis at once. The outbound queue paces every wave
+    and lets replies to users go first
+    """
+    job_id = _cohort_job_id(campus_number, time_slot, is_day_before)
+    await asyncio.sleep(_catch_up_delays.pop(job_id, 0))
+
+    chat_ids = await reminders.get_subscribers(campus_number, time_slot, is_day_before)
+    waves = defaultdict(list)
+    for chat_id in chat_ids:
+        waves[reminder_delay(chat_id)].append(chat_id)
+
+    started_at = loop.time()
+    with lane(Priority.REMINDER):
+        for delay in sorted(waves):
+            await asyncio.sleep(max(started_at + delay - loop.time(), 0))
+            await send_reminders(waves[delay], campus_number, is_day_before)
+
+
+def _cohort_job_id(campus_number: int, time_slot: str, is_day_before: bool) -> str:
+    job_id = consts.cohort_job_id_format.format(
+        campus_number=campus_number, time_slot=time_slot
+    )
+    return job_id + (consts.day_before_suffix if is_day_before else "")
 
-        if is_day_before:
-            await bot.send_message(
-                chat_id, f"Завтра уборка в кампусе <b>{campus_number}</b>"
+
+def _cohort_trigger(campus_number: int, time_slot: str, is_day_before: bool):
+    time = datetime.datetime.strptime(time_slot, consts.time_slot_format).time()
+    triggers = []
+    for base_date in consts.base_dates_campus_cleaning[campus_number]:
+        if base_date:
+            start_date = datetime.datetime.combine(base_date, time)
+            if is_day_before:
+                start_date -= datetime.timedelta(days=1)
+            triggers.append(
+                IntervalTrigger(
+                    days=consts.cleaning_interval,
+                    start_date=start_date,
+                    timezone=consts.default_timezone,
+                )
             )
-        else:
-            await bot.send_message(
-                chat_id, f"Сегодня уборка в кампусе <b>{campus_number}</b>"
+    return OrTrigger(triggers)
+
+
+async def _remove_cohort_jobs(campus_number: int, time_slots, is_day_before: bool):
+    if not time_slots:
+        return
+    # checked again right before the removal, someone may have joined meanwhile
+    removed = await reminders.get_empty_slots(campus_number, time_slots, is_day_before)
+    for time_slot in removed:
+        try:
+            scheduler.remove_job(
+                _cohort_job_id(campus_number, time_slot, is_day_before)
             )
+        except JobLookupError:
+            pass
+    if not removed:
+        return
+    # and after it, a subscription which came in between gets its job back
+    still_empty = await reminders.get_empty_slots(campus_number, removed, is_day_before)
+    for time_slot in set(removed) - set(still_empty):
+        _add_cohort_job(campus_number, time_slot, is_day_before)
+
+
+def _add_cohort_job(campus_number: int, time_slot: str, is_day_before: bool):
+    scheduler.add_job(
+        cohort_reminder_about_cleaning,
+        _cohort_trigger(campus_number, time_slot, is_day_before),
+        args=[campus_number, time_slot, is_day_before],
+        id=_cohort_job_id(campus_number, time_slot, is_day_before),
+        replace_existing=True,
+    )
 
 
-def set_cleaning_reminder(
+async def set_cleaning_reminder(
     chat_id: int, campus_number: int, time: datetime.time, is_day_before: bool
 ):
     if not isinstance(campus_number, int):
         campus_number = int(campus_number)
-    for i in range(0, 4):
-        base_data = consts.base_dates_campus_cleaning[campus_number][i]
-        if base_data:
-            run_time = datetime.datetime(
-                year=base_data.year,
-                month=base_data.month,
-                day=base_data.day,
-                hour=time.hour,
-                minute=time.minute,
-            )
+    time_slot = time.strftime(consts.time_slot_format)
 
-            job_id = consts.job_id_format.format(
-                chat_id=chat_id, campus_number=campus_number, index=i
-            )
+    emptied_slots = await reminders.subscribe(
+        chat_id, campus_number, time_slot, is_day_before
+    )
+    await _remove_cohort_jobs(campus_number, emptied_slots, is_day_before)
+    _add_cohort_job(campus_number, time_slot, is_day_before)
+
+
+async def migrate_personal_reminders():
+    """
+    Moves reminders which were stored as one job per user into cohorts
+    """
+    for job in scheduler.get_jobs():
+        if not job.id.startswith("cleaning_reminder:"):
+            continue
+        chat_id, campus_number, is_day_before = job.args
+        run_time = job.next_run_time or job.trigger.get_next_fire_time(
+            None, datetime.datetime.now(consts.default_timezone)
+        )
+        await set_cleaning_reminder(
+            chat_id,
+            campus_number,
+            run_time.astimezone(consts.default_timezone).time(),
+            is_day_before,
+        )
+        scheduler.remove_job(job.id)
+        logger.info(f"Reminder {job.id} is moved to its cohort")
+
+
+def stagger_overdue_jobs():
+    """
+    Cohort jobs missed while the bot was down would all fire at once after the start.
+    They still fire on time, so their schedule is kept, but wait before reminding,
+    one after another reminder_catch_up_step apart.
+    Must be called right after the jobs are loaded, before the scheduler runs them
+    """
+    now = datetime.datetime.now(consts.default_timezone)
+    overdue = sorted(
+        (
+            job
+            for job in scheduler.get_jobs()
+            if job.id.startswith("cleaning_cohort:")
+            and job.next_run_time
+            and job.next_run_time <= now
+        ),
+        key=lambda job: job.next_run_time,
+    )
+    for number, job in enumerate(overdue):
+        _catch_up_delays[job.id] = number * consts.reminder_catch_up_step
+    if overdue:
+        logger.info(
+            f"{len(overdue)} overdue cohorts are staggered "
+            f"over {len(overdue) * consts.reminder_catch_up_step} s"
+        )
 
-            if is_day_before:
-                run_time -= datetime.timedelta(days=1)
-                job_id += ":day_before"
-
-            scheduler.add_job(
-                personal_reminder_about_cleaning,
-                "interval",
-                weeks=4,
-                args=[chat_id, campus_number, is_day_before],
-                next_run_time=run_time,
-                id=job_id,
-                replace_existing=True,
-            )
+
+async def sync_cohort_jobs():
+    """
+    Makes cohort jobs match the subscriptions in redis:
+    schedules cohorts which got subscribers without the bot, e.g. by an import,
+    and removes jobs of cohorts which have none
+    """
+    cohort_jobs = {
+        _cohort_job_id(*cohort): cohort for cohort in await reminders.get_cohorts()
+    }
+    for job in scheduler.get_jobs():
+        if job.id.startswith("cleaning_cohort:") and job.id not in cohort_jobs:
+            scheduler.remove_job(job.id)
+    for job_id, cohort in cohort_jobs.items():
+        if scheduler.get_job(job_id) is None:
+            _add_cohort_job(*cohort)
+            logger.info(f"Cohort job {job_id} is scheduled")
 
 
 @dp.callback_query_handler(
-    inline_timepicker.filter(), state=SetCleaningReminderStates.enter_time
+    markups.callbacks.timepicker.filter(), state=SetCleaningReminderStates.enter_time
 )
 async def set_cleaning_reminder_time_cb_handler(
     query: types.CallbackQuery, state: FSMContext, callback_data: Dict[str, str]
 ):
     await query.answer()
-    reminder_time = inline_timepicker.handle(query.from_user.id, callback_data)
+    reminder_time, timepicker_kb = handle_timepicker(callback_data)
     if reminder_time:
         await bot.edit_message_text(
-            _("cleaning_reminder_set"),
+            responses.text("cleaning_reminder_set"),
             chat_id=query.from_user.id,
             message_id=query.message.message_id,
         )
 
         async with state.proxy() as proxy:
-            loop.run_in_executor(
-                None,
-                set_cleaning_reminder,
+            await set_cleaning_reminder(
                 query.from_user.id,
                 proxy["campus_number_set_reminder"],
                 reminder_time,
                 proxy["is_day_before"],
             )
         await state.finish()
-    else:
+    elif timepicker_kb:
         await bot.edit_message_reply_markup(
             query.from_user.id,
             message_id=query.message.message_id,
-            reply_markup=inline_timepicker.get_keyboard(),
+            reply_markup=timepicker_kb,
         )
 
 
-def _get_existing_reminder_at_the_day_of_cleaning(user_id) -> Set[str]:
-    result = set()
-    for campus in range(1, 5):
-        for ind in range(0, 4):
-            if scheduler.get_job(
-                consts.job_id_format.format(
-                    chat_id=user_id, campus_number=campus, index=ind
-                )
-            ):
-                result.add(str(campus))
-    return result
-
-
-def _get_existing_reminder_day_before_the_cleaning(user_id) -> Set[str]:
-    result = set()
-    for campus in range(1, 5):
-        for ind in range(0, 4):
-            if scheduler.get_job(
-                consts.job_id_format.format(
-                    chat_id=user_id, campus_number=campus, index=ind
-                )
-                + ":day_before"
-            ):
-                result.add(str(campus))
-    return result
-
-
 @dp.message_handler(commands="off", state="*")
 async def off_cleaning_reminder_command_handler(msg: types.Message, state: FSMContext):
-    reminders_day_before = _get_existing_reminder_day_before_the_cleaning(
-        msg.from_user.id
-    )
-    reminders_at_the_day = _get_existing_reminder_at_the_day_of_cleaning(
-        msg.from_user.id
-    )
+    user_reminders = await reminders.get_user_reminders(msg.from_user.id)
+    reminders_day_before = any(day_before for campus, day_before in user_reminders)
+    reminders_at_the_day = any(not day_before for campus, day_before in user_reminders)
 
     if not reminders_day_before and not reminders_at_the_day:
-        await msg.answer(_("no_reminders_set"))
+        await msg.answer(responses.text("no_reminders_set"))
         return
     else:
         if reminders_at_the_day and reminders_day_before:
             await msg.answer(
-                _("remove_set_is_day_before"),
-                reply_markup=markups.inline.get_set_is_day_before_kb(),
+                responses.text("remove_set_is_day_before"),
+                reply_markup=responses.keyboard("set_is_day_before"),
             )
             await OffCleaningReminderStates.enter_is_day_before.set()
         else:
@@ -402,26 +525,14 @@ async def set_is_day_before_for_off_reminder_cb_handler(
 
 
 async def send_inline_kb_campus_numbers_to_remove_reminders(user_id, is_day_before):
-    from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-
-    existing_reminder_campuses = (
-        _get_existing_reminder_day_before_the_cleaning(user_id)
-        if is_day_before
-        else _get_existing_reminder_at_the_day_of_cleaning(user_id)
+    existing_reminder_campuses = await reminders.get_subscribed_campuses(
+        user_id, is_day_before
     )
-
-    existing_reminder_campuses = sorted(existing_reminder_campuses)
-    kb = InlineKeyboardMarkup(row_width=2)
-    kb.add(
-        *[
-            InlineKeyboardButton(
-                str(campus),
-                callback_data=markups.callbacks.choose_campus_number.new(number=campus),
-            )
-            for campus in existing_reminder_campuses
-        ]
+    await bot.send_message(
+        user_id,
+        responses.text("choose_campus"),
+        reply_markup=responses.campus_keyboard(existing_reminder_campuses),
     )
-    await bot.send_message(user_id, _("choose_campus"), reply_markup=kb)
 
 
 @dp.callback_query_handler(
@@ -435,59 +546,108 @@ async def off_cleaning_reminder_cb_handler(
         is_day_before = bool(proxy.get("is_day_before"))
 
     campus = int(callback_data["number"])
-    for i in range(0, 4):
-        if consts.base_dates_campus_cleaning[campus][i]:
-            scheduler.remove_job(
-                job_id=consts.job_id_format.format(
-                    chat_id=query.from_user.id, campus_number=campus, index=i
-                )
-                + (":day_before" if is_day_before else "")
-            )
+    emptied_slots = await reminders.unsubscribe(
+        query.from_user.id, campus, is_day_before
+    )
+    await _remove_cohort_jobs(campus, emptied_slots, is_day_before)
 
     await bot.edit_message_text(
-        _("reminder_is_off"),
+        responses.text("reminder_is_off"),
         chat_id=query.from_user.id,
         message_id=query.message.message_id,
     )
     await state.finish()
 
 
-@decorators.admin
 @dp.message_handler(commands=["send_to_everyone"], state="*")
+@decorators.admin
 async def send_to_everyone_command_handler(msg: types.Message):
-    #NOTE: i am not sure where it works
-    await bot.send_message(msg.chat.id, _("mailing_everyone"))
+    if broadcast.is_running:
+        await bot.send_message(msg.chat.id, responses.text("broadcast_is_running"))
+        return
+    await bot.send_message(msg.chat.id, responses.text("mailing_everyone"))
     await MailingEveryoneDialog.first()
 
 
 @dp.message_handler(state=MailingEveryoneDialog.enter_message)
+@decorators.admin
 async def mailing_everyone_handler(msg: types.Message, state: FSMContext):
-    await bot.send_message(msg.chat.id, _("sent_to_everyone"))
-    scheduler.add_job(send_to_everyone, args=[msg.text])
     await state.finish()
+    await broadcast.start(msg.text, admin_chat_id=msg.chat.id)
 
 
-async def send_to_everyone(txt):
-    async for u in user_model.User.find({}).raw_cursor:
-        try:
-            chat_id = u.get("chat_id")
-            if chat_id:
-                await bot.send_message(chat_id, txt)
-        except TelegramAPIError:
-            pass
-        await asyncio.sleep(0.5)
+@dp.message_handler(commands=["stats"], state="*")
+@decorators.admin
+async def stats_command_handler(msg: types.Message):
+    stats = await reminders.get_stats()
+    return _reply(
+        msg.chat.id,
+        responses.text("stats").format(
+            users=stats["users"],
+            active=stats["active"],
+            subscriptions=stats["subscriptions"],
+            day_of=stats["day_of"],
+            day_before=stats["day_before"],
+            campuses="\n".join(
+                f"  {campus}: {count}" for campus, count in stats["campuses"].items()
+            ),
+            hours="\n".join(
+                f"  {hour:02}:00–{hour:02}:59: {count}"
+                for hour, count in stats["hours"].items()
+            ),
+            top_time_slots="\n".join(
+                f"  {time_slot}: {count}"
+                for time_slot, count in stats["top_time_slots"]
+            ),
+        ),
+    )
 
 
-def main():
-    logger.info(
-        "Compile .po and .mo before running! Hint: pybabel compile -d locales -D bot"
+@dp.message_handler(commands=["export"], state="*")
+@decorators.admin
+async def export_command_handler(msg: types.Message):
+    fmt = "csv" if msg.get_args().strip().lower() == "csv" else "ndjson"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"users-{datetime.date.today()}.{fmt}.gz")
+        exported = await backup.export_users(path, fmt)
+        await bot.send_document(
+            msg.chat.id,
+            types.InputFile(path),
+            caption=responses.text("export_finished").format(users=exported),
+        )
+
+
+@dp.message_handler(commands=["import"], state="*")
+@decorators.admin
+async def import_command_handler(msg: types.Message):
+    await bot.send_message(msg.chat.id, responses.text("import_send_file"))
+    await ImportBackupDialog.first()
+
+
+@dp.message_handler(
+    content_types=types.ContentType.DOCUMENT, state=ImportBackupDialog.enter_file
+)
+@decorators.admin
+async def import_file_handler(msg: types.Message, state: FSMContext):
+    await state.finish()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(
+            directory, os.path.basename(msg.document.file_name or "import")
+        )
+        await msg.document.download(path)
+        stats = await backup.import_users(path)
+    await sync_cohort_jobs()
+    await bot.send_message(
+        msg.chat.id, responses.text("import_finished").format(**stats)
     )
 
+
+def setup_middlewares():
+    metrics_middleware.on_startup(dp)  # first, so it measures the other middlewares too
+    # both before anything touches the databases, a redelivered update
+    # must not be counted against the user's rate
+    dedup_middleware.on_startup(dp)
+    throttling_middleware.on_startup(dp)
     update_middleware.on_startup(dp)
     logger_middleware.on_startup(dp)
     strings.on_startup(dp)  # enable i18n
-    executor.start_polling(dp)
-
-
-if __name__ == "__main__":
-    main()
@@ -1,3 +1,4 @@
 from .choose_campus_number import choose_campus_number
 from .language_choice import language_callback
 from .set_is_day_before import set_is_day_before
+from .timepicker import timepicker
@@ -0,0 +1,4 @@
+from aiogram.utils.callback_data import CallbackData
+
+# time and its bounds are minutes since midnight
+timepicker = CallbackData("timepicker", "action", "time", "min", "max")
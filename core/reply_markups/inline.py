@@ -14,26 +14,33 @@ available_languages.add(
 )
 
 
-campus_numbers = InlineKeyboardMarkup(row_width=2)
-campus_numbers.add(
-    *list(
-        InlineKeyboardButton(str(i), callback_data=choose_campus_number.new(number=i))
-        for i in range(1, 5)
+def get_campus_numbers_kb(campus_numbers=range(1, 5)) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardMarkup(row_width=2)
+    kb.add(
+        *list(
+            InlineKeyboardButton(
+                str(i), callback_data=choose_campus_number.new(number=i)
+            )
+            for i in campus_numbers
+        )
     )
-)
+    return kb
+
+
+campus_numbers = get_campus_numbers_kb()
 
 
-def get_set_is_day_before_kb():
-    from core.strings.scripts import _
+def get_set_is_day_before_kb(locale: str = None):
+    from core.strings.scripts import i18n
 
     set_is_day_before_kb = InlineKeyboardMarkup(row_width=1)
     set_is_day_before_kb.add(
         InlineKeyboardButton(
-            _("is_day_before_inline_kb_false"),
+            i18n.gettext("is_day_before_inline_kb_false", locale=locale),
             callback_data=set_is_day_before.new(value="1"),
         ),
         InlineKeyboardButton(
-            _("is_day_before_inline_kb_true"),
+            i18n.gettext("is_day_before_inline_kb_true", locale=locale),
             callback_data=set_is_day_before.new(value="0"),
         ),
     )
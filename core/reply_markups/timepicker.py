@@ -0,0 +1,83 @@
+"""
+Inline time picker which keeps all its state in the callback data of its buttons,
+so any worker can handle a press without remembering anything about the dialog
+"""
+import datetime
+from typing import Dict, Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from core.configs import consts
+from core.reply_markups.callbacks import timepicker as timepicker_callback
+
+STEPS = {
+    "inc_hour": 60,
+    "dec_hour": -60,
+    "inc_minute": consts.timepicker_minute_step,
+    "dec_minute": -consts.timepicker_minute_step,
+}
+
+
+def _to_minutes(time: datetime.time) -> int:
+    return time.hour * 60 + time.minute
+
+
+def _to_time(minutes: int) -> datetime.time:
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def get_timepicker_kb(
+    time: datetime.time = consts.reminder_default_time,
+    min_time: datetime.time = consts.reminder_min_time,
+    max_time: datetime.time = consts.reminder_max_time,
+) -> InlineKeyboardMarkup:
+    return _build_kb(_to_minutes(time), _to_minutes(min_time), _to_minutes(max_time))
+
+
+def _build_kb(minutes: int, min_minutes: int, max_minutes: int) -> InlineKeyboardMarkup:
+    def button(text, action):
+        return InlineKeyboardButton(
+            text,
+            callback_data=timepicker_callback.new(
+                action=action, time=minutes, min=min_minutes, max=max_minutes
+            ),
+        )
+
+    time = _to_time(minutes)
+    kb = InlineKeyboardMarkup(row_width=2)
+    kb.row(button("▲", "inc_hour"), button("▲", "inc_minute"))
+    kb.row(button(f"{time.hour:02}", "noop"), button(f"{time.minute:02}", "noop"))
+    kb.row(button("▼", "dec_hour"), button("▼", "dec_minute"))
+    kb.row(button("OK", "ok"))
+    return kb
+
+
+def handle_timepicker(
+    callback_data: Dict[str, str]
+) -> Tuple[Optional[datetime.time], Optional[InlineKeyboardMarkup]]:
+    """
+    Returns chosen time if user has confirmed it,
+    otherwise a new keyboard, or nothing if it has not changed.
+
+    Callback data comes from the client and can be forged, so the time is clamped
+    to consts.reminder_min_time..reminder_max_time, and min and max of the data
+    are not used, they are only kept for buttons which have been sent already
+    """
+    try:
+        minutes = int(callback_data["time"])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    min_minutes = _to_minutes(consts.reminder_min_time)
+    max_minutes = _to_minutes(consts.reminder_max_time)
+    minutes = min(max(minutes, min_minutes), max_minutes)
+    action = callback_data.get("action")
+
+    if action == "ok":
+        return _to_time(minutes), None
+    if action not in STEPS:
+        return None, None
+
+    new_minutes = min(max(minutes + STEPS[action], min_minutes), max_minutes)
+    if new_minutes == minutes:
+        return None, None
+    return None, _build_kb(new_minutes, min_minutes, max_minutes)
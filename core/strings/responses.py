@@ -0,0 +1,147 @@
+"""
+Texts and keyboards which are the same for every user of a language.
+
+They are rendered for every language at startup and kept serialized,
+so handlers send them as they are. Compiled catalogs are checked for changes
+every few seconds, and everything is rendered again after `pybabel compile`
+"""
+import os
+import time
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils import json
+from loguru import logger
+
+from core.configs import consts
+from core.configs.locales import I18N_DOMAIN, LANGUAGES, LOCALES_DIR
+
+STATIC_TEXTS = (
+    "cancel",
+    "start_cmd_text",
+    "help_cmd_text, formats: {name}",
+    "choose language",
+    "language is set",
+    "set_is_day_before",
+    "remove_set_is_day_before",
+    "choose_campus",
+    "choose_cleaning_reminder_time",
+    "cleaning_reminder_set",
+    "no_reminders_set",
+    "reminder_is_off",
+    "personal_reminder_cleaning_day_before",
+    "personal_reminder_cleaning, formats: number",
+    "mailing_everyone",
+    "broadcast_is_running",
+    "export_finished",
+    "import_send_file",
+    "import_finished",
+    "stats",
+    "portal_disabled",
+    "portal_no_credentials",
+    "portal_wrong_credentials",
+    "portal_unavailable",
+    "portal_no_rooms",
+    "portal_rooms",
+)
+
+
+def _serialize(kb: InlineKeyboardMarkup) -> str:
+    return json.dumps(kb.to_python())
+
+
+class ResponseCache:
+    def __init__(self, i18n, check_interval: float = consts.responses_check_interval):
+        self.i18n = i18n
+        self.check_interval = check_interval
+        self._texts: Dict[str, Dict[str, str]] = {}  # locale -> msgid -> text
+        self._keyboards: Dict[str, Dict[str, str]] = {}  # locale -> name -> json
+        self._common_keyboards: Dict[str, str] = {}
+        self._campus_keyboards: Dict[FrozenSet[str], str] = {}
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _catalog_mtimes() -> Dict[str, Optional[float]]:
+        mtimes = {}
+        for locale in LANGUAGES:
+            path = LOCALES_DIR / locale / "LC_MESSAGES" / f"{I18N_DOMAIN}.mo"
+            try:
+                mtimes[locale] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[locale] = None
+        return mtimes
+
+    def build(self):
+        from core.reply_markups import inline
+        from core.reply_markups.timepicker import get_timepicker_kb
+        from core.utils.cleaning_calendar import cleaning_calendar
+
+        self._mtimes = self._catalog_mtimes()
+        self._checked_at = time.monotonic()
+
+        texts, keyboards = {}, {}
+        for locale in LANGUAGES:
+            texts[locale] = {
+                msgid: self.i18n.gettext(msgid, locale=locale) for msgid in STATIC_TEXTS
+            }
+            keyboards[locale] = {
+                "set_is_day_before": _serialize(inline.get_set_is_day_before_kb(locale))
+            }
+        self._texts, self._keyboards = texts, keyboards
+        self._common_keyboards = {
+            "available_languages": _serialize(inline.available_languages),
+            "campus_numbers": _serialize(inline.campus_numbers),
+            "timepicker": _serialize(get_timepicker_kb()),
+        }
+        self._campus_keyboards = {}
+        cleaning_calendar.clear_rendered()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._texts and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        if not self._texts:
+            self.build()
+        elif self._catalog_mtimes() != self._mtimes:
+            logger.info("Compiled locales have changed, rendering responses again")
+            self.i18n.reload()
+            self.build()
+
+    def _locale(self, locale: Optional[str]) -> str:
+        locale = locale or self.i18n.ctx_locale.get()
+        return locale if locale in self._texts else self.i18n.default
+
+    def text(self, msgid: str, locale: str = None) -> str:
+        """
+        Text in the given locale, in the locale of the current user by default
+        """
+        self._refresh()
+        return self._texts[self._locale(locale)][msgid]
+
+    def keyboard(self, name: str, locale: str = None) -> str:
+        """
+        Serialized keyboard, ready to be passed as reply_markup
+        """
+        self._refresh()
+        keyboard = self._common_keyboards.get(name)
+        if keyboard is None:
+            keyboard = self._keyboards[self._locale(locale)][name]
+        return keyboard
+
+    def campus_keyboard(self, campus_numbers: Iterable) -> str:
+        """
+        Serialized keyboard with the given campuses
+        """
+        self._refresh()
+        key = frozenset(str(number) for number in campus_numbers)
+        keyboard = self._campus_keyboards.get(key)
+        if keyboard is None:
+            from core.reply_markups import inline
+
+            keyboard = self._campus_keyboards[key] = _serialize(
+                inline.get_campus_numbers_kb(sorted(key, key=int))
+            )
+        return keyboard
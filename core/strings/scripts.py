@@ -4,9 +4,11 @@ Scripts which are somehow connected to locales
 from aiogram import Dispatcher
 
 from core.configs.locales import I18N_DOMAIN, LOCALES_DIR
+from core.strings.responses import ResponseCache
 from core.utils.middlewares.aclmiddleware import ACLMiddleware
 
 i18n = ACLMiddleware(I18N_DOMAIN, LOCALES_DIR)
+responses = ResponseCache(i18n)
 
 
 def on_startup(dp: Dispatcher):
@@ -0,0 +1,291 @@
+"""
+Export and import of users together with their reminder subscriptions.
+
+Users are read with a batched cursor and written to a gzip file record by record,
+the subscriptions of every batch are read from redis in one pipeline,
+so the collection is never loaded into memory. Portal passwords are left out
+unless asked for with --with-passwords. Import goes the other way:
+every batch is one bulk_write to mongo and one redis pipeline.
+Cohort jobs of imported subscriptions are scheduled by the bot on startup
+or right after /import.
+
+Usage:
+    python -m core.utils.backup export users.ndjson.gz
+    python -m core.utils.backup export users.csv.gz
+    python -m core.utils.backup export --with-passwords users.ndjson.gz
+    python -m core.utils.backup import users.ndjson.gz
+"""
+import argparse
+import asyncio
+import csv
+import datetime
+import gzip
+import io
+import json
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple
+
+from loguru import logger
+from pymongo import UpdateOne
+
+from core.configs import consts
+from core.database import db_worker
+from core.database import redis_worker as reminders
+from core.database.models.user_model import User
+
+USER_FIELDS = (
+    "chat_id",
+    "first_name",
+    "last_name",
+    "username",
+    "locale",
+    "rooms",
+    "hotel_login",
+    "hotel_password",
+)
+SECRET_FIELDS = ("hotel_password",)
+FORMATS = ("ndjson", "csv")
+GZIP_MAGIC = b"\x1f\x8b"
+
+Reminders = Dict[Tuple[int, bool], str]
+
+
+def guess_format(file_name: str) -> str:
+    name = file_name.lower()
+    if name.endswith(".gz"):
+        name = name[: -len(".gz")]
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+def _reminder_field(campus_number: int, is_day_before: bool) -> str:
+    return str(campus_number) + (consts.day_before_suffix if is_day_before else "")
+
+
+def _dump_reminders(user_reminders: Reminders) -> List[dict]:
+    return [
+        {"campus": campus_number, "time": time_slot, "day_before": is_day_before}
+        for (campus_number, is_day_before), time_slot in sorted(user_reminders.items())
+    ]
+
+
+def _load_reminders(value) -> Reminders:
+    """
+    Reminders from a record: list of dicts in ndjson, "1=13:00;2:day_before=9:30" in csv
+    """
+    if not value:
+        return {}
+    if isinstance(value, str):
+        value = [
+            {
+                "campus": field.partition(":")[0],
+                "day_before": bool(field.partition(":")[2]),
+                "time": time_slot,
+            }
+            for field, _, time_slot in (
+                item.partition("=") for item in value.split(";")
+            )
+        ]
+
+    result = {}
+    for reminder in value:
+        campus_number = int(reminder["campus"])
+        if campus_number not in consts.base_dates_campus_cleaning:
+            raise ValueError(f"Unknown campus {campus_number}")
+        time_slot = datetime.datetime.strptime(
+            reminder["time"], consts.time_slot_format
+        ).strftime(consts.time_slot_format)
+        result[(campus_number, bool(reminder["day_before"]))] = time_slot
+    return result
+
+
+def _to_csv_row(user: dict, user_reminders: Reminders, fields: Tuple[str]) -> dict:
+    row = {field: user.get(field) for field in fields}
+    row["rooms"] = ";".join(user.get("rooms") or ())
+    row["reminders"] = ";".join(
+        f"{_reminder_field(campus_number, is_day_before)}={time_slot}"
+        for (campus_number, is_day_before), time_slot in sorted(user_reminders.items())
+    )
+    return row
+
+
+def _parse_record(record: dict) -> Tuple[dict, Reminders]:
+    user = {
+        field: record[field]
+        for field in USER_FIELDS
+        if record.get(field) not in (None, "")
+    }
+    user["chat_id"] = int(user["chat_id"])
+    if isinstance(user.get("rooms"), str):
+        user["rooms"] = [room for room in user["rooms"].split(";") if room]
+    return user, _load_reminders(record.get("reminders"))
+
+
+def _read_records(stream: TextIO, fmt: str) -> Iterator[Optional[dict]]:
+    """
+    Records of the file one by one, None for a line which can't be read
+    """
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def _open_for_reading(path: str) -> TextIO:
+    with open(path, "rb") as file:
+        is_gzip = file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    if is_gzip:
+        return gzip.open(path, "rt", encoding="utf8", newline="")
+    return io.open(path, "rt", encoding="utf8", newline="")
+
+
+async def export_users(
+    path: str,
+    fmt: str = "ndjson",
+    batch_size: int = consts.backup_batch_size,
+    with_passwords: bool = False,
+) -> int:
+    """
+    Writes all users with their reminders to a gzip file. Returns the number of users.
+    Portal passwords are written only with with_passwords
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, use one of {FORMATS}")
+    fields = tuple(
+        field for field in USER_FIELDS if with_passwords or field not in SECRET_FIELDS
+    )
+
+    exported = 0
+    with gzip.open(path, "wt", encoding="utf8", newline="") as stream:
+        writer = None
+        if fmt == "csv":
+            writer = csv.DictWriter(stream, fields + ("reminders",))
+            writer.writeheader()
+
+        async def write(batch: List[dict]):
+            users_reminders = await reminders.get_users_reminders(
+                [user["chat_id"] for user in batch]
+            )
+            for user in batch:
+                user_reminders = users_reminders[user["chat_id"]]
+                if writer is not None:
+                    writer.writerow(_to_csv_row(user, user_reminders, fields))
+                    continue
+                record = {field: user.get(field) for field in fields}
+                record["reminders"] = _dump_reminders(user_reminders)
+                stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        cursor = User.collection.find(
+            {"chat_id": {"$ne": None}}, projection={"_id": False}
+        ).batch_size(batch_size)
+        batch = []
+        async for user in cursor:
+            batch.append(user)
+            if len(batch) >= batch_size:
+                await write(batch)
+                exported += len(batch)
+                batch = []
+        if batch:
+            await write(batch)
+            exported += len(batch)
+
+    logger.info(f"Exported {exported} users to {path}")
+    return exported
+
+
+async def _import_batch(batch: List[Tuple[dict, Reminders]]) -> int:
+    from core.strings.scripts import i18n
+
+    result = await User.collection.bulk_write(
+        [
+            UpdateOne({"chat_id": user["chat_id"]}, {"$set": user}, upsert=True)
+            for user, _ in batch
+        ],
+        ordered=False,
+    )
+    for user, _ in batch:  # the locale may have changed
+        i18n.invalidate_user_locale(user["chat_id"])
+    await reminders.add_users(result.upserted_count)
+    subscriptions = [
+        (user["chat_id"], campus_number, time_slot, is_day_before)
+        for user, user_reminders in batch
+        for (campus_number, is_day_before), time_slot in user_reminders.items()
+    ]
+    if subscriptions:
+        await reminders.subscribe_many(subscriptions)
+    return len(subscriptions)
+
+
+async def import_users(
+    path: str, fmt: str = None, batch_size: int = consts.backup_batch_size
+) -> Dict[str, int]:
+    """
+    Adds users and subscriptions from a file made by export_users, plain or gzip.
+    Existing users are updated. Returns numbers of users, reminders and skipped records
+    """
+    fmt = fmt or guess_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, use one of {FORMATS}")
+
+    stats = {"users": 0, "reminders": 0, "skipped": 0}
+    with _open_for_reading(path) as stream:
+        batch = []
+        for number, record in enumerate(_read_records(stream, fmt), start=1):
+            try:
+                batch.append(_parse_record(record))
+            except (AttributeError, TypeError, KeyError, ValueError) as e:
+                logger.warning(f"Record {number} of {path} is skipped: {e!r}")
+                stats["skipped"] += 1
+                continue
+            if len(batch) >= batch_size:
+                stats["reminders"] += await _import_batch(batch)
+                stats["users"] += len(batch)
+                batch = []
+        if batch:
+            stats["reminders"] += await _import_batch(batch)
+            stats["users"] += len(batch)
+
+    logger.info(f"Imported from {path}: {stats}")
+    return stats
+
+
+async def _run(args):
+    await db_worker.init()
+    try:
+        if args.command == "export":
+            fmt = args.format or guess_format(args.path)
+            await export_users(args.path, fmt, args.batch_size, args.with_passwords)
+        else:
+            stats = await import_users(args.path, args.format, args.batch_size)
+            print(
+                f"{stats['users']} users and {stats['reminders']} reminders imported, "
+                f"{stats['skipped']} records skipped. "
+                "Restart the bot to schedule reminders of new time slots"
+            )
+    finally:
+        await reminders.close()
+        await db_worker.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="File to write or read, gzip is used for export")
+    parser.add_argument(
+        "--format", choices=FORMATS, help="By default guessed from the file name"
+    )
+    parser.add_argument("--batch-size", type=int, default=consts.backup_batch_size)
+    parser.add_argument(
+        "--with-passwords",
+        action="store_true",
+        help="Export portal passwords too, they are written in plain text",
+    )
+    asyncio.get_event_loop().run_until_complete(_run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
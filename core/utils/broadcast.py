@@ -0,0 +1,168 @@
+import asyncio
+import time
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter, TelegramAPIError
+from bson import ObjectId
+from loguru import logger
+
+from core.configs import consts
+from core.database import redis_worker
+from core.database.models.user_model import User
+from core.strings.scripts import _
+from core.utils.outbound import Priority, lane
+
+
+class BroadcastEngine:
+    """
+    Sends one text to every user.
+
+    Users are walked in `_id` order in batches, every batch is sent concurrently.
+    The rate is kept by the outbound queue of the bot, where broadcasts have
+    the lowest priority, so replies to users are not held up by them. Position of the cursor and counters are saved to redis
+    after each batch, so an interrupted campaign continues from the last batch.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        batch_size: int = consts.broadcast_batch_size,
+        progress_interval: float = consts.broadcast_progress_interval,
+    ):
+        self.bot = bot
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self._task: asyncio.Task = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, text: str, admin_chat_id: int):
+        if self.is_running:
+            raise RuntimeError("Broadcast is already running")
+
+        progress_message = await self.bot.send_message(
+            admin_chat_id, _("broadcast_started")
+        )
+        redis = await redis_worker.get_redis()
+        await redis.hmset_dict(
+            consts.broadcast_key,
+            {
+                "text": text,
+                "admin_chat_id": admin_chat_id,
+                "progress_message_id": progress_message.message_id,
+                "last_id": "",
+                "sent": 0,
+                "failed": 0,
+            },
+        )
+        self._run_in_lane()
+
+    async def resume(self) -> bool:
+        """
+        Continues a campaign interrupted by a restart. Returns False if there is none
+        """
+        redis = await redis_worker.get_redis()
+        if self.is_running or not await redis.exists(consts.broadcast_key):
+            return False
+        self._run_in_lane()
+        return True
+
+    def _run_in_lane(self):
+        with lane(Priority.BROADCAST):  # the task copies the context with the lane
+            self._task = asyncio.ensure_future(self._run())
+        self._task.add_done_callback(self._done)
+
+    @staticmethod
+    def _done(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            # the campaign stays in redis and is resumed on the next start
+            logger.opt(exception=task.exception()).error("Broadcast has failed")
+
+    async def _send(self, chat_id: int, text: str) -> bool:
+        while True:
+            try:
+                await self.bot.send_message(chat_id, text)
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Broadcast is flood limited for {e.timeout} s")
+                await asyncio.sleep(e.timeout)
+            except TelegramAPIError as e:
+                logger.debug(f"Broadcast message to {chat_id} is not sent: {e}")
+                return False
+
+    async def _send_batch(self, redis, batch, text: str, progress: dict):
+        results = await asyncio.gather(*[self._send(u["chat_id"], text) for u in batch])
+        progress["sent"] += sum(results)
+        progress["failed"] += len(results) - sum(results)
+        progress["last_id"] = str(batch[-1]["_id"])
+        await redis.hmset_dict(consts.broadcast_key, progress)
+
+    async def _report(self, campaign: dict, progress: dict, speed: float, done=False):
+        text = (_("broadcast_finished") if done else _("broadcast_progress")).format(
+            sent=progress["sent"],
+            failed=progress["failed"],
+            remaining=max(progress["total"] - progress["sent"] - progress["failed"], 0),
+            speed=round(speed, 1),
+        )
+        try:
+            await self.bot.edit_message_text(
+                text,
+                chat_id=int(campaign["admin_chat_id"]),
+                message_id=int(campaign["progress_message_id"]),
+            )
+        except TelegramAPIError:
+            pass
+
+    async def _run(self):
+        redis = await redis_worker.get_redis()
+        campaign = await redis.hgetall(consts.broadcast_key, encoding="utf8")
+        text = campaign["text"]
+        progress = {
+            "sent": int(campaign["sent"]),
+            "failed": int(campaign["failed"]),
+            "last_id": campaign["last_id"],
+        }
+        query = {}
+        if progress["last_id"]:
+            query = {"_id": {"$gt": ObjectId(progress["last_id"])}}
+        progress["total"] = (
+            progress["sent"]
+            + progress["failed"]
+            + await User.collection.count_documents(query)
+        )
+
+        started_at = reported_at = time.monotonic()
+        sent_before = progress["sent"]
+        cursor = (
+            User.collection.find(query, projection={"chat_id": True})
+            .sort("_id", 1)
+            .batch_size(self.batch_size)
+        )
+
+        batch = []
+        async for user in cursor:
+            if user.get("chat_id"):
+                batch.append(user)
+            if len(batch) < self.batch_size:
+                continue
+            await self._send_batch(redis, batch, text, progress)
+            batch = []
+
+            if time.monotonic() - reported_at > self.progress_interval:
+                reported_at = time.monotonic()
+                speed = (progress["sent"] - sent_before) / (reported_at - started_at)
+                await self._report(campaign, progress, speed)
+
+        if batch:
+            await self._send_batch(redis, batch, text, progress)
+
+        speed = (progress["sent"] - sent_before) / max(
+            time.monotonic() - started_at, 1e-6
+        )
+        await redis.delete(consts.broadcast_key)
+        await self._report(campaign, progress, speed, done=True)
+        logger.info(
+            f"Broadcast is finished: sent {progress['sent']}, failed {progress['failed']}"
+        )
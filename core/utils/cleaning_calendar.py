@@ -0,0 +1,117 @@
+import datetime
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Tuple
+
+from core.configs import consts
+
+
+def today() -> datetime.date:
+    return datetime.datetime.now(consts.default_timezone).date()
+
+
+class CleaningCalendar:
+    """
+    Cleaning dates of every campus precomputed for `horizon_days` ahead.
+    Dates are kept as sorted arrays of ordinals, so queries are binary searches
+    """
+
+    def __init__(
+        self,
+        base_dates: Dict[int, list] = consts.base_dates_campus_cleaning,
+        interval: int = consts.cleaning_interval,
+        horizon_days: int = consts.cleaning_calendar_horizon,
+    ):
+        self.base_dates = base_dates
+        self.interval = interval
+        self.horizon_days = horizon_days
+        self._first = self._last = 0
+        self._dates: Dict[int, array] = {}
+        self._rendered: Dict[Tuple[str, datetime.date], str] = {}
+
+    def _build(self, first: datetime.date, days: int = None):
+        self._first = first.toordinal()
+        self._last = self._first + max(days or 0, self.horizon_days)
+        for campus_number, base_dates in self.base_dates.items():
+            ordinals = []
+            for base_date in filter(None, base_dates):
+                # first cleaning of this base date which is not before `first`
+                ordinal = base_date.toordinal()
+                ordinal -= (ordinal - self._first) // self.interval * self.interval
+                ordinals.extend(range(ordinal, self._last + 1, self.interval))
+            self._dates[campus_number] = array("l", sorted(ordinals))
+
+    def _ensure(self, start: datetime.date, end: datetime.date):
+        if start.toordinal() < self._first or end.toordinal() > self._last:
+            # a range longer than the horizon is built as far as it goes
+            self._build(start, end.toordinal() - start.toordinal())
+
+    def cleanings_between(
+        self, campus_number: int, start: datetime.date, end: datetime.date
+    ) -> List[datetime.date]:
+        """
+        Cleanings in campus from `start` to `end` inclusive
+        """
+        self._ensure(start, end)
+        dates = self._dates[campus_number]
+        return [
+            datetime.date.fromordinal(ordinal)
+            for ordinal in dates[
+                bisect_left(dates, start.toordinal()) : bisect_right(
+                    dates, end.toordinal()
+                )
+            ]
+        ]
+
+    def next_cleanings(
+        self, campus_number: int, n: int = 1, after: datetime.date = None
+    ) -> List[datetime.date]:
+        """
+        `n` cleanings in campus which are strictly after `after` (today by default)
+        """
+        after = after or today()
+        self._ensure(after, after + datetime.timedelta(days=self.interval))
+        dates = self._dates[campus_number]
+        index = bisect_right(dates, after.toordinal())
+        if index + n > len(dates):
+            # every campus is cleaned at least once an interval
+            self._build(after, (n + 1) * self.interval)
+            dates = self._dates[campus_number]
+            index = bisect_right(dates, after.toordinal())
+        return [
+            datetime.date.fromordinal(ordinal) for ordinal in dates[index : index + n]
+        ]
+
+    def clear_rendered(self):
+        self._rendered.clear()
+
+    def render_schedule(self, locale: str, day: datetime.date = None) -> str:
+        """
+        Text of /schedule, rendered once per locale per day
+        """
+        from core.strings.scripts import i18n
+
+        day = day or today()
+        text = self._rendered.get((locale, day))
+        if text is not None:
+            return text
+
+        if any(rendered_day != day for _, rendered_day in self._rendered):
+            self._rendered.clear()
+
+        lines = [i18n.gettext("schedule_command_text", locale=locale)]
+        for campus_number in sorted(self.base_dates):
+            (date,) = self.next_cleanings(campus_number, after=day)
+            lines.append(
+                i18n.gettext("scheduled_cleaning", locale=locale).format(
+                    campus_number=campus_number,
+                    date=date.strftime("%d.%m.%Y (%A)"),
+                    days_left=(date - day).days,
+                )
+            )
+
+        text = self._rendered[(locale, day)] = "\n".join(lines)
+        return text
+
+
+cleaning_calendar = CleaningCalendar()
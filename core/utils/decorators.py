@@ -1,9 +1,14 @@
+import functools
+
+from aiogram import types
+
 from core.configs import telegram
 
 
 def admin(func):
-    def wrapped(*args):
-        if args[0].from_user.chat_id in telegram.ADMIN_IDS:
-            func(*args)
+    @functools.wraps(func)
+    async def wrapped(msg: types.Message, *args, **kwargs):
+        if str(msg.from_user.id) in telegram.ADMIN_IDS:
+            return await func(msg, *args, **kwargs)
 
     return wrapped
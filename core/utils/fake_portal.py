@@ -0,0 +1,89 @@
+"""
+Local imitation of the dormitory portal for tests and benchmarks.
+
+Set PORTAL_URL=http://localhost:8082 and /rooms is answered from here.
+`add_account` creates an account with its rooms, `expire_sessions` makes
+the next requests log in again. Every request is recorded in `requests`,
+`max_in_flight` is the most requests it has been serving at once.
+"""
+import asyncio
+import itertools
+from typing import Dict, List, Tuple
+
+from aiohttp import web
+
+SESSION_COOKIE = "portal_session"
+
+
+class FakePortalServer:
+    def __init__(self, host: str = "localhost", port: int = 8082, latency: float = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.requests: List[Tuple[str, str]] = []  # (path, login)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._accounts: Dict[str, Tuple[str, List[dict]]] = {}
+        self._sessions: Dict[str, str] = {}  # session id -> login
+        self._session_ids = itertools.count(1)
+        self._runner: web.AppRunner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/login", self._login)
+        self.app.router.add_get("/rooms", self._rooms)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def add_account(self, login: str, password: str, rooms: List[dict]):
+        self._accounts[login] = (password, rooms)
+
+    def expire_sessions(self):
+        self._sessions.clear()
+
+    def sent(self, path: str) -> List[str]:
+        return [login for request_path, login in self.requests if request_path == path]
+
+    async def _serve(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+
+    async def _login(self, request: web.Request) -> web.Response:
+        data = await request.post()
+        login = data.get("login")
+        self.requests.append(("/login", login))
+        await self._serve()
+
+        account = self._accounts.get(login)
+        if account is None or account[0] != data.get("password"):
+            return web.json_response({"error": "wrong login or password"}, status=401)
+        session_id = str(next(self._session_ids))
+        self._sessions[session_id] = login
+        response = web.json_response({"ok": True})
+        response.set_cookie(SESSION_COOKIE, session_id)
+        return response
+
+    async def _rooms(self, request: web.Request) -> web.Response:
+        login = self._sessions.get(request.cookies.get(SESSION_COOKIE))
+        self.requests.append(("/rooms", login))
+        await self._serve()
+
+        if login is None:
+            return web.json_response({"error": "session has expired"}, status=401)
+        return web.json_response({"rooms": self._accounts[login][1]})
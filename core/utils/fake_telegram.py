@@ -0,0 +1,111 @@
+"""
+Local imitation of Telegram Bot API for tests and benchmarks.
+
+Set TELEGRAM_API_SERVER=http://localhost:8081 and the bot sends everything here
+instead of api.telegram.org. Every request is recorded in `FakeTelegramServer.requests`,
+`add_update` queues an update for getUpdates and `post_update` pushes it to a webhook.
+"""
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, List, Tuple
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+class FakeTelegramServer:
+    def __init__(self, host: str = "localhost", port: int = 8081, latency: float = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.requests: List[Tuple[str, Dict[str, str]]] = []
+        self._updates: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._message_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._runner: web.AppRunner = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self._handle)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def make_update(self, **update) -> dict:
+        update.setdefault("update_id", next(self._update_ids))
+        return update
+
+    def add_update(self, **update):
+        self._updates.put_nowait(self.make_update(**update))
+
+    async def post_update(self, webhook_url: str, **update) -> dict:
+        """
+        Sends update to the webhook like telegram does and returns the reply
+        which the bot put into the response
+        """
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                webhook_url, json=self.make_update(**update)
+            ) as response:
+                body = await response.text()
+        try:
+            return json.loads(body)
+        except ValueError:  # telegram gets "ok" if there is no reply in the response
+            return {}
+
+    def sent(self, method: str = "sendMessage") -> List[Dict[str, str]]:
+        return [data for name, data in self.requests if name == method]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = dict(await request.post())
+        self.requests.append((method, data))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response(
+            {"ok": True, "result": await self._result(method, data)}
+        )
+
+    async def _result(self, method: str, data: Dict[str, str]):
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self._get_updates(float(data.get("timeout") or 0))
+        if method == "getWebhookInfo":
+            return {
+                "url": "",
+                "has_custom_certificate": False,
+                "pending_update_count": 0,
+            }
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            return {
+                "message_id": int(data.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(data.get("chat_id") or 0), "type": "private"},
+                "from": BOT_USER,
+                "text": data.get("text", ""),
+            }
+        return True
+
+    async def _get_updates(self, timeout: float) -> List[dict]:
+        try:
+            updates = [await asyncio.wait_for(self._updates.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
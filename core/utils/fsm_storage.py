@@ -0,0 +1,113 @@
+import typing
+from contextvars import ContextVar
+
+from aiogram.contrib.fsm_storage.redis import STATE_DATA_KEY, STATE_KEY, RedisStorage2
+from aiogram.utils import json
+
+from core.utils import metrics
+
+# (chat, user, data) which was read together with the last state, until it is used
+_prefetched_data: ContextVar = ContextVar("prefetched_fsm_data", default=None)
+
+Address = typing.Union[str, int, None]
+
+
+class PipelinedRedisStorage(RedisStorage2):
+    """
+    Redis FSM storage which reads state and data of a user in one round trip.
+
+    State filters read the state before a handler runs, so the data is fetched
+    along with it and served from memory to the next `get_data` of the same user.
+    Only the last prefetch is kept, it is served once and dropped on any write,
+    so it neither grows nor outlives the update which has read it.
+    State and data are written together and share one TTL, so abandoned
+    dialogs expire by themselves.
+    """
+
+    def __init__(self, *args, ttl: int = 0, **kwargs):
+        kwargs.setdefault("state_ttl", ttl)
+        kwargs.setdefault("data_ttl", ttl)
+        kwargs.setdefault("bucket_ttl", ttl)
+        super(PipelinedRedisStorage, self).__init__(*args, **kwargs)
+        self.ttl = ttl
+
+    @staticmethod
+    def _take_prefetched(chat, user) -> typing.Optional[dict]:
+        prefetched = _prefetched_data.get()
+        _prefetched_data.set(None)
+        if prefetched is not None and prefetched[:2] == (chat, user):
+            return prefetched[2]
+        return None
+
+    async def get_state(
+        self, *, chat: Address = None, user: Address = None, default=None
+    ) -> typing.Optional[str]:
+        chat, user = self.check_address(chat=chat, user=user)
+        redis = await self.redis()
+        pipe = redis.pipeline()
+        pipe.get(self.generate_key(chat, user, STATE_KEY), encoding="utf8")
+        pipe.get(self.generate_key(chat, user, STATE_DATA_KEY), encoding="utf8")
+        with metrics.redis_latency.time("fsm_get_state"):
+            state, raw_data = await pipe.execute()
+
+        _prefetched_data.set((chat, user, json.loads(raw_data) if raw_data else {}))
+        return state or default
+
+    async def get_data(
+        self, *, chat: Address = None, user: Address = None, default=None
+    ) -> typing.Dict:
+        chat, user = self.check_address(chat=chat, user=user)
+        prefetched = self._take_prefetched(chat, user)
+        if prefetched is not None:
+            return prefetched or default or {}
+
+        with metrics.redis_latency.time("fsm_get_data"):
+            return await super(PipelinedRedisStorage, self).get_data(
+                chat=chat, user=user, default=default
+            )
+
+    async def set_state(
+        self, *, chat: Address = None, user: Address = None, state=None
+    ):
+        chat, user = self.check_address(chat=chat, user=user)
+        _prefetched_data.set(None)
+        state_key = self.generate_key(chat, user, STATE_KEY)
+        redis = await self.redis()
+        pipe = redis.pipeline()
+        if state is None:
+            pipe.delete(state_key)
+        else:
+            pipe.set(state_key, state, expire=self._state_ttl)
+            if self.ttl:  # data lives as long as the state
+                pipe.expire(self.generate_key(chat, user, STATE_DATA_KEY), self.ttl)
+        with metrics.redis_latency.time("fsm_set_state"):
+            await pipe.execute()
+
+    async def set_data(self, *, chat: Address = None, user: Address = None, data=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        data = data or {}
+        _prefetched_data.set(None)
+        redis = await self.redis()
+        pipe = redis.pipeline()
+        pipe.set(
+            self.generate_key(chat, user, STATE_DATA_KEY),
+            json.dumps(data),
+            expire=self._data_ttl,
+        )
+        if self.ttl:
+            pipe.expire(self.generate_key(chat, user, STATE_KEY), self.ttl)
+        with metrics.redis_latency.time("fsm_set_data"):
+            await pipe.execute()
+
+    async def reset_state(
+        self, *, chat: Address = None, user: Address = None, with_data=True
+    ):
+        chat, user = self.check_address(chat=chat, user=user)
+        _prefetched_data.set(None)
+        keys = [self.generate_key(chat, user, STATE_KEY)]
+        if with_data:
+            keys.append(self.generate_key(chat, user, STATE_DATA_KEY))
+
+        redis = await self.redis()
+        with metrics.redis_latency.time("fsm_reset_state"):
+            await redis.delete(*keys)
@@ -0,0 +1,23 @@
+import time
+
+from aiogram import Bot
+
+from core.utils import metrics
+
+
+class InstrumentedBot(Bot):
+    """
+    Bot which measures every Bot API request by method
+    """
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super(InstrumentedBot, self).request(
+                method, data, files, **kwargs
+            )
+        except Exception as e:
+            metrics.telegram_errors.inc(method, e.__class__.__name__)
+            raise
+        finally:
+            metrics.telegram_latency.observe(time.perf_counter() - start, method)
@@ -0,0 +1,151 @@
+"""
+Logging of the bot: structured JSON lines, one file per level, written by background threads
+"""
+import logging
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+from loguru import logger
+
+from core.configs import consts, logs
+
+# file name -> levels which go to it, every record goes to exactly one file
+LEVEL_FILES = {
+    "debug": ("DEBUG", "INFO"),
+    "info": ("INFO", "WARNING"),
+    "warn": ("WARNING", "ERROR"),
+    "error": ("ERROR", None),
+}
+
+
+class InterceptHandler(logging.Handler):
+    """
+    Sends records of standard logging (aiogram, apscheduler) to loguru
+    """
+
+    def emit(self, record: logging.LogRecord):
+        level = record.levelname
+        try:
+            logger.level(level)
+        except ValueError:
+            level = record.levelno
+        logger.opt(depth=6, exception=record.exc_info).bind(name=record.name).log(
+            level, record.getMessage()
+        )
+
+
+class Sampler:
+    """
+    Lets through a share of records which are bound with `sampled=True`,
+    the share is set per level. Other records always pass
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        self.rates = rates
+
+    def __call__(self, record) -> bool:
+        if not record["extra"].get("sampled"):
+            return True
+        return random.random() < self.rates.get(record["level"].name, 1.0)
+
+
+class Rotation:
+    """
+    Rotates a file when it grows over `max_bytes` or is older than `max_age` seconds.
+    The age is counted from the creation of the file, so restarts don't reset it
+    """
+
+    CREATED_ATTRIBUTE = b"user.loguru_crtime"  # where loguru keeps it on linux too
+
+    def __init__(self, max_bytes: int, max_age: float):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._file = None
+        self._created_at = 0.0
+
+    @classmethod
+    def created_at(cls, path: str) -> float:
+        """
+        Birth time where the system has it, else the time kept in an extended
+        attribute when the file was created. A file written before without one
+        is as old as its last change
+        """
+        stat = os.stat(path)
+        if hasattr(stat, "st_birthtime"):
+            return stat.st_birthtime
+        try:
+            return float(os.getxattr(path, cls.CREATED_ATTRIBUTE))
+        except (AttributeError, OSError, ValueError):
+            pass
+        if stat.st_size:
+            return stat.st_mtime
+
+        created_at = time.time()
+        try:
+            os.setxattr(path, cls.CREATED_ATTRIBUTE, str(created_at).encode("ascii"))
+        except (AttributeError, OSError):
+            pass
+        return created_at
+
+    def __call__(self, message: str, file) -> bool:
+        if file is not self._file:
+            self._file, self._created_at = file, self.created_at(file.name)
+        if (
+            file.tell() + len(message) > self.max_bytes
+            or time.time() - self._created_at > self.max_age
+        ):
+            self._file = None
+            return True
+        return False
+
+
+def _level_filter(lowest: str, highest: str, sampler: Sampler):
+    lowest_no = logger.level(lowest).no
+    highest_no = logger.level(highest).no if highest else float("inf")
+
+    def level_filter(record) -> bool:
+        return lowest_no <= record["level"].no < highest_no and sampler(record)
+
+    return level_filter
+
+
+def setup(folder: Path = consts.LOGS_FOLDER):
+    logger.remove()
+    sampler = Sampler(logs.LOG_SAMPLING)
+    min_level_no = logger.level(logs.LOG_LEVEL).no
+
+    for name, (lowest, highest) in LEVEL_FILES.items():
+        if highest and logger.level(highest).no <= min_level_no:
+            continue
+        logger.add(
+            folder / f"{name}_logs.json",
+            level=logs.LOG_LEVEL,
+            filter=_level_filter(lowest, highest, sampler),
+            serialize=True,
+            enqueue=True,
+            rotation=Rotation(logs.LOG_ROTATION_SIZE, logs.LOG_ROTATION_AGE),
+            retention=logs.LOG_RETENTION,
+            compression="gz",
+        )
+    logger.add(
+        sys.stdout,
+        format="[{time:YYYY-MM-DD at HH:mm:ss}] {level}: {name} : {message}",
+        level=logs.LOG_STDOUT_LEVEL,
+        filter=sampler,
+        colorize=False,
+        enqueue=True,
+    )
+
+    logging.basicConfig(handlers=[InterceptHandler()], level=logs.LOG_LEVEL)
+    logging.getLogger("aiogram").setLevel(logging.INFO)
+
+
+def close():
+    """
+    Writes out queued records and stops the writer threads
+    """
+    logger.remove()
@@ -0,0 +1,294 @@
+"""
+Latency histograms and counters of the bot in prometheus text format.
+
+Every stage of an update has its own metric: the handler, mongo, redis,
+the job store and Bot API methods. `serve` exposes them over HTTP
+"""
+import functools
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from aiohttp import web
+
+from core.configs import metrics as config
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+
+_registry: List["Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def _check(self, values: Tuple) -> Tuple:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {values}")
+        return values
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join(
+            [
+                f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.type}",
+            ]
+            + self.samples()
+        )
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super(Counter, self).__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        labels = self._check(labels)
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {value}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super(Gauge, self).__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self._values[self._check(labels)] = value
+
+    def inc(self, *labels, amount: float = 1):
+        labels = self._check(labels)
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, labels)} {value}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super(Histogram, self).__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count in every bucket (not cumulative), +Inf bucket, sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        labels = self._check(labels)
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """
+        Observes duration of the block, even if it raised
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels) -> int:
+        series = self._values.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labels, labels, le=bound)} "
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{self.name}_sum{_format_labels(self.labels, labels)} {series[-1]}"
+            )
+            lines.append(
+                f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}"
+            )
+        return lines
+
+
+def timed(histogram: Histogram, *labels):
+    """
+    Decorator for coroutine functions, labels default to the function name
+    """
+
+    def decorator(func):
+        func_labels = labels or (func.__name__,)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with histogram.time(*func_labels):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+update_latency = Histogram("bot_update_seconds", "Time to process an update")
+handler_latency = Histogram(
+    "bot_handler_seconds", "Time spent in a handler", ("handler", "event")
+)
+handler_errors = Counter(
+    "bot_handler_errors_total", "Exceptions raised by handlers", ("error",)
+)
+mongo_latency = Histogram("bot_mongo_seconds", "Mongo operations", ("operation",))
+redis_latency = Histogram("bot_redis_seconds", "Redis operations", ("operation",))
+jobstore_latency = Histogram(
+    "bot_jobstore_seconds", "Job store reads and writes to redis", ("operation",)
+)
+jobstore_changes = Counter(
+    "bot_jobstore_changes_total", "Jobs added, updated or removed", ("operation",)
+)
+telegram_latency = Histogram("bot_telegram_seconds", "Bot API requests", ("method",))
+telegram_errors = Counter(
+    "bot_telegram_errors_total", "Failed Bot API requests", ("method", "error")
+)
+outbound_depth = Gauge(
+    "bot_outbound_queue_depth", "Messages waiting to be sent", ("lane",)
+)
+outbound_sent = Counter("bot_outbound_sent_total", "Messages sent", ("lane",))
+outbound_wait = Histogram(
+    "bot_outbound_wait_seconds", "Time a message spent in the queue", ("lane",)
+)
+outbound_retries = Counter(
+    "bot_outbound_retry_after_total", "Flood limit errors from telegram", ("lane",)
+)
+throttled_updates = Counter(
+    "bot_throttled_updates_total", "Updates dropped by the anti-flood", ("action",)
+)
+duplicate_updates = Counter(
+    "bot_duplicate_updates_total", "Updates dropped as already processed", ("source",)
+)
+portal_latency = Histogram("bot_portal_seconds", "Portal requests", ("path",))
+portal_errors = Counter(
+    "bot_portal_errors_total", "Failed portal requests", ("path", "error")
+)
+portal_cache = Counter(
+    "bot_portal_cache_total", "Reads of portal data by the bot", ("result",)
+)
+locale_cache = Counter(
+    "bot_locale_cache_total", "Reads of user locales by the bot", ("result",)
+)
+component_warmup = Gauge(
+    "bot_component_warmup_seconds", "Time a component took to start", ("component",)
+)
+ready = Gauge("bot_ready", "1 when every component has started")
+
+# returns (is ready, details), set by the application
+readiness_probe: Callable[[], Tuple[bool, dict]] = None
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def _handle_ready(request: web.Request) -> web.Response:
+    if readiness_probe is None:
+        return web.json_response({"state": "unknown"}, status=503)
+    is_ready, details = readiness_probe()
+    return web.json_response(details, status=200 if is_ready else 503)
+
+
+_runner: web.AppRunner = None
+
+
+async def serve(
+    host: str = config.METRICS_HOST,
+    port: int = config.METRICS_PORT,
+    path: str = config.METRICS_PATH,
+    ready_path: str = config.METRICS_READY_PATH,
+):
+    """
+    Starts HTTP endpoint for prometheus and the readiness check on the current event loop
+    """
+    global _runner
+    if _runner is not None:
+        return
+
+    app = web.Application()
+    app.router.add_get(path, _handle)
+    app.router.add_get(ready_path, _handle_ready)
+    _runner = web.AppRunner(app)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+
+
+async def close():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -1,18 +1,63 @@
-import logging
-from typing import Any, Tuple
+from typing import Any, Dict, Iterable, Optional, Tuple
 
-from aiogram import Dispatcher, types
+from aiogram import types
 from aiogram.contrib.middlewares.i18n import I18nMiddleware
 
+from core.configs import consts
 from core.configs.locales import DEFAULT_USER_LOCALE, LANGUAGES
-from core.database.db_worker import get_user
+from core.database.db_worker import get_user_fields, get_users_locales
+from core.utils import metrics
+from core.utils.cache import MISSING, TTLCache
 
 
 class ACLMiddleware(I18nMiddleware):
     def __init__(self, domain, path=None, default=DEFAULT_USER_LOCALE):
 
         super(ACLMiddleware, self).__init__(domain, path, default)
-        self.cache = {}
+        self.cache = TTLCache(
+            maxsize=consts.locale_cache_size, ttl=consts.locale_cache_ttl
+        )
+
+    async def get_stored_locale(self, user_id: int) -> Optional[str]:
+        """
+        Locale which user has chosen, cached in front of DB.
+        None if user has not chosen any
+        """
+        locale = self.cache.get(user_id)
+        if locale is MISSING:
+            metrics.locale_cache.inc("miss")
+            user = await get_user_fields(user_id, "locale")
+            locale = user.get("locale") if user else None
+            self.cache.set(user_id, locale)
+        else:
+            metrics.locale_cache.inc("hit")
+        return locale
+
+    async def get_stored_locales(
+        self, user_ids: Iterable[int]
+    ) -> Dict[int, Optional[str]]:
+        """
+        Same as get_stored_locale for many users, missed ones are read in one query
+        """
+        locales, missed = {}, []
+        for user_id in user_ids:
+            locale = self.cache.get(user_id)
+            if locale is MISSING:
+                missed.append(user_id)
+            else:
+                locales[user_id] = locale
+
+        metrics.locale_cache.inc("hit", amount=len(locales))
+        if missed:
+            metrics.locale_cache.inc("miss", amount=len(missed))
+            stored = await get_users_locales(missed)
+            for user_id in missed:
+                locales[user_id] = stored.get(user_id)
+                self.cache.set(user_id, locales[user_id])
+        return locales
+
+    def invalidate_user_locale(self, user_id: int):
+        self.cache.invalidate(user_id)
 
     async def get_user_locale(
         self, action: str, args: Tuple[Any], user_id: int = None
@@ -25,15 +70,14 @@ class ACLMiddleware(I18nMiddleware):
         :return:
         """
         if user_id is not None:
-            user = await get_user(user_id)
-            return user.locale if user.locale else self.default
+            return await self.get_stored_locale(user_id) or self.default
 
         tg_user = types.User.get_current()
         super_locale = await super().get_user_locale(action, args)
-        user = await get_user(tg_user.id)
+        locale = await self.get_stored_locale(tg_user.id)
 
-        if user.locale is not None:  # if user set his locale
-            return user.locale
+        if locale is not None:  # if user set his locale
+            return locale
         else:
             if tg_user.locale in LANGUAGES:
                 return tg_user.locale
@@ -0,0 +1,95 @@
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from loguru import logger
+
+from core.configs import consts, telegram
+from core.database import redis_worker
+from core.utils import metrics
+
+
+class UpdateWindow:
+    """
+    Update ids seen recently, one bit per id in a ring of `size` bits.
+
+    Telegram numbers updates in increasing order, so only the last `size` ids
+    are remembered and anything older is taken as already processed
+    """
+
+    def __init__(self, size: int = consts.dedup_window_size):
+        self.size = size
+        self._bits = bytearray((size + 7) // 8)
+        self._highest: int = None
+
+    def _flip(self, update_id: int, value: bool):
+        index, bit = divmod(update_id % self.size, 8)
+        if value:
+            self._bits[index] |= 1 << bit
+        else:
+            self._bits[index] &= ~(1 << bit) & 0xFF
+
+    def _is_set(self, update_id: int) -> bool:
+        index, bit = divmod(update_id % self.size, 8)
+        return bool(self._bits[index] & (1 << bit))
+
+    def add(self, update_id: int) -> bool:
+        """
+        Remembers the update. Returns False if it has been seen already
+        """
+        if self._highest is None:
+            self._highest = update_id
+        elif update_id > self._highest:
+            if update_id - self._highest >= self.size:
+                self._bits = bytearray(len(self._bits))
+            else:  # forget ids which leave the window
+                for stale_id in range(self._highest + 1, update_id + 1):
+                    self._flip(stale_id, False)
+            self._highest = update_id
+        elif update_id <= self._highest - self.size:
+            return False
+
+        if self._is_set(update_id):
+            return False
+        self._flip(update_id, True)
+        return True
+
+
+class DeduplicationMiddleware(BaseMiddleware):
+    """
+    Drops updates which have been processed already: webhook retries
+    or updates delivered to several workers.
+
+    Every update is checked in the in-process window first. With `shared`
+    it is then claimed in redis for consts.dedup_ttl seconds,
+    so only one worker processes it. If redis is down, updates are let through
+    """
+
+    def __init__(self, shared: bool = telegram.UPDATES_DEDUP_SHARED):
+        super(DeduplicationMiddleware, self).__init__()
+        self.shared = shared
+        self.window = UpdateWindow()
+
+    async def _claim(self, update_id: int) -> bool:
+        try:
+            redis = await redis_worker.get_redis()
+            return await redis.set(
+                consts.dedup_key_format.format(update_id=update_id),
+                1,
+                expire=consts.dedup_ttl,
+                exist=redis.SET_IF_NOT_EXIST,
+            )
+        except Exception:
+            logger.exception(f"Update {update_id} is not deduplicated in redis")
+            return True
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        if not self.window.add(update.update_id):
+            metrics.duplicate_updates.inc("local")
+            raise CancelHandler()
+        if self.shared and not await self._claim(update.update_id):
+            metrics.duplicate_updates.inc("redis")
+            raise CancelHandler()
+
+
+def on_startup(dp: Dispatcher):
+    dp.middleware.setup(DeduplicationMiddleware())
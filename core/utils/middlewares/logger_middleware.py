@@ -1,16 +1,16 @@
-import logging
 import time
 
 from aiogram import Dispatcher, types
 from aiogram.dispatcher.middlewares import BaseMiddleware
+from loguru import logger as loguru_logger
 
 HANDLED_STR = ["Unhandled", "Handled"]
 
 
 class LoggingMiddleware(BaseMiddleware):
     def __init__(self, logger=None):
-        if not isinstance(logger, logging.Logger):
-            logger = logging.getLogger(self.__class__.__name__)
+        if logger is None:
+            logger = loguru_logger.bind(name=self.__class__.__name__)
 
         self.logger = logger
 
@@ -30,14 +30,18 @@ class LoggingMiddleware(BaseMiddleware):
     async def on_post_process_update(self, update: types.Update, result, data: dict):
         timeout = self.check_timeout(update)
         if timeout > 0:
-            self.logger.info(
-                f"Process update [ID:{update.update_id}]: [success] (in {timeout} ms)"
-            )
+            self.logger.bind(
+                sampled=True, update_id=update.update_id, duration_ms=timeout
+            ).info("Processed update")
 
     async def on_pre_process_message(self, message: types.Message, data: dict):
-        self.logger.info(
-            f'Received message [TEXT: "{message.text}"] in chat [{message.from_user.first_name} {message.from_user.username} {message.from_user.id}]'
-        )
+        self.logger.bind(
+            sampled=True,
+            chat_id=message.chat.id,
+            user_id=message.from_user.id,
+            username=message.from_user.username,
+            text=message.text,
+        ).debug("Received message")
 
     async def on_post_process_message(
         self, message: types.Message, results, data: dict
@@ -123,11 +127,13 @@ class LoggingMiddleware(BaseMiddleware):
         self, callback_query: types.CallbackQuery, data: dict
     ):
         if callback_query.message:
-            self.logger.info(
-                f"Received callback query [DATA:{callback_query.data}] "
-                f"in chat [{callback_query.message.chat.type}:{callback_query.message.chat.id}] "
-                f"from user [USERNAME:{callback_query.from_user.username}]"
-            )
+            self.logger.bind(
+                sampled=True,
+                chat_id=callback_query.message.chat.id,
+                user_id=callback_query.from_user.id,
+                username=callback_query.from_user.username,
+                data=callback_query.data,
+            ).debug("Received callback query")
 
     async def on_post_process_callback_query(self, callback_query, results, data: dict):
         pass
@@ -178,9 +184,9 @@ class LoggingMiddleware(BaseMiddleware):
     async def on_pre_process_error(self, update: types.Update, error, data: dict):
         timeout = self.check_timeout(update)
         if timeout > 0:
-            self.logger.info(
-                f"Process update [ID:{update.update_id}, NAME:{update.__class__.__name__}]: [failed] (in {timeout} ms)"
-            )
+            self.logger.bind(
+                update_id=update.update_id, duration_ms=timeout, error=repr(error)
+            ).warning("Failed to process update")
 
 
 def on_startup(dp: Dispatcher):
@@ -0,0 +1,47 @@
+import time
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from core.utils import metrics
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Measures processing time of every update and of the handler which took it.
+
+    `process_*` is triggered right before a handler is called and
+    `post_process_*` after it, so the difference is the handler time
+    """
+
+    async def trigger(self, action: str, args):
+        if action == "pre_process_update":
+            update, data = args
+            update.conf["_metrics_start"] = time.perf_counter()
+        elif action == "post_process_update":
+            update, results, data = args
+            start = update.conf.pop("_metrics_start", None)
+            if start is not None:
+                metrics.update_latency.observe(time.perf_counter() - start)
+        elif action == "pre_process_error":
+            update, error, data = args
+            metrics.handler_errors.inc(error.__class__.__name__)
+        elif action.startswith("process_"):
+            *_, data = args
+            handler = current_handler.get()
+            data["_metrics_handler"] = getattr(handler, "__name__", repr(handler))
+            data["_metrics_handler_start"] = time.perf_counter()
+        elif action.startswith("post_process_"):
+            *_, data = args
+            start = data.pop("_metrics_handler_start", None)
+            if start is not None:
+                metrics.handler_latency.observe(
+                    time.perf_counter() - start,
+                    data.pop("_metrics_handler"),
+                    action[len("post_process_") :],
+                )
+
+
+def on_startup(dp: Dispatcher):
+    dp.middleware.setup(MetricsMiddleware())
@@ -0,0 +1,113 @@
+from typing import Dict, Optional, Tuple
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiogram.utils.exceptions import TelegramAPIError
+from loguru import logger
+
+from core.configs import consts, telegram
+from core.database import redis_worker
+from core.utils import metrics
+from core.utils.cache import MISSING, TTLCache
+from core.utils.rate_limit import TokenBucket, take_shared
+
+
+def update_action(update: types.Update) -> Tuple[Optional[int], str]:
+    """
+    User and what the update asks for: the command of a message or
+    the prefix of callback data, which is what handlers are chosen by
+    """
+    if update.message:
+        message = update.message
+        command = message.get_command(pure=True) if message.is_command() else None
+        return message.from_user.id, (command or "message").lower()
+    if update.callback_query:
+        query = update.callback_query
+        return query.from_user.id, (query.data or "callback").split(":")[0]
+    return None, ""
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Token buckets per user and per (user, action), checked before anything
+    reads mongo or redis, so a user tapping a button over and over costs nothing.
+
+    Every user has consts.throttle_user_limit, actions listed in
+    consts.throttle_limits are limited on their own. An excess message is dropped,
+    an excess callback query is only answered so its button stops loading.
+    With `shared` buckets live in redis and limit the user across all workers,
+    while redis is unavailable the buckets of the process are used
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, float]] = None,
+        user_limit: Tuple[float, float] = consts.throttle_user_limit,
+        shared: bool = telegram.THROTTLE_SHARED,
+    ):
+        super(ThrottlingMiddleware, self).__init__()
+        self.limits = consts.throttle_limits if limits is None else limits
+        self.user_limit = user_limit
+        self.shared = shared
+        self._buckets = TTLCache(
+            maxsize=consts.throttle_buckets, ttl=consts.throttle_bucket_ttl
+        )
+
+    def _buckets_of(
+        self, user_id: int, action: str
+    ) -> Dict[tuple, Tuple[float, float]]:
+        buckets = {(user_id,): self.user_limit}
+        if action in self.limits:
+            buckets[(user_id, action)] = self.limits[action]
+        return buckets
+
+    def _take_local(self, buckets: Dict[tuple, Tuple[float, float]]) -> bool:
+        local = []
+        for key, (rate, capacity) in buckets.items():
+            bucket = self._buckets.get(key)
+            if bucket is MISSING:
+                bucket = TokenBucket(rate, capacity)
+            self._buckets.set(key, bucket)
+            local.append(bucket)
+
+        if any(bucket.delay() > 0 for bucket in local):
+            return False
+        for bucket in local:
+            bucket.try_acquire()
+        return True
+
+    async def _take(self, user_id: int, action: str) -> bool:
+        buckets = self._buckets_of(user_id, action)
+        if self.shared:
+            try:
+                redis = await redis_worker.get_redis()
+                return await take_shared(
+                    redis,
+                    {
+                        consts.throttle_key_format.format(
+                            key=":".join(map(str, key))
+                        ): limit
+                        for key, limit in buckets.items()
+                    },
+                )
+            except Exception:
+                logger.exception("Shared throttling is unavailable, local is used")
+        return self._take_local(buckets)
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        user_id, action = update_action(update)
+        if user_id is None or await self._take(user_id, action):
+            return
+
+        metrics.throttled_updates.inc(action if action in self.limits else "other")
+        if update.callback_query:
+            try:
+                await update.callback_query.answer()
+            except TelegramAPIError:
+                pass
+        raise CancelHandler()
+
+
+def on_startup(dp: Dispatcher):
+    dp.middleware.setup(ThrottlingMiddleware())
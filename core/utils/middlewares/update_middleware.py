@@ -1,12 +1,12 @@
 from aiogram import Dispatcher, types
 from aiogram.dispatcher.middlewares import BaseMiddleware
 
-from core.database.db_worker import update_user
+from core.database.profile_sync import profile_sync
 
 
 class UpdateUserMiddleware(BaseMiddleware):
     async def on_pre_process_message(self, message: types.Message, data: dict):
-        await update_user(
+        await profile_sync.sync(
             chat_id=message.from_user.id,
             first_name=message.from_user.first_name,
             last_name=message.from_user.last_name,
@@ -17,7 +17,7 @@ class UpdateUserMiddleware(BaseMiddleware):
         self, callback_query: types.CallbackQuery, data: dict
     ):
         if callback_query.message and callback_query.message.from_user:
-            await update_user(
+            await profile_sync.sync(
                 chat_id=callback_query.from_user.id,
                 first_name=callback_query.from_user.first_name,
                 last_name=callback_query.from_user.last_name,
@@ -0,0 +1,343 @@
+"""
+Queue for everything the bot sends to users.
+
+Messages wait in one priority queue: replies to users go first, then reminders,
+then broadcasts. Before a message is sent it takes a token of its chat and
+a global token, so telegram limits are kept however many messages are queued.
+Messages of one chat are sent one at a time and in order, a flood error
+pauses the chat and the message is sent again before the rest of the chat.
+"""
+import asyncio
+import enum
+import itertools
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterable, List, Tuple
+
+from aiogram import types
+from aiogram.bot import api
+from aiogram.utils.exceptions import RetryAfter
+from loguru import logger
+
+from core.configs import consts
+from core.utils import metrics
+from core.utils.cache import MISSING, TTLCache
+from core.utils.instrumented_bot import InstrumentedBot
+from core.utils.rate_limit import TokenBucket
+
+QUEUED_PREFIXES = ("send", "edit", "forward")
+
+
+class Priority(enum.IntEnum):
+    INTERACTIVE = 0
+    REMINDER = 1
+    BROADCAST = 2
+
+
+_priority: ContextVar = ContextVar("outbound_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def lane(priority: Priority):
+    """
+    Messages sent inside the block (and by tasks started in it) get this priority
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Item:
+    __slots__ = (
+        "priority",
+        "seq",
+        "chat_id",
+        "method",
+        "data",
+        "files",
+        "kwargs",
+        "future",
+        "queued_at",
+        "attempts",
+    )
+
+    def __init__(self, priority, seq, chat_id, method, data, files, kwargs, future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.method = method
+        self.data = data
+        self.files = files
+        self.kwargs = kwargs
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.attempts = 0
+
+    def __lt__(self, other: "_Item") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundQueue:
+    def __init__(
+        self,
+        request: Callable,
+        global_rate: float = consts.outbound_global_rate,
+        chat_rate: float = consts.outbound_chat_rate,
+        chat_burst: float = consts.outbound_chat_burst,
+        max_in_flight: int = consts.outbound_max_in_flight,
+        max_retries: int = consts.outbound_max_retries,
+    ):
+        self.request = request
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate)
+
+        self._chat_buckets = TTLCache(
+            maxsize=consts.outbound_chat_buckets, ttl=chat_burst / chat_rate
+        )
+        # messages of chats waiting for their limit or for the message being sent
+        # to them, to keep the order inside a chat. Only the first of them is
+        # put back into the queue, by the wake-up of its chat or when the chat
+        # is sent to, and it is remembered as released until it is taken
+        self._held: Dict[object, Deque[_Item]] = {}
+        self._wakeups: Dict[object, asyncio.TimerHandle] = {}
+        self._released: Dict[object, _Item] = {}
+        self._chats_sending = set()
+        self._seq = itertools.count()
+        self._queue: asyncio.PriorityQueue = None
+        self._in_flight: asyncio.Semaphore = None
+        self._max_in_flight = max_in_flight
+        self._sending = 0
+        self._worker: asyncio.Task = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None
+
+    def accepts(self, method: str) -> bool:
+        return self.is_running and method.startswith(QUEUED_PREFIXES)
+
+    def start(self):
+        if self.is_running:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._in_flight = asyncio.Semaphore(self._max_in_flight)
+        self._worker = asyncio.ensure_future(self._work())
+
+    def _enqueue(self, method: str, data: dict = None, files=None, **kwargs):
+        future = asyncio.get_event_loop().create_future()
+        chat_id = (data or {}).get("chat_id")
+        item = _Item(
+            _priority.get(),
+            next(self._seq),
+            chat_id,
+            method,
+            data,
+            files,
+            kwargs,
+            future,
+        )
+        self._put(item)
+        return future
+
+    async def submit(self, method: str, data: dict = None, files=None, **kwargs):
+        return await self._enqueue(method, data, files, **kwargs)
+
+    async def submit_many(self, method: str, payloads: List[dict]) -> list:
+        """
+        Queues all payloads at once, results or exceptions are in the same order
+        """
+        futures = [self._enqueue(method, data) for data in payloads]
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    def _put(self, item: _Item):
+        metrics.outbound_depth.inc(item.priority.name.lower())
+        self._queue.put_nowait(item)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is MISSING:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+        self._chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    def _chat_delay(self, chat_id) -> float:
+        if chat_id is None:  # inline messages are limited only globally
+            return 0.0
+        bucket = self._chat_bucket(chat_id)
+        if bucket.try_acquire():
+            return 0.0
+        return bucket.delay()
+
+    def _release(self, chat_id):
+        """
+        Puts the first held message of the chat back into the queue
+        """
+        self._wakeups.pop(chat_id, None)
+        held = self._held.get(chat_id)
+        if held and self._released.get(chat_id) is not held[0]:
+            self._released[chat_id] = held[0]
+            self._queue.put_nowait(held[0])
+
+    def _wake_up_later(self, chat_id, delay: float):
+        """
+        One wake-up per chat, a new one replaces the one which is scheduled
+        """
+        wakeup = self._wakeups.pop(chat_id, None)
+        if wakeup is not None:
+            wakeup.cancel()
+        self._wakeups[chat_id] = asyncio.get_event_loop().call_later(
+            delay, self._release, chat_id
+        )
+
+    async def _work(self):
+        while True:
+            item = await self._queue.get()
+            chat_id = item.chat_id
+            held = self._held.get(chat_id)
+            if held is not None:
+                if self._released.get(chat_id) is not item:
+                    if item not in held:  # earlier message of this chat is waiting
+                        held.append(item)
+                    continue
+                del self._released[chat_id]
+                if held[0] is not item:  # a retried message has gone ahead of it
+                    continue
+
+            if chat_id in self._chats_sending:  # released when that one is sent
+                if held is None:
+                    self._held[chat_id] = deque([item])
+                continue
+
+            delay = self._chat_delay(chat_id)
+            if delay > 0:
+                if held is None:
+                    self._held[chat_id] = deque([item])
+                self._wake_up_later(chat_id, delay)
+                continue
+
+            if held is not None:
+                held.popleft()
+                if not held:
+                    del self._held[chat_id]
+
+            await self.global_bucket.acquire()
+            await self._in_flight.acquire()
+            self._sending += 1
+            if chat_id is not None:
+                self._chats_sending.add(chat_id)
+            asyncio.ensure_future(self._send(item))
+
+    async def _send(self, item: _Item):
+        lane_name = item.priority.name.lower()
+        try:
+            item.attempts += 1
+            result = await self.request(
+                item.method, item.data, item.files, **item.kwargs
+            )
+        except RetryAfter as e:
+            metrics.outbound_retries.inc(lane_name)
+            if item.attempts > self.max_retries:
+                metrics.outbound_depth.dec(lane_name)
+                if not item.future.done():
+                    item.future.set_exception(e)
+                return
+            logger.warning(f"Chat {item.chat_id} is flood limited for {e.timeout} s")
+            # the chat is paused: what comes next for it is held behind this message
+            self._held.setdefault(item.chat_id, deque()).appendleft(item)
+            self._wake_up_later(item.chat_id, e.timeout)
+        except Exception as e:
+            metrics.outbound_depth.dec(lane_name)
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            metrics.outbound_depth.dec(lane_name)
+            metrics.outbound_sent.inc(lane_name)
+            metrics.outbound_wait.observe(time.monotonic() - item.queued_at, lane_name)
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            self._sending -= 1
+            self._in_flight.release()
+            self._chats_sending.discard(item.chat_id)
+            if item.chat_id not in self._wakeups:  # not paused by a flood error
+                self._release(item.chat_id)
+
+    def _is_idle(self) -> bool:
+        return self._queue.empty() and not self._held and not self._sending
+
+    async def close(self, timeout: float = consts.outbound_drain_timeout):
+        """
+        Sends what is queued for `timeout` seconds, the rest is cancelled
+        """
+        if not self.is_running:
+            return
+        deadline = time.monotonic() + timeout
+        while not self._is_idle() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        self._worker.cancel()
+        self._worker = None
+        for wakeup in self._wakeups.values():
+            wakeup.cancel()
+        self._wakeups.clear()
+        pending = [self._queue.get_nowait() for _ in range(self._queue.qsize())]
+        for held in self._held.values():
+            pending.extend(item for item in held if item not in pending)
+        self._held.clear()
+        self._released.clear()
+        self._chats_sending.clear()
+        for item in pending:
+            metrics.outbound_depth.dec(item.priority.name.lower())
+            item.future.cancel()
+        if pending:
+            logger.warning(f"{len(pending)} outgoing messages are dropped on shutdown")
+
+
+class OutboundBot(InstrumentedBot):
+    """
+    Bot whose messages go through OutboundQueue once it is started
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(OutboundBot, self).__init__(*args, **kwargs)
+        self.outbound = OutboundQueue(self._request)
+
+    async def _request(self, method, data=None, files=None, **kwargs):
+        return await super(OutboundBot, self).request(method, data, files, **kwargs)
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        if self.outbound.accepts(method):
+            return await self.outbound.submit(method, data, files, **kwargs)
+        return await self._request(method, data, files, **kwargs)
+
+    async def send_messages(self, messages: Iterable[Tuple[int, str]]) -> list:
+        """
+        Sends (chat_id, text) pairs as one batch.
+        Returns sent Message or exception for every pair
+        """
+        payloads = []
+        for chat_id, text in messages:
+            payload = {"chat_id": chat_id, "text": text}
+            if self.parse_mode:
+                payload["parse_mode"] = self.parse_mode
+            payloads.append(payload)
+
+        if self.outbound.is_running:
+            results = await self.outbound.submit_many(
+                api.Methods.SEND_MESSAGE, payloads
+            )
+        else:
+            results = await asyncio.gather(
+                *[self._request(api.Methods.SEND_MESSAGE, data) for data in payloads],
+                return_exceptions=True,
+            )
+        return [
+            result if isinstance(result, BaseException) else types.Message(**result)
+            for result in results
+        ]
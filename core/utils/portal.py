@@ -0,0 +1,198 @@
+"""
+Client of the dormitory portal, which knows the rooms of a user and their cleanings.
+
+All requests go through one aiohttp session with a pool of
+config.PORTAL_MAX_CONNECTIONS connections, at most config.PORTAL_MAX_CONCURRENCY
+users are served at once and the rest wait. The session cookie of every account
+is kept and reused until the portal rejects it, the bot logs in again then.
+
+Rooms are cached per account, that is per login and a hash of the password,
+so a changed password is never answered from the cache: up to consts.portal_refresh_after old they are
+returned as they are, older ones are returned too while a refresh runs
+in the background, so a command waits for the portal only the first time.
+Concurrent reads of one account share one request. An account which the portal
+rejects is dropped from the cache.
+
+The portal is expected to answer:
+    POST /login     form with login and password, sets the session cookie, 401 if wrong
+    GET  /rooms     {"rooms": [{"number": "101", "campus": 1, "cleanings": ["2019-05-08"]}]},
+                    401 if the session has expired
+"""
+import asyncio
+import hashlib
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+from loguru import logger
+
+from core.configs import consts
+from core.configs import portal as config
+from core.utils import metrics
+from core.utils.cache import MISSING, TTLCache
+
+Rooms = List[dict]
+
+
+class PortalError(Exception):
+    pass
+
+
+class PortalAuthError(PortalError):
+    """
+    The portal doesn't accept the login and password
+    """
+
+
+def _account(login: str, password: str) -> str:
+    """
+    Key of the account in the caches, the password itself is not kept
+    """
+    return f"{login}:{hashlib.sha256(password.encode()).hexdigest()}"
+
+
+class PortalClient:
+    def __init__(
+        self,
+        url: str = config.PORTAL_URL,
+        max_connections: int = config.PORTAL_MAX_CONNECTIONS,
+        max_concurrency: int = config.PORTAL_MAX_CONCURRENCY,
+        timeout: float = config.PORTAL_TIMEOUT,
+    ):
+        self.url = url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.rooms = TTLCache(
+            maxsize=consts.portal_cache_size, ttl=consts.portal_cache_ttl
+        )  # account -> (fetched at, rooms)
+        self._cookies = TTLCache(
+            maxsize=consts.portal_sessions, ttl=consts.portal_session_ttl
+        )  # account -> cookies of its session
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    async def start(self):
+        # cookies are passed with every request, so accounts never share a jar
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        for future in list(self._in_flight.values()):
+            future.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        logger.info(f"Portal cache stats: {self.rooms.stats()}")
+
+    async def _request(self, method: str, path: str, **kwargs):
+        """
+        Returns status, json body and cookies of the response
+        """
+        with metrics.portal_latency.time(path):
+            try:
+                async with self._session.request(
+                    method, self.url + path, **kwargs
+                ) as response:
+                    body = None
+                    if response.content_type == "application/json":
+                        body = await response.json()
+                    cookies = {
+                        name: morsel.value for name, morsel in response.cookies.items()
+                    }
+                    return response.status, body, cookies
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                metrics.portal_errors.inc(path, e.__class__.__name__)
+                raise PortalError(f"{method} {path} has failed: {e!r}") from e
+
+    async def _login(self, login: str, password: str) -> Dict[str, str]:
+        status, _, cookies = await self._request(
+            "POST", "/login", data={"login": login, "password": password}
+        )
+        if status in (401, 403):
+            account = _account(login, password)
+            self.rooms.invalidate(account)
+            self._cookies.invalidate(account)
+            raise PortalAuthError(f"Portal rejects login {login}")
+        if status != 200:
+            metrics.portal_errors.inc("/login", str(status))
+            raise PortalError(f"Portal answers {status} to login")
+        self._cookies.set(_account(login, password), cookies)
+        return cookies
+
+    async def _get(self, login: str, password: str, path: str):
+        cookies = self._cookies.get(_account(login, password))
+        if cookies is MISSING:
+            cookies = await self._login(login, password)
+        status, body, _ = await self._request("GET", path, cookies=cookies)
+        if status == 401:  # the session has expired
+            self._cookies.invalidate(_account(login, password))
+            cookies = await self._login(login, password)
+            status, body, _ = await self._request("GET", path, cookies=cookies)
+        if status != 200 or body is None:
+            metrics.portal_errors.inc(path, str(status))
+            raise PortalError(f"Portal answers {status} to {path}")
+        return body
+
+    async def _fetch_rooms(self, login: str, password: str) -> Rooms:
+        if self._session is None:
+            raise PortalError("Portal client is not started")
+        async with self._semaphore:
+            body = await self._get(login, password, "/rooms")
+        try:
+            rooms = [
+                {
+                    "number": str(room["number"]),
+                    "campus": room.get("campus"),
+                    "cleanings": sorted(room.get("cleanings") or ()),
+                }
+                for room in body["rooms"]
+            ]
+        except (KeyError, TypeError) as e:
+            raise PortalError(f"Unexpected rooms from the portal: {e!r}") from e
+        self.rooms.set(_account(login, password), (time.monotonic(), rooms))
+        return rooms
+
+    def _refresh(self, login: str, password: str) -> asyncio.Future:
+        account = _account(login, password)
+        future = self._in_flight.get(account)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_rooms(login, password))
+            self._in_flight[account] = future
+
+            def done(_):
+                self._in_flight.pop(account, None)
+                if not future.cancelled() and future.exception() is not None:
+                    logger.warning(
+                        f"Rooms of {login} are not fetched: {future.exception()!r}"
+                    )
+
+            future.add_done_callback(done)
+        return future
+
+    async def get_rooms(self, login: str, password: str) -> Rooms:
+        """
+        Rooms of the account, from the cache if there are any
+        """
+        cached = self.rooms.get(_account(login, password))
+        if cached is MISSING:
+            metrics.portal_cache.inc("miss")
+            # shielded, so a cancelled command doesn't cancel it for everyone
+            return await asyncio.shield(self._refresh(login, password))
+
+        fetched_at, rooms = cached
+        if time.monotonic() - fetched_at > consts.portal_refresh_after:
+            metrics.portal_cache.inc("stale")
+            self._refresh(login, password)
+        else:
+            metrics.portal_cache.inc("hit")
+        return rooms
@@ -0,0 +1,76 @@
+import asyncio
+import time
+from typing import Dict, Tuple
+
+
+class TokenBucket:
+    """
+    Allows `rate` events per second on average with bursts up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1) -> float:
+        """
+        Seconds to wait until `tokens` are available
+        """
+        self._refill()
+        return max(0.0, (tokens - self._tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1):
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+
+
+# KEYS are buckets, ARGV is now and then rate and capacity of every bucket.
+# A token is taken from all buckets or from none of them
+_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local allowed = 1
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate, capacity = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local available = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    tokens[i] = math.min(capacity, available + math.max(0, now - updated_at) * rate)
+    if tokens[i] < 1 then
+        allowed = 0
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate, capacity = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    redis.call('HMSET', key, 'tokens', tokens[i] - allowed, 'updated_at', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return allowed
+"""
+
+
+async def take_shared(redis, buckets: Dict[str, Tuple[float, float]]) -> bool:
+    """
+    Token buckets kept in redis and shared by all processes: key -> (rate, capacity).
+    Takes a token from every bucket if all of them have one, in one round trip
+    """
+    args = [time.time()]
+    for rate, capacity in buckets.values():
+        args.extend((rate, capacity))
+    return bool(await redis.eval(_TAKE_SCRIPT, keys=list(buckets), args=args))
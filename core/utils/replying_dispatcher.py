@@ -0,0 +1,31 @@
+import asyncio
+import itertools
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import BaseResponse
+from loguru import logger
+
+
+class ReplyingDispatcher(Dispatcher):
+    """
+    Dispatcher which waits for the replies returned by handlers in polling mode.
+
+    aiogram sends them with an asyncio.gather nobody awaits, so a reply which
+    has failed is lost silently. In webhook mode a reply goes into the response
+    """
+
+    async def _process_polling_updates(self, updates, fast=True):
+        replies = [
+            response
+            for response in itertools.chain.from_iterable(
+                itertools.chain.from_iterable(await self.process_updates(updates, fast))
+            )
+            if isinstance(response, BaseResponse)
+        ]
+        results = await asyncio.gather(
+            *[reply.execute_response(self.bot) for reply in replies],
+            return_exceptions=True,
+        )
+        for reply, result in zip(replies, results):
+            if isinstance(result, Exception):
+                logger.opt(exception=result).error(f"Reply {reply.method} has failed")
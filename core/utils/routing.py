@@ -0,0 +1,206 @@
+"""
+Routing of updates by dictionary lookups instead of a scan over all handlers.
+
+aiogram checks the filters of every handler in registration order until one passes.
+IndexedHandler keeps the order and the filters, but only for handlers which can
+match at all: handlers are indexed by command, exact text and callback data prefix,
+the ones waiting for other FSM states are skipped without running their filters.
+`install` puts the index in place of the dispatcher's handlers and builds it,
+a handler registered later makes it rebuilt on the next update
+"""
+from typing import AsyncIterator, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.filters import Command, StateFilter, Text
+from aiogram.dispatcher.handler import (
+    CancelHandler,
+    Handler,
+    SkipHandler,
+    _check_spec,
+    ctx_data,
+    current_handler,
+)
+from aiogram.utils.callback_data import CallbackDataFilter
+
+Key = Tuple[str, ...]
+
+_NO_STATE = object()  # of updates without a chat and a user
+
+
+class _Route:
+    __slots__ = ("handler_obj", "keys", "states")
+
+    def __init__(self, handler_obj: Handler.HandlerObj):
+        self.handler_obj = handler_obj
+        self.keys: Optional[Set[Key]] = None  # None if the handler takes any update
+        self.states: Optional[Set[Optional[str]]] = None  # None if in any state
+
+        for filter_obj in handler_obj.filters or ():
+            keys = _filter_keys(filter_obj.filter)
+            if keys is not None:
+                self.keys = (self.keys or set()) | keys
+            if isinstance(filter_obj.filter, StateFilter):
+                if "*" not in filter_obj.filter.states:
+                    self.states = set(filter_obj.filter.states)
+
+
+def _filter_keys(filter_) -> Optional[Set[Key]]:
+    """
+    Keys of updates which can pass the filter, None if it can't be told in advance
+    """
+    if isinstance(filter_, Command):
+        return {
+            ("command", prefix, command.lower())
+            for prefix in filter_.prefixes
+            for command in filter_.commands
+        }
+    if isinstance(filter_, Text) and filter_.equals is not None:
+        if all(isinstance(text, str) for text in filter_.equals):  # not lazy i18n
+            return {("text", text.lower()) for text in filter_.equals}
+    if isinstance(filter_, CallbackDataFilter):
+        return {("callback", filter_.factory.prefix + filter_.factory.sep)}
+    return None
+
+
+def _update_keys(obj, separators: Set[str]) -> Set[Key]:
+    keys = set()
+    if isinstance(obj, types.Message):
+        if obj.text and not obj.text.isspace():
+            command = obj.text.split()[0]
+            keys.add(("command", command[0], command[1:].partition("@")[0].lower()))
+        keys.add(("text", (obj.text or obj.caption or "").lower()))
+    elif isinstance(obj, types.CallbackQuery) and obj.data:
+        for sep in separators:
+            prefix, found, _ = obj.data.partition(sep)
+            if found:
+                keys.add(("callback", prefix + sep))
+    return keys
+
+
+class IndexedHandler(Handler):
+    def __init__(self, dispatcher, once=True, middleware_key=None):
+        super(IndexedHandler, self).__init__(dispatcher, once, middleware_key)
+        self._routes: List[_Route] = None
+        self._known_keys: Set[Key] = set()
+        self._separators: Set[str] = set()
+        self._by_keys: Dict[FrozenSet[Key], List[_Route]] = {}
+
+    @classmethod
+    def from_handler(cls, handler: Handler) -> "IndexedHandler":
+        indexed = cls(handler.dispatcher, handler.once, handler.middleware_key)
+        indexed.handlers = handler.handlers
+        return indexed
+
+    def register(self, handler, filters=None, index=None):
+        super(IndexedHandler, self).register(handler, filters, index)
+        self._routes = None
+
+    def unregister(self, handler):
+        self._routes = None
+        return super(IndexedHandler, self).unregister(handler)
+
+    def build(self):
+        self._routes = [_Route(handler_obj) for handler_obj in self.handlers]
+        self._known_keys = set().union(*(route.keys or () for route in self._routes))
+        self._separators = {
+            key[1][-1] for key in self._known_keys if key[0] == "callback"
+        }
+        self._by_keys.clear()
+
+    async def _state(self, obj):
+        """
+        State of the user, read once per update and shared with StateFilter
+        """
+        try:
+            return StateFilter.ctx_state.get()
+        except LookupError:
+            chat = getattr(getattr(obj, "chat", None), "id", None)
+            user = getattr(getattr(obj, "from_user", None), "id", None)
+            if not chat and not user:
+                return _NO_STATE
+            state = await self.dispatcher.storage.get_state(chat=chat, user=user)
+            StateFilter.ctx_state.set(state)
+            return state
+
+    async def candidates(self, obj) -> AsyncIterator[Handler.HandlerObj]:
+        """
+        Handlers which may take the update, in registration order.
+        The state is read only if a handler waiting for some state comes up
+        """
+        if self._routes is None:
+            self.build()
+        keys = frozenset(_update_keys(obj, self._separators) & self._known_keys)
+        routes = self._by_keys.get(keys)
+        if routes is None:
+            routes = self._by_keys[keys] = [
+                route
+                for route in self._routes
+                if route.keys is None or route.keys & keys
+            ]
+        for route in routes:
+            if route.states is None or await self._state(obj) in route.states:
+                yield route.handler_obj
+
+    async def notify(self, *args):
+        """
+        Same as Handler.notify, but only candidates are checked
+        """
+        from aiogram.dispatcher.filters import FilterNotPassed, check_filters
+
+        results = []
+
+        data = {}
+        ctx_data.set(data)
+
+        if self.middleware_key:
+            try:
+                await self.dispatcher.middleware.trigger(
+                    f"pre_process_{self.middleware_key}", args + (data,)
+                )
+            except CancelHandler:
+                return results
+
+        try:
+            async for handler_obj in self.candidates(args[0]):
+                try:
+                    data.update(await check_filters(handler_obj.filters, args))
+                except FilterNotPassed:
+                    continue
+                else:
+                    ctx_token = current_handler.set(handler_obj.handler)
+                    try:
+                        if self.middleware_key:
+                            await self.dispatcher.middleware.trigger(
+                                f"process_{self.middleware_key}", args + (data,)
+                            )
+                        partial_data = _check_spec(handler_obj.spec, data)
+                        response = await handler_obj.handler(*args, **partial_data)
+                        if response is not None:
+                            results.append(response)
+                        if self.once:
+                            break
+                    except SkipHandler:
+                        continue
+                    except CancelHandler:
+                        break
+                    finally:
+                        current_handler.reset(ctx_token)
+        finally:
+            if self.middleware_key:
+                await self.dispatcher.middleware.trigger(
+                    f"post_process_{self.middleware_key}", args + (results, data)
+                )
+
+        return results
+
+
+def install(dp: Dispatcher):
+    """
+    Routes messages and callback queries of the dispatcher through the index
+    """
+    for attribute in ("message_handlers", "callback_query_handlers"):
+        handler = getattr(dp, attribute)
+        if not isinstance(handler, IndexedHandler):
+            handler = IndexedHandler.from_handler(handler)
+            setattr(dp, attribute, handler)
+        handler.build()
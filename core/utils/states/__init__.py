@@ -1,3 +1,4 @@
 from .choose_language import *
 from .cleaning_reminder import *
+from .import_backup import *
 from .mailing_everyone import *
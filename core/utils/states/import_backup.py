@@ -0,0 +1,5 @@
+from aiogram.dispatcher.filters.state import State, StatesGroup
+
+
+class ImportBackupDialog(StatesGroup):
+    enter_file = State()
@@ -0,0 +1,21 @@
+import asyncio
+import os
+
+import pytest
+
+# configs read the environment on import, nothing here connects anywhere
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("DB_NAME", "hoteluni_bot_test")
+os.environ.setdefault("METRICS_ENABLED", "0")
+
+
+@pytest.fixture
+def run():
+    """
+    Runs a coroutine in a fresh event loop
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop.run_until_complete
+    loop.close()
+    asyncio.set_event_loop(None)
@@ -0,0 +1,34 @@
+from core.app import Application, Component
+
+
+def test_components_stop_before_their_dependencies(run):
+    events = []
+
+    def component(name, depends=()):
+        async def start():
+            events.append(("start", name))
+
+        async def stop():
+            events.append(("stop", name))
+
+        return Component(name, start, stop, depends)
+
+    app = Application(
+        None,
+        [
+            component("mongo"),
+            component("profile_sync", depends=["mongo", "redis"]),
+            component("redis"),
+            component("scheduler"),
+        ],
+    )
+    run(app.startup())
+    assert app.is_ready
+    events.clear()
+    run(app.shutdown())
+    assert [name for _, name in events] == [
+        "scheduler",
+        "profile_sync",
+        "redis",
+        "mongo",
+    ]
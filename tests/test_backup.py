@@ -0,0 +1,73 @@
+import csv
+import io
+
+import pytest
+
+from core.utils.backup import (
+    SECRET_FIELDS,
+    USER_FIELDS,
+    _load_reminders,
+    _parse_record,
+    _read_records,
+    _to_csv_row,
+)
+
+
+def test_reminders_from_ndjson_and_csv_are_the_same():
+    expected = {(1, False): "13:00", (2, True): "09:30"}
+    assert (
+        _load_reminders(
+            [
+                {"campus": 1, "time": "13:00", "day_before": False},
+                {"campus": "2", "time": "9:30", "day_before": True},
+            ]
+        )
+        == expected
+    )
+    assert _load_reminders("1=13:00;2:day_before=9:30") == expected
+    assert _load_reminders("") == _load_reminders(None) == {}
+
+
+@pytest.mark.parametrize(
+    "value", ["7=13:00", "1=25:00", "1", [{"campus": 1, "day_before": False}]]
+)
+def test_bad_reminders_are_rejected(value):
+    with pytest.raises((KeyError, ValueError)):
+        _load_reminders(value)
+
+
+def test_record_from_csv():
+    user, user_reminders = _parse_record(
+        {
+            "chat_id": "42",
+            "first_name": "Ann",
+            "last_name": "",
+            "rooms": "101;;102",
+            "hotel_password": "",
+            "reminders": "3=08:00",
+            "unknown": "dropped",
+        }
+    )
+    assert user == {"chat_id": 42, "first_name": "Ann", "rooms": ["101", "102"]}
+    assert user_reminders == {(3, False): "08:00"}
+
+
+def test_record_without_chat_id_is_rejected():
+    with pytest.raises(KeyError):
+        _parse_record({"first_name": "Ann"})
+
+
+def test_csv_round_trip_without_passwords():
+    fields = tuple(field for field in USER_FIELDS if field not in SECRET_FIELDS)
+    user = {"chat_id": 42, "rooms": ["101"], "hotel_password": "secret"}
+    user_reminders = {(1, False): "13:00", (2, True): "09:30"}
+
+    stream = io.StringIO()
+    writer = csv.DictWriter(stream, fields + ("reminders",))
+    writer.writeheader()
+    writer.writerow(_to_csv_row(user, user_reminders, fields))
+    stream.seek(0)
+
+    (record,) = _read_records(stream, "csv")
+    assert "hotel_password" not in record
+    assert _parse_record(record) == ({"chat_id": 42, "rooms": ["101"]}, user_reminders)
@@ -0,0 +1,28 @@
+import asyncio
+
+from loguru import logger
+
+from core.utils.broadcast import BroadcastEngine
+
+
+def test_failed_campaign_is_logged(run):
+    engine = BroadcastEngine(bot=None)
+
+    async def broken_run():
+        raise ConnectionError("mongo is down")
+
+    engine._run = broken_run
+    errors = []
+    sink = logger.add(errors.append, level="ERROR")
+
+    async def main():
+        engine._run_in_lane()
+        await asyncio.wait([engine._task])
+        await asyncio.sleep(0)  # done callbacks run on the next iteration
+
+    try:
+        run(main())
+    finally:
+        logger.remove(sink)
+    assert not engine.is_running
+    assert len(errors) == 1 and "mongo is down" in errors[0]
@@ -0,0 +1,74 @@
+import datetime
+
+import pytest
+
+from core.configs import consts
+from core.utils.cleaning_calendar import CleaningCalendar
+
+DAY = datetime.timedelta(days=1)
+
+
+def _brute_force(campus_number: int, start: datetime.date, end: datetime.date):
+    base_dates = list(filter(None, consts.base_dates_campus_cleaning[campus_number]))
+    day, days = start, []
+    while day <= end:
+        if any(
+            (day - base).days % consts.cleaning_interval == 0 for base in base_dates
+        ):
+            days.append(day)
+        day += DAY
+    return days
+
+
+@pytest.mark.parametrize("campus_number", sorted(consts.base_dates_campus_cleaning))
+def test_cleanings_match_the_base_dates(campus_number):
+    calendar = CleaningCalendar()
+    start = datetime.date(2019, 3, 1)  # before the base dates too
+    end = start + datetime.timedelta(days=200)
+    assert calendar.cleanings_between(campus_number, start, end) == _brute_force(
+        campus_number, start, end
+    )
+
+
+def test_range_is_inclusive():
+    calendar = CleaningCalendar()
+    day = datetime.date(2019, 4, 19)  # a base date of campus 1
+    assert calendar.cleanings_between(1, day, day) == [day]
+    assert calendar.cleanings_between(1, day + DAY, day + DAY) == []
+
+
+def test_next_cleanings_are_strictly_after():
+    calendar = CleaningCalendar()
+    day = datetime.date(2019, 4, 19)
+    (next_day,) = calendar.next_cleanings(1, after=day)
+    assert next_day > day
+    assert next_day == _brute_force(1, day + DAY, day + 28 * DAY)[0]
+
+
+def test_next_cleanings_past_the_horizon():
+    calendar = CleaningCalendar(horizon_days=30)
+    after = datetime.date(2025, 1, 1)
+    dates = calendar.next_cleanings(2, n=10, after=after)
+    assert dates == _brute_force(2, after + DAY, after + 400 * DAY)[:10]
+
+
+def test_range_longer_than_the_horizon():
+    calendar = CleaningCalendar(horizon_days=30)
+    start = datetime.date(2025, 1, 1)
+    end = start + 200 * DAY
+    assert calendar.cleanings_between(1, start, end) == _brute_force(1, start, end)
+    assert calendar.cleanings_between(3, start, start + 10 * DAY) == _brute_force(
+        3, start, start + 10 * DAY
+    )
+
+
+def test_schedule_is_rendered_once_per_locale_and_day():
+    calendar = CleaningCalendar()
+    day = datetime.date(2019, 4, 19)
+    text = calendar.render_schedule("en", day)
+    assert calendar.render_schedule("en", day) is text
+    assert calendar.render_schedule("ru", day) != text
+    assert len(text.splitlines()) == 1 + len(consts.base_dates_campus_cleaning)
+
+    calendar.render_schedule("en", day + DAY)
+    assert list(calendar._rendered) == [("en", day + DAY)]
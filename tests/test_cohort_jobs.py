@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from apscheduler.jobstores.base import JobLookupError
+
+from core import handlers
+
+SLOT = "09:00"
+JOB_ID = handlers._cohort_job_id(1, SLOT, False)
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.jobs = {}
+
+    def add_job(self, func, trigger, args=None, id=None, replace_existing=False):
+        self.jobs[id] = args
+
+    def remove_job(self, job_id):
+        if self.jobs.pop(job_id, None) is None:
+            raise JobLookupError(job_id)
+
+
+class FakeReminders:
+    """
+    One cohort in memory, every call gives way to other coroutines like redis does
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+
+    async def subscribe(self, chat_id, campus_number, time_slot, is_day_before):
+        await asyncio.sleep(0)
+        self.subscribers.add(chat_id)
+        return []
+
+    async def unsubscribe(self, chat_id, campus_number, is_day_before):
+        await asyncio.sleep(0)
+        self.subscribers.discard(chat_id)
+        return [] if self.subscribers else [SLOT]
+
+    async def get_empty_slots(self, campus_number, time_slots, is_day_before):
+        empty = [] if self.subscribers else list(time_slots)
+        for _ in range(3):  # the answer is on its way back, others go on
+            await asyncio.sleep(0)
+        return empty
+
+
+@pytest.fixture
+def cohort(monkeypatch):
+    scheduler, reminders = FakeScheduler(), FakeReminders()
+    monkeypatch.setattr(handlers, "scheduler", scheduler)
+    monkeypatch.setattr(handlers, "reminders", reminders)
+    return scheduler, reminders
+
+
+def test_subscribe_during_removal_keeps_the_job(run, cohort):
+    scheduler, reminders = cohort
+    time = handlers.datetime.time(9, 0)
+
+    async def main():
+        await handlers.set_cleaning_reminder(1, 1, time, False)
+        emptied = await reminders.unsubscribe(1, 1, False)
+        # the subscription lands while the emptied slot is being checked
+        await asyncio.gather(
+            handlers._remove_cohort_jobs(1, emptied, False),
+            handlers.set_cleaning_reminder(2, 1, time, False),
+        )
+
+    run(main())
+    assert reminders.subscribers == {2}
+    assert JOB_ID in scheduler.jobs
+
+
+def test_emptied_slot_loses_its_job(run, cohort):
+    scheduler, reminders = cohort
+
+    async def main():
+        await handlers.set_cleaning_reminder(1, 1, handlers.datetime.time(9), False)
+        emptied = await reminders.unsubscribe(1, 1, False)
+        await handlers._remove_cohort_jobs(1, emptied, False)
+
+    run(main())
+    assert scheduler.jobs == {}
@@ -0,0 +1,36 @@
+from core.utils.middlewares.dedup_middleware import UpdateWindow
+
+
+def test_repeated_update_is_seen():
+    window = UpdateWindow(size=16)
+    assert window.add(100)
+    assert not window.add(100)
+    assert window.add(101)
+    assert not window.add(101)
+
+
+def test_updates_out_of_order_inside_the_window():
+    window = UpdateWindow(size=16)
+    assert window.add(110)
+    assert window.add(105)  # delivered late, but not seen yet
+    assert not window.add(105)
+    assert window.add(111)
+
+
+def test_updates_older_than_the_window_are_dropped():
+    window = UpdateWindow(size=16)
+    window.add(100)
+    window.add(120)
+    assert not window.add(104)
+    assert window.add(105)
+
+
+def test_ids_leaving_the_window_are_forgotten():
+    window = UpdateWindow(size=16)
+    for update_id in range(100, 110):
+        window.add(update_id)
+    window.add(116)  # ids 101..116 share bits with 117..132
+    assert window.add(117)
+    window.add(200)  # jumps over the whole window
+    assert window.add(190)
+    assert not window.add(200)
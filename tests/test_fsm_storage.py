@@ -0,0 +1,93 @@
+from aiogram.utils import json
+
+from core.utils.fsm_storage import PipelinedRedisStorage, _prefetched_data
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.reads = 0
+
+    async def get(self, key, encoding=None):
+        self.reads += 1
+        return self.values.get(key)
+
+    async def set(self, key, value, expire=0):
+        self.values[key] = value
+
+    async def expire(self, key, timeout):
+        pass
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+        return lambda *args, **kwargs: self.commands.append(method(*args, **kwargs))
+
+    async def execute(self):
+        return [await command for command in self.commands]
+
+
+def _storage(redis: FakeRedis) -> PipelinedRedisStorage:
+    storage = PipelinedRedisStorage()
+
+    async def connection():
+        return redis
+
+    storage.redis = connection
+    return storage
+
+
+def test_prefetched_data_is_served_once(run):
+    redis = FakeRedis()
+    storage = _storage(redis)
+
+    async def main():
+        await storage.set_data(chat=1, data={"campus": 1})
+        await storage.get_state(chat=1)
+        reads = redis.reads
+        assert await storage.get_data(chat=1) == {"campus": 1}
+        assert redis.reads == reads
+        assert _prefetched_data.get() is None
+
+        await storage.get_data(chat=1)
+        assert redis.reads == reads + 1
+
+    run(main())
+
+
+def test_only_the_last_prefetch_is_kept(run):
+    storage = _storage(FakeRedis())
+
+    async def main():
+        for chat in range(100):
+            await storage.get_state(chat=chat)
+        assert _prefetched_data.get() == (99, 99, {})
+
+    run(main())
+
+
+def test_writes_drop_the_prefetched_data(run):
+    redis = FakeRedis()
+    storage = _storage(redis)
+
+    async def main():
+        await storage.set_data(chat=1, data={"campus": 2})
+        await storage.get_state(chat=1)
+        await storage.update_data(chat=1, campus=3)
+        assert _prefetched_data.get() is None
+        assert await storage.get_data(chat=1) == {"campus": 3}
+        assert json.loads(redis.values["fsm:1:1:data"]) == {"campus": 3}
+
+    run(main())
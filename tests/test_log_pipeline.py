@@ -0,0 +1,29 @@
+import os
+import time
+
+from core.utils.log_pipeline import Rotation
+
+
+def test_rotates_by_size(tmp_path):
+    rotation = Rotation(max_bytes=10, max_age=3600)
+    with open(tmp_path / "info_logs.json", "a") as file:
+        assert not rotation("12345", file)
+        file.write("12345")
+        assert rotation("123456", file)
+
+
+def test_new_file_is_not_old(tmp_path):
+    rotation = Rotation(max_bytes=1000, max_age=60)
+    with open(tmp_path / "info_logs.json", "a") as file:
+        assert not rotation("message", file)
+
+
+def test_age_is_counted_from_the_file_not_the_process(tmp_path):
+    path = tmp_path / "info_logs.json"
+    path.write_text("written before the restart\n")
+    hour_ago = time.time() - 3600
+    os.utime(path, (hour_ago, hour_ago))
+
+    with open(path, "a") as file:
+        assert Rotation(max_bytes=1000, max_age=60)("message", file)
+        assert not Rotation(max_bytes=1000, max_age=7200)("message", file)
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+from aiogram.utils.exceptions import RetryAfter
+
+from core.utils.outbound import OutboundQueue
+
+
+class FakeApi:
+    def __init__(self, flood: dict = None, latency: float = 0.01):
+        self.flood = dict(flood or {})  # text -> seconds of RetryAfter, once
+        self.latency = latency
+        self.sent = []  # (text, time)
+        self.started = time.monotonic()
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        text = data["text"]
+        if text in self.flood:
+            raise RetryAfter(self.flood.pop(text))
+        self.sent.append((text, time.monotonic() - self.started))
+        return {"text": text}
+
+
+def _queue(api: FakeApi, **kwargs) -> OutboundQueue:
+    kwargs.setdefault("global_rate", 1000)
+    kwargs.setdefault("chat_rate", 1000)
+    kwargs.setdefault("chat_burst", 1000)
+    queue = OutboundQueue(api.request, **kwargs)
+    queue.start()
+    return queue
+
+
+async def _send_all(queue: OutboundQueue, messages):
+    return await asyncio.gather(
+        *[
+            queue.submit("sendMessage", {"chat_id": chat_id, "text": text})
+            for chat_id, text in messages
+        ]
+    )
+
+
+def test_retry_after_keeps_order_and_sends_once(run):
+    api = FakeApi(flood={"r0": 0.2})
+
+    async def main():
+        queue = _queue(api)
+        await _send_all(queue, [(1, "r0"), (1, "r1"), (1, "r2"), (2, "other")])
+        await queue.close()
+
+    run(main())
+    chat_1 = [text for text, _ in api.sent if text != "other"]
+    assert chat_1 == ["r0", "r1", "r2"]
+    assert [text for text, _ in api.sent].count("other") == 1
+    sent_at = dict(api.sent)
+    assert sent_at["r0"] >= 0.2
+    assert sent_at["other"] < 0.2  # other chats are not paused
+
+
+def test_held_message_is_queued_once(run):
+    api = FakeApi(flood={"r1": 0.1})
+
+    async def main():
+        queue = _queue(api, chat_rate=20, chat_burst=1)
+        await _send_all(queue, [(1, f"r{n}") for n in range(5)])
+        assert not queue._held and not queue._wakeups and not queue._released
+        await queue.close()
+
+    run(main())
+    assert [text for text, _ in api.sent] == [f"r{n}" for n in range(5)]
+
+
+def test_chat_rate_is_kept(run):
+    api = FakeApi(latency=0)
+
+    async def main():
+        queue = _queue(api, chat_rate=10, chat_burst=1)
+        await _send_all(queue, [(1, f"r{n}") for n in range(4)])
+        await queue.close()
+
+    run(main())
+    times = [sent_at for _, sent_at in api.sent]
+    assert all(later - earlier >= 0.08 for earlier, later in zip(times, times[1:]))
+
+
+def test_gives_up_after_max_retries(run):
+    class AlwaysFlooded(FakeApi):
+        async def request(self, method, data=None, files=None, **kwargs):
+            raise RetryAfter(0.01)
+
+    api = AlwaysFlooded()
+
+    async def main():
+        queue = _queue(api, max_retries=2)
+        results = await queue.submit_many(
+            "sendMessage", [{"chat_id": 1, "text": "a"}, {"chat_id": 1, "text": "b"}]
+        )
+        await queue.close()
+        return results
+
+    results = run(main())
+    assert all(isinstance(result, RetryAfter) for result in results)
+
+
+def test_close_cancels_what_is_left(run):
+    api = FakeApi(flood={"r0": 10})
+
+    async def main():
+        queue = _queue(api)
+        futures = [
+            asyncio.ensure_future(
+                queue.submit("sendMessage", {"chat_id": 1, "text": f"r{n}"})
+            )
+            for n in range(3)
+        ]
+        await asyncio.sleep(0.1)
+        await queue.close(timeout=0.1)
+        await asyncio.sleep(0)
+        return futures
+
+    futures = run(main())
+    assert all(future.cancelled() for future in futures)
+    assert api.sent == []
@@ -0,0 +1,94 @@
+import asyncio
+import socket
+
+import pytest
+
+from core.configs import consts
+from core.utils.fake_portal import FakePortalServer
+from core.utils.portal import PortalAuthError, PortalClient
+
+ROOMS = [{"number": 101, "campus": 1, "cleanings": ["2030-01-02", "2020-01-01"]}]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def portal(run):
+    """
+    Fake portal with the account "alice" and a client started against it
+    """
+    server = FakePortalServer(port=_free_port())
+    server.add_account("alice", "secret", ROOMS)
+    client = PortalClient(server.url, max_concurrency=2)
+    run(server.start())
+    run(client.start())
+    yield server, client
+    run(client.close())
+    run(server.close())
+
+
+def test_rooms_are_cached(run, portal):
+    server, client = portal
+    rooms = run(client.get_rooms("alice", "secret"))
+    assert rooms == [
+        {"number": "101", "campus": 1, "cleanings": sorted(ROOMS[0]["cleanings"])}
+    ]
+    assert run(client.get_rooms("alice", "secret")) == rooms
+    assert server.sent("/login") == ["alice"]
+    assert server.sent("/rooms") == ["alice"]
+
+
+def test_wrong_password_is_not_answered_from_cache(run, portal):
+    server, client = portal
+    run(client.get_rooms("alice", "secret"))
+    with pytest.raises(PortalAuthError):
+        run(client.get_rooms("alice", "wrong"))
+    assert server.sent("/login") == ["alice", "alice"]
+
+
+def test_rejected_account_is_dropped(run, portal, monkeypatch):
+    server, client = portal
+    run(client.get_rooms("alice", "secret"))
+    server.add_account("alice", "changed", ROOMS)  # changed on the portal only
+    server.expire_sessions()
+    monkeypatch.setattr(consts, "portal_refresh_after", 0)
+
+    async def main():
+        await client.get_rooms("alice", "secret")  # stale, refreshed in background
+        await asyncio.sleep(0.1)
+
+    run(main())
+    assert client.rooms.stats()["size"] == 0
+    with pytest.raises(PortalAuthError):
+        run(client.get_rooms("alice", "secret"))
+
+
+def test_logs_in_again_after_session_expires(run, portal):
+    server, client = portal
+    run(client.get_rooms("alice", "secret"))
+    server.expire_sessions()
+    client.rooms.clear()
+    run(client.get_rooms("alice", "secret"))
+    assert server.sent("/login") == ["alice", "alice"]
+    assert server.sent("/rooms") == ["alice", None, "alice"]
+
+
+def test_concurrent_reads_share_a_request(run, portal):
+    server, client = portal
+    server.latency = 0.05
+    for n in range(5):
+        server.add_account(f"user{n}", "pw", ROOMS)
+
+    async def main():
+        return await asyncio.gather(
+            *[client.get_rooms(f"user{n}", "pw") for n in range(5)],
+            *[client.get_rooms("user0", "pw") for _ in range(5)],
+        )
+
+    run(main())
+    assert len(server.sent("/rooms")) == 5
+    assert server.max_in_flight <= 2
@@ -0,0 +1,90 @@
+import asyncio
+import types
+
+from core.database import profile_sync as module
+from core.database.profile_sync import ProfileSync
+
+
+class FakeCollection:
+    def __init__(self, failures: int = 0, latency: float = 0):
+        self.failures = failures
+        self.latency = latency
+        self.written = []  # chat ids of every bulk_write
+
+    async def update_one(self, query, update, upsert=False):
+        return types.SimpleNamespace(upserted_id=None)
+
+    async def bulk_write(self, requests, ordered=True):
+        await asyncio.sleep(self.latency)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mongo is down")
+        self.written.append(sorted(request._filter["chat_id"] for request in requests))
+        return types.SimpleNamespace(upserted_count=0)
+
+
+def _patch(monkeypatch, collection: FakeCollection, add_users_failures: int = 0):
+    failures = [add_users_failures]
+
+    async def add_users(count=1):
+        if failures[0]:
+            failures[0] -= 1
+            raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(module, "User", types.SimpleNamespace(collection=collection))
+    monkeypatch.setattr(module.redis_worker, "add_users", add_users)
+
+
+def test_only_changes_are_written(run, monkeypatch):
+    collection = FakeCollection()
+    _patch(monkeypatch, collection)
+    sync = ProfileSync(flush_interval=10)
+
+    async def main():
+        await sync.sync(1, first_name="Ann")  # first seen, written right away
+        await sync.sync(1, first_name="Ann")
+        await sync.sync(1, first_name="Anna")
+        await sync.close()
+
+    run(main())
+    assert collection.written == [[1]]
+
+
+def test_periodic_flush_survives_errors(run, monkeypatch):
+    collection = FakeCollection(failures=1)
+    _patch(monkeypatch, collection, add_users_failures=1)
+    sync = ProfileSync(flush_interval=0.01)
+
+    async def main():
+        for chat_id in (1, 2):
+            await sync.sync(chat_id, first_name="Ann")
+        for name in ("Anna", "Annie", "Anne", "Ana"):  # one change per flush
+            await sync.sync(1, first_name=name)
+            await sync.sync(2, first_name=name)
+            await asyncio.sleep(0.05)
+        assert not sync._task.done()
+        await sync.close()
+
+    run(main())
+    # the first flush fails in mongo, so the next change is written at once,
+    # the third fails in redis after the write, the fourth still runs
+    assert collection.written == [[1, 2], [1, 2]]
+
+
+def test_close_during_a_periodic_flush_keeps_the_changes(run, monkeypatch):
+    collection = FakeCollection(latency=0.05)
+    _patch(monkeypatch, collection)
+    sync = ProfileSync(flush_interval=0.01)
+
+    async def main():
+        await sync.sync(1, first_name="Ann")
+        await sync.sync(1, first_name="Anna")
+        task = sync._task
+        await asyncio.sleep(0.03)  # the periodic flush is inside bulk_write
+        collection.latency = 0
+        await sync.close()
+        return task
+
+    task = run(main())
+    assert task.cancelled()
+    assert collection.written == [[1]]
@@ -0,0 +1,62 @@
+import time
+import types
+
+import pytest
+
+from core.utils import rate_limit
+from core.utils.rate_limit import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit, "time", types.SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_burst_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_refills_with_rate_but_not_over_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.try_acquire()
+    clock.now += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 100
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_delay_until_tokens_are_available(clock):
+    bucket = TokenBucket(rate=4)
+    assert bucket.capacity == 4
+    assert bucket.delay() == 0
+    for _ in range(4):
+        bucket.try_acquire()
+    assert bucket.delay() == pytest.approx(0.25)
+    assert bucket.delay(2) == pytest.approx(0.5)
+    clock.now += 0.25
+    assert bucket.delay() == 0
+
+
+def test_acquire_waits(run):
+    bucket = TokenBucket(rate=50, capacity=1)
+
+    async def main():
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert run(main()) >= 0.035
@@ -0,0 +1,155 @@
+import asyncio
+import itertools
+
+import pytest
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.filters import FilterNotPassed, check_filters
+
+from core import handlers
+from core.reply_markups import callbacks
+from core.reply_markups.callbacks.language_choice import language_callback
+from core.utils.routing import IndexedHandler
+from core.utils.states import (
+    ChooseLanguageDialog,
+    ImportBackupDialog,
+    MailingEveryoneDialog,
+    OffCleaningReminderStates,
+    SetCleaningReminderStates,
+)
+
+CHAT_ID = 1000
+TEXTS = [
+    "/start",
+    "/START",
+    "/start@bot now",
+    "/on",
+    "/off",
+    "/cancel",
+    "/stats",
+    "/import",
+    "/unknown",
+    "/",
+    "cancel",
+    "CANCEL",
+    " cancel",
+    "hello",
+]
+CALLBACKS = [
+    callbacks.choose_campus_number.new(number=1),
+    callbacks.set_is_day_before.new(value="1"),
+    language_callback.new(user_locale="en"),
+    "timepicker:x:y:z:w",
+    "garbage",
+]
+STATES = [
+    None,
+    SetCleaningReminderStates.set_is_day_before.state,
+    SetCleaningReminderStates.enter_campus_number.state,
+    SetCleaningReminderStates.enter_time.state,
+    OffCleaningReminderStates.enter_is_day_before.state,
+    OffCleaningReminderStates.enter_campus_number.state,
+    MailingEveryoneDialog.enter_message.state,
+    ChooseLanguageDialog.enter_language_callback.state,
+    ImportBackupDialog.enter_file.state,
+    "Unknown:state",
+]
+
+_ids = itertools.count(1)
+
+
+def _message(**fields) -> types.Message:
+    user = {"id": CHAT_ID, "is_bot": False, "first_name": "Test"}
+    return types.Message(
+        message_id=next(_ids),
+        date=0,
+        chat={"id": CHAT_ID, "type": "private"},
+        **{"from": user},
+        **fields,
+    )
+
+
+def _updates():
+    for text in TEXTS:
+        entities = []
+        if text.startswith("/"):
+            entities.append({"type": "bot_command", "offset": 0, "length": len(text)})
+        yield _message(text=text, entities=entities)
+    yield _message(document={"file_id": "f", "file_unique_id": "u"}, caption="Cancel")
+    for data in CALLBACKS:
+        yield types.CallbackQuery(
+            id=str(next(_ids)),
+            chat_instance="1",
+            data=data,
+            message=_message(text=""),
+            **{"from": {"id": CHAT_ID, "is_bot": False, "first_name": "Test"}},
+        )
+
+
+async def _first_match(handler_objs, obj):
+    """
+    Runs in a task of its own, so the state cached by StateFilter is not reused
+    """
+    async for handler_obj in handler_objs:
+        try:
+            await check_filters(handler_obj.filters, (obj,))
+        except FilterNotPassed:
+            continue
+        return handler_obj.handler
+
+
+async def _scan(handler: IndexedHandler):
+    for handler_obj in handler.handlers:
+        yield handler_obj
+
+
+@pytest.fixture
+def dispatcher(monkeypatch):
+    monkeypatch.setattr(handlers.dp, "storage", MemoryStorage())
+    monkeypatch.setattr(
+        handlers.bot,
+        "_me",
+        types.User(id=1, is_bot=True, first_name="Bot", username="bot"),
+        raising=False,
+    )
+    Bot.set_current(handlers.bot)
+    Dispatcher.set_current(handlers.dp)
+    return handlers.dp
+
+
+@pytest.mark.parametrize("state", STATES)
+def test_index_picks_the_same_handler_as_the_scan(run, dispatcher, state):
+    indexed = {
+        "message": IndexedHandler.from_handler(dispatcher.message_handlers),
+        "callback": IndexedHandler.from_handler(dispatcher.callback_query_handlers),
+    }
+
+    async def main():
+        await dispatcher.storage.set_state(chat=CHAT_ID, user=CHAT_ID, state=state)
+        for obj in _updates():
+            types.User.set_current(obj.from_user)
+            handler = indexed[
+                "message" if isinstance(obj, types.Message) else "callback"
+            ]
+            scanned = await asyncio.ensure_future(_first_match(_scan(handler), obj))
+            routed = await asyncio.ensure_future(
+                _first_match(handler.candidates(obj), obj)
+            )
+            assert routed is scanned, obj.text or obj.caption or obj.data
+
+    run(main())
+
+
+def test_handler_registered_later_is_routed(run, dispatcher):
+    handler = IndexedHandler.from_handler(dispatcher.message_handlers)
+    obj = _message(text="hello")
+    assert run(_first_match(handler.candidates(obj), obj)) is None
+
+    async def hello(msg: types.Message):
+        pass
+
+    handler.register(hello, [lambda msg: msg.text == "hello"])
+    try:
+        assert run(_first_match(handler.candidates(obj), obj)) is hello
+    finally:
+        handler.unregister(hello)
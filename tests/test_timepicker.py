@@ -0,0 +1,49 @@
+import datetime
+
+from core.configs import consts
+from core.reply_markups.callbacks import timepicker as timepicker_callback
+from core.reply_markups.timepicker import get_timepicker_kb, handle_timepicker
+
+
+def _press(kb, action: str) -> dict:
+    for row in kb.inline_keyboard:
+        for button in row:
+            data = timepicker_callback.parse(button.callback_data)
+            if data["action"] == action:
+                return data
+    raise LookupError(action)
+
+
+def test_buttons_change_time():
+    kb = get_timepicker_kb(datetime.time(12, 0))
+    _, kb = handle_timepicker(_press(kb, "inc_hour"))
+    _, kb = handle_timepicker(_press(kb, "dec_minute"))
+    time, new_kb = handle_timepicker(_press(kb, "ok"))
+    assert time == datetime.time(12, 60 - consts.timepicker_minute_step)
+    assert new_kb is None
+
+
+def test_time_stays_in_range():
+    kb = get_timepicker_kb(consts.reminder_max_time)
+    assert handle_timepicker(_press(kb, "inc_hour")) == (None, None)
+    assert handle_timepicker(_press(kb, "noop")) == (None, None)
+
+
+def test_forged_time_is_clamped():
+    forged = {"action": "ok", "time": "1600", "min": "0", "max": "5000"}
+    assert handle_timepicker(forged) == (consts.reminder_max_time, None)
+    forged = {"action": "ok", "time": "-30", "min": "-100", "max": "0"}
+    assert handle_timepicker(forged) == (consts.reminder_min_time, None)
+
+
+def test_forged_range_is_ignored():
+    max_minutes = consts.reminder_max_time.hour * 60 + consts.reminder_max_time.minute
+    forged = {"action": "inc_hour", "time": "1380", "min": "0", "max": "5000"}
+    _, kb = handle_timepicker(forged)
+    data = _press(kb, "ok")
+    assert int(data["time"]) == int(data["max"]) == max_minutes
+
+
+def test_invalid_time_is_ignored():
+    assert handle_timepicker({"action": "ok", "time": "noon"}) == (None, None)
+    assert handle_timepicker({"action": "ok"}) == (None, None)
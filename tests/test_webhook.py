@@ -0,0 +1,87 @@
+import asyncio
+import socket
+
+import pytest
+from aiogram import types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.webhook import SendMessage, get_new_configured_app
+from aiohttp import web
+from loguru import logger
+
+from core import handlers
+from core.strings.scripts import responses
+from core.utils.fake_telegram import FakeTelegramServer
+
+CHAT_ID = 1000
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def _message(text: str) -> dict:
+    return {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": CHAT_ID, "type": "private"},
+        "from": {"id": CHAT_ID, "is_bot": False, "first_name": "Test"},
+        "text": text,
+        "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+    }
+
+
+@pytest.fixture
+def loop(monkeypatch):
+    """
+    The loop of the bot, the dispatcher schedules the webhook work on it
+    """
+    monkeypatch.setattr(handlers.dp, "storage", MemoryStorage())
+    monkeypatch.setattr(
+        handlers.bot,
+        "_me",
+        types.User(id=1, is_bot=True, first_name="Bot", username="bot"),
+        raising=False,
+    )
+    asyncio.set_event_loop(handlers.loop)
+    yield handlers.loop
+    asyncio.set_event_loop(None)
+
+
+def test_reply_goes_into_the_webhook_response(loop):
+    async def main():
+        runner = web.AppRunner(get_new_configured_app(handlers.dp, "/webhook"))
+        await runner.setup()
+        port = _free_port()
+        await web.TCPSite(runner, "localhost", port).start()
+        try:
+            return await FakeTelegramServer().post_update(
+                f"http://localhost:{port}/webhook", message=_message("/start")
+            )
+        finally:
+            await runner.cleanup()
+
+    reply = loop.run_until_complete(main())
+    assert reply["method"] == "sendMessage"
+    assert reply["chat_id"] == CHAT_ID
+    assert reply["text"] == responses.text("start_cmd_text")
+    assert reply["parse_mode"] == handlers.bot.parse_mode
+
+
+def test_failed_reply_is_logged_in_polling(loop, monkeypatch):
+    class FailingReply(SendMessage):
+        async def execute_response(self, bot):
+            raise ConnectionError("telegram is down")
+
+    async def process_updates(updates, fast=True):
+        return [[[FailingReply(CHAT_ID, "text")]] for _ in updates]
+
+    monkeypatch.setattr(handlers.dp, "process_updates", process_updates)
+    errors = []
+    sink = logger.add(errors.append, level="ERROR")
+    try:
+        loop.run_until_complete(handlers.dp._process_polling_updates([object()]))
+    finally:
+        logger.remove(sink)
+    assert len(errors) == 1 and "sendMessage" in errors[0]